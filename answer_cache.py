@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableBranch, RunnableGenerator, RunnableLambda, RunnablePassthrough
+
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "./answer_cache.db")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2000))
+
+
+def _merge_chunk(accumulated, chunk):
+    """
+    Folds a streamed dict chunk into the accumulated output, concatenating
+    string values (the streamed answer) and keeping the rest.
+    """
+    for key, value in chunk.items():
+        if key in accumulated and isinstance(value, str) and isinstance(accumulated[key], str):
+            accumulated[key] += value
+        else:
+            accumulated[key] = value
+    return accumulated
+
+
+class SemanticAnswerCache:
+    """
+    Persistent cache of answers keyed on the embedding of the standalone
+    (contextualized) question, the index name and the prompt version.
+
+    A lookup returns the stored answer when the cosine similarity to a cached
+    question reaches `threshold` and the entry is younger than `ttl` seconds.
+    Entries beyond `max_entries` are evicted least recently used first.
+    Ingestion calls `invalidate_answer_cache(index_name)` whenever it adds
+    documents, so answers never outlive the index contents they came from.
+    """
+
+    def __init__(self, embeddings, path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD,
+                 ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(path)
+        self._loaded = {}
+
+    def _entries(self, index_name, prompt_version):
+        """
+        Returns (generation, ids, matrix) for a key, reloading from SQLite only
+        when another writer (possibly another process) has bumped the generation.
+        """
+        generation = _generation(self._conn, index_name)
+        key = (index_name, prompt_version)
+        loaded = self._loaded.get(key)
+        if loaded and loaded[0] == generation:
+            return loaded
+        rows = self._conn.execute(
+            "SELECT id, embedding FROM answers WHERE index_name = ? AND prompt_version = ? AND created_at > ?",
+            (index_name, prompt_version, time.time() - self.ttl),
+        ).fetchall()
+        ids = [row_id for row_id, _ in rows]
+        matrix = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows]) if rows else None
+        loaded = (generation, ids, matrix)
+        self._loaded[key] = loaded
+        return loaded
+
+    def lookup(self, question, index_name, prompt_version):
+        """
+        Returns {"answer", "context"} for a cached near-identical question, or None.
+        """
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            _, ids, matrix = self._entries(index_name, prompt_version)
+            if matrix is None or matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            row = self._conn.execute(
+                "SELECT answer, sources FROM answers WHERE id = ? AND created_at > ?",
+                (ids[best], time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), ids[best]))
+            self._conn.commit()
+            self.hits += 1
+        answer, sources = row
+        print(f"Answer cache hit (similarity {scores[best]:.3f})")
+        return {
+            "answer": answer,
+            "context": [Document(page_content="", metadata={"source": source}) for source in json.loads(sources)],
+        }
+
+    def store(self, question, index_name, prompt_version, answer, context):
+        if not answer:
+            return
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        sources = sorted({document.metadata.get("source") for document in context or []} - {None})
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (index_name, prompt_version, question, embedding, answer, sources, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (index_name, prompt_version, question, vector.tobytes(), answer, json.dumps(sources), now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            _bump_generation(self._conn, index_name)
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def wrap(self, rag_chain, index_name, prompt_version):
+        """
+        Puts the cache in front of a chain whose input carries
+        "standalone_question". Hits return the cached answer and sources;
+        misses run the chain and store its output, passing streamed chunks
+        through unchanged.
+        """
+        def lookup(inputs):
+            return self.lookup(inputs["standalone_question"], index_name, prompt_version)
+
+        def store_through(chunks):
+            accumulated = {}
+            for chunk in chunks:
+                _merge_chunk(accumulated, chunk)
+                yield chunk
+            self.store(accumulated.get("standalone_question") or accumulated.get("input", ""),
+                       index_name, prompt_version, accumulated.get("answer"), accumulated.get("context"))
+
+        def from_cache(inputs):
+            return {**{key: value for key, value in inputs.items() if key != "cached"}, **inputs["cached"]}
+
+        return RunnablePassthrough.assign(cached=RunnableLambda(lookup).with_config(run_name="answer_cache_lookup")) | RunnableBranch(
+            (lambda inputs: inputs["cached"] is not None, RunnableLambda(from_cache)),
+            rag_chain | RunnableGenerator(store_through).with_config(run_name="answer_cache_store"),
+        )
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            index_name TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            question TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            answer TEXT NOT NULL,
+            sources TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS generations (index_name TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+    conn.commit()
+    return conn
+
+
+def _generation(conn, index_name):
+    row = conn.execute("SELECT generation FROM generations WHERE index_name = ?", (index_name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _bump_generation(conn, index_name):
+    conn.execute(
+        "INSERT INTO generations VALUES (?, 1) "
+        "ON CONFLICT(index_name) DO UPDATE SET generation = generation + 1",
+        (index_name,),
+    )
+
+
+def invalidate_answer_cache(index_name, path=ANSWER_CACHE_PATH):
+    """
+    Drops every cached answer for an index. Called by ingestion after it adds
+    documents; a no-op when the cache has never been used.
+    """
+    if not os.path.exists(path):
+        return
+    conn = _connect(path)
+    try:
+        deleted = conn.execute("DELETE FROM answers WHERE index_name = ?", (index_name,)).rowcount
+        _bump_generation(conn, index_name)
+        conn.commit()
+    finally:
+        conn.close()
+    if deleted:
+        print(f"Invalidated {deleted} cached answers for index '{index_name}'.")
@@ -0,0 +1,225 @@
+import csv
+import os
+import re
+import signal
+import subprocess
+import time
+from dataclasses import dataclass
+
+
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+# Whisper rejects uploads over 25 MB; leave room for container overhead.
+WHISPER_MAX_BYTES = 24 * 1024 * 1024
+DEFAULT_BIT_RATE = 128_000
+SILENCE_NOISE = os.getenv("SEGMENT_SILENCE_NOISE", "-30dB")
+SILENCE_MIN_SECONDS = float(os.getenv("SEGMENT_SILENCE_MIN_SECONDS", 0.5))
+# How far before a size-limited cut point we look for a silence to cut on.
+SILENCE_SEARCH_SECONDS = float(os.getenv("SEGMENT_SILENCE_SEARCH_SECONDS", 60))
+POLL_SECONDS = 0.2
+# ffmpeg is paused while this many of an episode's segments wait for transcription.
+SEGMENT_MAX_PENDING = int(os.getenv("SEGMENT_MAX_PENDING", 2))
+# Pausing relies on SIGSTOP/SIGCONT; elsewhere ffmpeg always runs to the end.
+CAN_PAUSE = hasattr(signal, "SIGSTOP")
+# Slivers left over at the end of a stream are dropped rather than transcribed.
+MIN_SEGMENT_SECONDS = 0.5
+
+DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+BITRATE_PATTERN = re.compile(r"bitrate: (\d+) kb/s")
+SILENCE_PATTERN = re.compile(r"silence_(start|end): (-?\d+(?:\.\d+)?)")
+
+
+@dataclass
+class AudioSegment:
+    index: int
+    path: str
+    start: float
+    end: float
+
+
+def probe_audio(source):
+    """
+    Returns (duration_seconds, bit_rate) for a local file or URL, read from
+    ffmpeg's stream header without decoding the audio.
+    """
+    result = subprocess.run([FFMPEG_BINARY, "-hide_banner", "-i", source],
+                            capture_output=True, text=True)
+    duration = bit_rate = None
+    match = DURATION_PATTERN.search(result.stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = BITRATE_PATTERN.search(result.stderr)
+    if match:
+        bit_rate = int(match.group(1)) * 1000
+    return duration, bit_rate
+
+
+def detect_silences(source, noise=SILENCE_NOISE, min_seconds=SILENCE_MIN_SECONDS, copy_to=None):
+    """
+    Returns the midpoints of silent stretches. This decodes the audio once
+    (nothing is encoded), so it is only run when silence cuts are requested.
+    With `copy_to`, the same pass also stream-copies the audio to that path,
+    so a remote source need not be downloaded again to be cut.
+    """
+    command = [FFMPEG_BINARY, "-hide_banner", "-nostats", "-y", "-i", source,
+               "-map", "0:a:0", "-af", f"silencedetect=noise={noise}:d={min_seconds}", "-f", "null", "-"]
+    if copy_to:
+        command += ["-map", "0:a:0", "-c", "copy", copy_to]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if copy_to and result.returncode != 0:
+        raise RuntimeError(f"ffmpeg silence detection failed for {source}: {result.stderr.strip()[-500:]}")
+    midpoints, start = [], None
+    for kind, value in SILENCE_PATTERN.findall(result.stderr):
+        if kind == "start":
+            start = max(float(value), 0.0)
+        elif start is not None:
+            midpoints.append((start + float(value)) / 2)
+            start = None
+    return midpoints
+
+
+def plan_cut_points(duration, segment_seconds, silences=None, search_seconds=SILENCE_SEARCH_SECONDS):
+    """
+    Returns cut times no more than `segment_seconds` apart. With silences,
+    each cut moves back to the latest silence within `search_seconds` of the
+    size-limited cut, so segments never grow past the limit.
+    """
+    cuts, position = [], 0.0
+    silences = sorted(silences or [])
+    while duration - position > segment_seconds:
+        target = position + segment_seconds
+        candidates = [s for s in silences if target - search_seconds <= s <= target and s > position]
+        position = candidates[-1] if candidates else target
+        cuts.append(round(position, 3))
+    return cuts
+
+
+class AudioSegmenter:
+    """
+    Cuts audio into Whisper-sized segments with ffmpeg's segment muxer.
+
+    The source (a local path or URL) is read once and segments are written
+    by stream copy (`-c copy`), so nothing is decoded or re-encoded. Segments
+    are sized from the stream bit rate to stay under the Whisper upload limit
+    and capped at `max_segment_seconds`. `segments()` yields each segment as
+    soon as ffmpeg closes it, so transcription can start while later
+    segments are still being cut.
+
+    When `segments()` is given a `pending` callable, ffmpeg is paused while
+    the caller has `max_pending` segments waiting, and whenever the caller
+    holds control (for instance while it blocks on a full transcription
+    queue). The segments on disk then stay around `max_pending` + 1 however
+    long the episode is.
+
+    With `split_on_silence`, the audio is decoded once first to find
+    silences. A remote source is copied into `output_dir` during that pass
+    and cut from the copy, so it is downloaded once; the copy (about the
+    size of the episode) is removed once cutting is done.
+    """
+
+    def __init__(self, max_bytes=WHISPER_MAX_BYTES, max_segment_seconds=1200, split_on_silence=False,
+                 max_pending=SEGMENT_MAX_PENDING):
+        self.max_bytes = max_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.split_on_silence = split_on_silence
+        self.max_pending = max_pending
+
+    def segment_seconds(self, bit_rate):
+        seconds = self.max_bytes * 8 / (bit_rate or DEFAULT_BIT_RATE)
+        return min(seconds, self.max_segment_seconds) if self.max_segment_seconds else seconds
+
+    def _command(self, source, output_dir, extension, segment_seconds, cut_points):
+        command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", source,
+                   "-map", "0:a:0", "-vn", "-c", "copy", "-f", "segment", "-reset_timestamps", "1",
+                   "-segment_list", os.path.join(output_dir, "segments.csv"), "-segment_list_type", "csv"]
+        if cut_points is not None:
+            if cut_points:
+                command += ["-segment_times", ",".join(str(cut) for cut in cut_points)]
+            else:
+                command += ["-segment_time", str(10 ** 9)]
+        else:
+            command += ["-segment_time", f"{segment_seconds:.3f}"]
+        return command + [os.path.join(output_dir, f"chunk_%03d.{extension}")]
+
+    def segments(self, source, output_dir, pending=None):
+        """
+        Yields AudioSegment objects in audio order as ffmpeg finishes them.
+        `pending()` returns how many yielded segments are not done with yet.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        list_path = os.path.join(output_dir, "segments.csv")
+        if os.path.exists(list_path):
+            os.remove(list_path)
+        extension = os.path.splitext(source.split("?")[0])[1].lstrip(".") or "mp3"
+
+        duration, bit_rate = probe_audio(source)
+        segment_seconds = self.segment_seconds(bit_rate)
+        cut_points = local_copy = None
+        if self.split_on_silence and duration:
+            if "://" in source:
+                local_copy = os.path.join(output_dir, f"source.{extension}")
+            cut_points = plan_cut_points(duration, segment_seconds, detect_silences(source, copy_to=local_copy))
+
+        process = subprocess.Popen(self._command(local_copy or source, output_dir, extension, segment_seconds,
+                                                 cut_points),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        yielded, paused = 0, False
+        try:
+            while True:
+                finished = process.poll() is not None
+                for segment in self._read_list(list_path, output_dir)[yielded:]:
+                    yielded += 1
+                    if segment.end - segment.start < MIN_SEGMENT_SECONDS:
+                        os.remove(segment.path)
+                        continue
+                    paused = self._throttle(process, pending, paused, hold=True)
+                    yield segment
+                if finished:
+                    break
+                paused = self._throttle(process, pending, paused)
+                time.sleep(POLL_SECONDS)
+        finally:
+            if process.poll() is None:
+                process.kill()
+            stderr = process.stderr.read()
+            process.wait()
+            if local_copy and os.path.exists(local_copy):
+                os.remove(local_copy)
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg segmenting failed for {source}: {stderr.strip()}")
+
+    def _throttle(self, process, pending, paused, hold=False):
+        """
+        Pauses or resumes ffmpeg and returns whether it is now paused.
+        """
+        if pending is None or not self.max_pending or not CAN_PAUSE or process.poll() is not None:
+            return False
+        hold = hold or pending() >= self.max_pending
+        if hold != paused:
+            process.send_signal(signal.SIGSTOP if hold else signal.SIGCONT)
+        return hold
+
+    @staticmethod
+    def _read_list(list_path, output_dir):
+        # ffmpeg appends a row only after the segment file is closed
+        if not os.path.exists(list_path):
+            return []
+        with open(list_path, newline="") as fh:
+            rows = [row for row in csv.reader(fh) if len(row) == 3]
+        return [AudioSegment(index, os.path.join(output_dir, name), float(start), float(end))
+                for index, (name, start, end) in enumerate(rows)]
+
+
+def make_test_audio(path, seconds=30, tone_seconds=4, silence_seconds=1, bit_rate="64k"):
+    """
+    Writes an MP3 fixture of alternating tone and silence, for exercising
+    segmentation locally without network access.
+    """
+    period = tone_seconds + silence_seconds
+    expression = f"if(lt(mod(t\\,{period})\\,{tone_seconds})\\,sin(2*PI*440*t)\\,0)"
+    subprocess.run(
+        [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi",
+         "-i", f"aevalsrc={expression}:s=16000:d={seconds}", "-c:a", "libmp3lame", "-b:a", bit_rate, path],
+        check=True,
+    )
+    return path
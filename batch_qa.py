@@ -0,0 +1,217 @@
+"""
+Answers a file of questions against an index, e.g. the topics of a textbook
+outline, without going through the chat UI one question at a time.
+
+    python batch_qa.py questions.txt --output answers.jsonl --index test
+
+Questions are read one per line (blank lines and lines starting with # are
+skipped), or from a .jsonl file of {"question": ..., "id": ...} objects.
+Each answer is appended to the output as one JSON line as soon as it is
+generated. The output doubles as the checkpoint: a rerun skips questions
+already answered there and retries the ones that failed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+import openai_scheduler
+import telemetry
+from chain_setup import get_chat_llm, qa_prompt
+from context_packing import ContextPacker
+from hybrid_retrieval import DENSE_ONLY_K, HybridRetriever, build_retriever
+
+
+BATCH_RETRIEVAL_WORKERS = int(os.getenv("BATCH_RETRIEVAL_WORKERS", 8))
+BATCH_GENERATION_WORKERS = int(os.getenv("BATCH_GENERATION_WORKERS", 4))
+
+
+def question_id(question):
+    return hashlib.sha256(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def load_questions(path):
+    """
+    Returns [(id, question), ...] in file order, without repeated IDs.
+    """
+    questions = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                text = item["question"].strip()
+                questions.setdefault(str(item.get("id") or question_id(text)), text)
+            else:
+                questions.setdefault(question_id(line), line)
+    return list(questions.items())
+
+
+def answered_ids(output_path):
+    """
+    IDs of questions answered without error in an earlier run's output.
+    """
+    answered = set()
+    if not os.path.exists(output_path):
+        return answered
+    with open(output_path, encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the previous run was interrupted
+            if not record.get("error"):
+                answered.add(record["id"])
+    return answered
+
+
+def _ends_mid_line(path):
+    # True when a previous run stopped in the middle of writing a record
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return False
+    with open(path, "rb") as fh:
+        fh.seek(-1, os.SEEK_END)
+        return fh.read(1) != b"\n"
+
+
+def _chunk_key(document):
+    return document.id or (document.metadata.get("source"), document.page_content)
+
+
+class BatchAnswerer:
+    """
+    Answers many standalone questions over one DocumentProcessor's index.
+
+    All question embeddings are requested in one call, retrievals run in a
+    thread pool with the precomputed embeddings, and generations run in a
+    separate, smaller pool, so retrieval for later questions overlaps with
+    generation for earlier ones. A chunk retrieved by several questions is
+    kept once for the batch and its tokens are counted once. `stats()`
+    reports how many retrieved chunks were shared.
+    """
+
+    def __init__(self, processor, llm=None, retrieval_workers=BATCH_RETRIEVAL_WORKERS,
+                 generation_workers=BATCH_GENERATION_WORKERS):
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+
+        self.processor = processor
+        self.retriever = build_retriever(processor)
+        self.answer_chain = create_stuff_documents_chain(llm or get_chat_llm(), qa_prompt)
+        self.retrieval_workers = retrieval_workers
+        self.generation_workers = generation_workers
+        self.context_packer = ContextPacker()
+        self.context_packer.count_tokens = lru_cache(maxsize=None)(self.context_packer.count_tokens)
+        self.chunks = {}
+        self.retrieved = 0
+        self._lock = threading.Lock()
+        self._pack_lock = threading.Lock()
+
+    def _retrieve(self, question, embedding):
+        with telemetry.span("batch.retrieve") as span, openai_scheduler.priority(openai_scheduler.BACKGROUND):
+            if isinstance(self.retriever, HybridRetriever):
+                documents = self.retriever.search(question, embedding)
+            else:
+                documents = self.processor.vector_store.similarity_search_by_vector(embedding, k=DENSE_ONLY_K)
+            span.set(documents=len(documents))
+        with self._lock:
+            self.retrieved += len(documents)
+            documents = [self.chunks.setdefault(_chunk_key(document), document) for document in documents]
+        with self._pack_lock:
+            return self.context_packer.pack(documents)
+
+    def _generate(self, question, context):
+        # Background, so chat turns served at the same time go first
+        with telemetry.span("batch.generate"), openai_scheduler.priority(openai_scheduler.BACKGROUND):
+            return self.answer_chain.invoke({"input": question, "chat_history": [], "context": context})
+
+    def run(self, questions_path, output_path):
+        """
+        Answers the questions not yet answered in `output_path` and appends
+        their results to it. Returns counts for the run.
+        """
+        started = time.perf_counter()
+        questions = load_questions(questions_path)
+        answered = answered_ids(output_path)
+        pending = [(qid, question) for qid, question in questions if qid not in answered]
+        print(f"{len(pending)} of {len(questions)} questions to answer ({len(questions) - len(pending)} already done)")
+        summary = {"questions": len(questions), "skipped": len(questions) - len(pending), "answered": 0, "failed": 0}
+        if not pending:
+            return summary
+
+        with telemetry.span("batch.embed", questions=len(pending)), \
+                openai_scheduler.priority(openai_scheduler.BACKGROUND):
+            embeddings = self.processor.embeddings.embed_documents([question for _, question in pending])
+
+        cut_short = _ends_mid_line(output_path)
+        with open(output_path, "a", encoding="utf-8") as out:
+            if cut_short:
+                out.write("\n")
+            write_lock = threading.Lock()
+
+            def write(record):
+                with write_lock:
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    summary["failed" if record.get("error") else "answered"] += 1
+
+            def on_generated(future, qid, question, question_started, sources):
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    print(f"Error answering {qid}: {e}")
+                    write({"id": qid, "question": question, "error": str(e)})
+                    return
+                write({"id": qid, "question": question, "answer": answer, "sources": sources,
+                       "seconds": round(time.perf_counter() - question_started, 3)})
+
+            with ThreadPoolExecutor(self.retrieval_workers, thread_name_prefix="batch-retrieve") as retrieval_pool, \
+                    ThreadPoolExecutor(self.generation_workers, thread_name_prefix="batch-generate") as generation_pool:
+                retrievals = {
+                    retrieval_pool.submit(self._retrieve, question, embedding): (qid, question, time.perf_counter())
+                    for (qid, question), embedding in zip(pending, embeddings)
+                }
+                for future in as_completed(retrievals):
+                    qid, question, question_started = retrievals[future]
+                    try:
+                        context = future.result()
+                    except Exception as e:
+                        print(f"Error retrieving for {qid}: {e}")
+                        write({"id": qid, "question": question, "error": str(e)})
+                        continue
+                    sources = list(set([document.metadata['source'] for document in context]))
+                    generation_pool.submit(self._generate, question, context).add_done_callback(
+                        lambda f, qid=qid, question=question, s=question_started, sources=sources:
+                        on_generated(f, qid, question, s, sources))
+
+        summary.update(self.stats(), wall_seconds=round(time.perf_counter() - started, 3))
+        print(f"Batch finished: {summary}")
+        return summary
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks_retrieved": self.retrieved,
+                "unique_chunks": len(self.chunks),
+                "shared_chunks": self.retrieved - len(self.chunks),
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of questions against an index.")
+    parser.add_argument("questions", help="Text file with one question per line, or a .jsonl file.")
+    parser.add_argument("--output", default="answers.jsonl", help="JSONL output, also used to resume.")
+    parser.add_argument("--index", default="test")
+    parser.add_argument("--retrieval-workers", type=int, default=BATCH_RETRIEVAL_WORKERS)
+    parser.add_argument("--generation-workers", type=int, default=BATCH_GENERATION_WORKERS)
+    args = parser.parse_args()
+
+    from data_ingestion import DocumentProcessor
+    answerer = BatchAnswerer(DocumentProcessor(index_name=args.index), retrieval_workers=args.retrieval_workers,
+                             generation_workers=args.generation_workers)
+    answerer.run(args.questions, args.output)
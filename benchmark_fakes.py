@@ -0,0 +1,356 @@
+"""
+Deterministic local stand-ins for OpenAI, Pinecone, Google Drive, the RSS
+feed and Whisper, each with configurable simulated latency. Used by
+benchmark_suite.py to measure ingestion and chat without network access.
+"""
+import asyncio
+import hashlib
+import http.server
+import io
+import os
+import random
+import threading
+import time
+import zipfile
+from types import SimpleNamespace
+from xml.sax.saxutils import escape
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from drive_crawler import DriveCrawler
+
+
+DEFAULT_LATENCY = {
+    "embed_request": 0.05,      # seconds per embedding request
+    "embed_per_text": 0.0002,   # plus this per input text
+    "chat_first_token": 0.3,
+    "chat_per_token": 0.005,
+    "index_request": 0.01,      # upsert, query, fetch, delete
+    "drive_request": 0.03,      # listing pages and downloads
+    "whisper_request": 0.2,
+    "whisper_per_minute": 0.02,  # per minute of audio
+}
+
+
+def _seed(text):
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Unit vectors seeded from each text's hash, so equal texts always embed
+    identically. One `embed_documents` call is one simulated request.
+    """
+
+    def __init__(self, dimensions=1536, latency=None):
+        self.model = "fake-embedding"
+        self.dimensions = dimensions
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.requests = 0
+
+    def _vector(self, text):
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        time.sleep(self.latency["embed_request"] + self.latency["embed_per_text"] * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with `answer_tokens` words derived from the
+    prompt, after `first_token` seconds and `per_token` seconds per word.
+    The async paths sleep on the event loop instead of a thread.
+    """
+
+    answer_tokens: int = 60
+    first_token: float = DEFAULT_LATENCY["chat_first_token"]
+    per_token: float = DEFAULT_LATENCY["chat_per_token"]
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _words(self, messages):
+        rng = random.Random(_seed("".join(str(message.content) for message in messages)))
+        return [f"word{rng.randrange(1000)}" for _ in range(self.answer_tokens)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._words(messages)
+        time.sleep(self.first_token + self.per_token * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.first_token)
+        for i, word in enumerate(self._words(messages)):
+            if i:
+                time.sleep(self.per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        words = self._words(messages)
+        await asyncio.sleep(self.first_token + self.per_token * len(words))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(words)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token)
+        for i, word in enumerate(self._words(messages)):
+            if i:
+                await asyncio.sleep(self.per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else " " + word))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class SlowIndex:
+    """
+    Wraps a Pinecone-like index (e.g. vector_backends.LocalIndex) and adds a
+    fixed delay to every request.
+    """
+
+    def __init__(self, index, latency=None):
+        self.index = index
+        self.delay = {**DEFAULT_LATENCY, **(latency or {})}["index_request"]
+
+    def _call(self, name, *args, **kwargs):
+        time.sleep(self.delay)
+        return getattr(self.index, name)(*args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        return self._call("upsert", *args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        return self._call("query", *args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        return self._call("fetch", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call("delete", *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+def corpus_text(seed, paragraphs=12, words_per_paragraph=120, boilerplate=True):
+    """
+    Deterministic pseudo-text. Documents share a boilerplate paragraph, the
+    way books share front matter and episodes share intros.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(4000)]
+    body = [" ".join(rng.choice(vocabulary) for _ in range(words_per_paragraph)) + "."
+            for _ in range(paragraphs)]
+    if boilerplate:
+        body.insert(0, "All rights reserved. No part of this publication may be reproduced, stored or "
+                       "transmitted in any form without the prior written permission of the publisher. " * 3)
+    return body
+
+
+def make_docx_bytes(paragraphs):
+    """
+    Builds a minimal DOCX (just word/document.xml), enough for docx2txt.
+    """
+    body = "".join(f"<w:p><w:r><w:t>{escape(paragraph)}</w:t></w:r></w:p>" for paragraph in paragraphs)
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{body}</w:body></w:document>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml",
+                         '<?xml version="1.0" encoding="UTF-8"?>'
+                         '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                         '<Override PartName="/word/document.xml" ContentType="application/'
+                         'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>')
+        archive.writestr("word/document.xml", document)
+    return buffer.getvalue()
+
+
+def write_docx_corpus(directory, count, paragraphs=12):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"doc_{i:05d}.docx")
+        with open(path, "wb") as fh:
+            fh.write(make_docx_bytes(corpus_text(i, paragraphs)))
+        paths.append(path)
+    return paths
+
+
+class FakeDriveService:
+    """
+    The slice of the Drive v3 API DriveCrawler lists with: files().list(...)
+    .execute(), paginated with pageToken. `folders` maps a folder ID to its
+    items.
+    """
+
+    def __init__(self, folders, latency=None):
+        self.folders = folders
+        self.delay = {**DEFAULT_LATENCY, **(latency or {})}["drive_request"]
+
+    def files(self):
+        return self
+
+    def list(self, q, pageSize, pageToken=None, **kwargs):
+        folder_id = q.split("'")[1]
+        start = int(pageToken or 0)
+        items = self.folders.get(folder_id, [])
+        page = {"files": items[start:start + pageSize]}
+        if start + pageSize < len(items):
+            page["nextPageToken"] = str(start + pageSize)
+
+        def execute():
+            time.sleep(self.delay)
+            return page
+        return SimpleNamespace(execute=execute)
+
+
+class FakeDriveCrawler(DriveCrawler):
+    """
+    DriveCrawler over a FakeDriveService, with downloads served from memory.
+    """
+
+    def __init__(self, folders, contents, latency=None, **kwargs):
+        super().__init__(lambda: FakeDriveService(folders, latency), **kwargs)
+        self.contents = contents
+        self.delay = {**DEFAULT_LATENCY, **(latency or {})}["drive_request"]
+
+    def download_to_buffer(self, file):
+        time.sleep(self.delay)
+        return io.BytesIO(self.contents[file["id"]])
+
+
+def make_drive_tree(count, files_per_folder=50, paragraphs=12):
+    """
+    Returns (folders, contents) for `count` DOCX files spread over nested
+    folders under the root folder "root".
+    """
+    folders, contents = {"root": []}, {}
+    for i in range(count):
+        folder_id = f"folder_{i // files_per_folder}"
+        if folder_id not in folders:
+            folders[folder_id] = []
+            folders["root"].append({"id": folder_id, "name": folder_id,
+                                    "mimeType": "application/vnd.google-apps.folder"})
+        data = make_docx_bytes(corpus_text(i, paragraphs))
+        file_id = f"file_{i:05d}"
+        contents[file_id] = data
+        folders[folder_id].append({
+            "id": file_id, "name": f"drive_doc_{i:05d}.docx", "mimeType": "application/octet-stream",
+            "md5Checksum": hashlib.md5(data).hexdigest(), "modifiedTime": "2024-01-01T00:00:00Z",
+            "size": str(len(data)),
+        })
+    return folders, contents
+
+
+class FakeWhisperClient:
+    """
+    Stands in for `OpenAI().audio.transcriptions`. Returns verbose_json-like
+    results with one timed segment per 30 seconds of audio, estimating the
+    duration from the file size at `bit_rate`.
+    """
+
+    def __init__(self, latency=None, bit_rate=64_000):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.bit_rate = bit_rate
+        self.requests = 0
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self.create))
+        self._lock = threading.Lock()
+
+    def create(self, file, model, **kwargs):
+        data = file.read()
+        duration = len(data) * 8 / self.bit_rate
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency["whisper_request"] + self.latency["whisper_per_minute"] * duration / 60)
+        rng = random.Random(_seed(hashlib.sha256(data).hexdigest()))
+        segments = []
+        for start in range(0, max(int(duration), 1), 30):
+            text = " " + " ".join(f"spoken{rng.randrange(3000)}" for _ in range(70)) + "."
+            segments.append(SimpleNamespace(start=float(start), end=float(min(start + 30, duration)), text=text))
+        return SimpleNamespace(text="".join(s.text for s in segments), segments=segments, duration=duration)
+
+
+class FeedServer:
+    """
+    Local HTTP stand-in for a podcast host: serves an RSS feed (answering
+    If-None-Match with 304) and the episode files listed in it, at most
+    `bytes_per_second` fast when given.
+    """
+
+    def __init__(self, episode_paths, bytes_per_second=None):
+        self.episode_paths = list(episode_paths)
+        self.bytes_per_second = bytes_per_second
+        self.requests = 0
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                if self.path == "/feed.xml":
+                    body, content_type = server.feed(), "application/rss+xml"
+                    if self.headers.get("If-None-Match") == server.etag():
+                        self.send_response(304)
+                        self.end_headers()
+                        return
+                else:
+                    name = os.path.basename(self.path)
+                    matches = [p for p in server.episode_paths if os.path.basename(p) == name]
+                    if not matches:
+                        self.send_error(404)
+                        return
+                    with open(matches[0], "rb") as fh:
+                        body, content_type = fh.read(), "audio/mpeg"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", server.etag())
+                self.end_headers()
+                step = max(1, server.bytes_per_second // 50) if server.bytes_per_second else max(1, len(body))
+                try:
+                    for start in range(0, len(body), step):
+                        self.wfile.write(body[start:start + step])
+                        if server.bytes_per_second:
+                            time.sleep(step / server.bytes_per_second)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # ffmpeg stops reading once it has probed the header
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def etag(self):
+        return f'"{len(self.episode_paths)}"'
+
+    def feed(self):
+        items = "".join(
+            f"<item><title>Episode {i}</title><guid isPermaLink=\"false\">episode-{i}</guid>"
+            f"<pubDate>Mon, 01 Jan 2024 00:{i % 60:02d}:00 GMT</pubDate>"
+            f"<enclosure url=\"{self.url}/{os.path.basename(path)}\" type=\"audio/mpeg\"/></item>"
+            for i, path in enumerate(self.episode_paths)
+        )
+        return (f"<?xml version=\"1.0\"?><rss version=\"2.0\"><channel><title>Benchmark</title>"
+                f"{items}</channel></rss>").encode("utf-8")
+
+    @property
+    def feed_url(self):
+        return f"{self.url}/feed.xml"
+
+    def close(self):
+        self.httpd.shutdown()
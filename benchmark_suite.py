@@ -0,0 +1,398 @@
+"""
+Offline benchmarks for ingestion throughput and chat latency.
+
+Every scenario runs in a fresh interpreter, in its own temporary working
+directory (so ledgers, caches and the local index start empty), against the
+fakes in benchmark_fakes.py. Reports throughput, p50/p95 latency and peak
+RSS, and can save the results as a baseline and compare later runs with it.
+
+    python benchmark_suite.py                              # all scenarios
+    python benchmark_suite.py ingest_local --sizes 50,200  # one scenario
+    python benchmark_suite.py --save                       # save baseline
+    python benchmark_suite.py --compare                    # fail on regressions
+    python benchmark_suite.py --latency chat_first_token=0.5
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+BASELINE_PATH = "./benchmark_baseline.json"
+SCENARIO_SIZES = {
+    "ingest_local": [10, 50, 200],    # documents
+    "ingest_drive": [10, 50, 200],    # documents
+    "ingest_podcast": [2, 4],         # episodes
+    "chat_single": [20],              # turns in one session
+    "chat_multi": [4, 16],            # concurrent sessions, 5 turns each
+    "chat_server": [16, 64],          # concurrent HTTP sessions, 5 turns each
+    "batch_qa": [20, 60],             # questions in one batch
+}
+CHAT_CORPUS_SIZE = 50
+TURNS_PER_SESSION = 5
+EPISODE_SECONDS = 600
+FOLLOW_UPS = ["Why is that?", "Can you give an example of it?", "How does this compare with the previous one?"]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def summarize(items, wall_seconds, latencies, **extra):
+    return {
+        "items": items,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput": round(items / wall_seconds, 3) if wall_seconds else 0.0,
+        "p50_seconds": round(percentile(latencies, 0.5) or 0.0, 4),
+        "p95_seconds": round(percentile(latencies, 0.95) or 0.0, 4),
+        **extra,
+    }
+
+
+def make_processor(latency, **kwargs):
+    from benchmark_fakes import FakeEmbeddings, FakeWhisperClient, SlowIndex
+    from data_ingestion import DocumentProcessor
+    from vector_backends import LocalVectorStore
+
+    class BenchmarkProcessor(DocumentProcessor):
+        def load_vector_store(self):
+            super().load_vector_store()
+            self.index = SlowIndex(self.index, latency)
+            self.vector_store = LocalVectorStore(self.index, self.embeddings)
+            return self.vector_store
+
+        def finalize_source(self, source_id, ids, content_hash):
+            super().finalize_source(source_id, ids, content_hash)
+            self.completed.append(time.perf_counter())
+
+    fake_embeddings = FakeEmbeddings(latency=latency)
+    processor = BenchmarkProcessor(
+        index_name="benchmark", backend="local", embeddings=fake_embeddings,
+        openai_client=kwargs.pop("openai_client", None) or FakeWhisperClient(latency), **kwargs)
+    processor.completed = []
+    processor.fake_embeddings = fake_embeddings
+    return processor
+
+
+def _ingestion_result(processor, items, started):
+    wall = time.perf_counter() - started
+    return summarize(
+        items, wall, [done - started for done in processor.completed],
+        vectors=processor.index.describe_index_stats()["total_vector_count"],
+        embedding_requests=processor.fake_embeddings.requests,
+    )
+
+
+def run_ingest_local(size, latency):
+    from benchmark_fakes import write_docx_corpus
+
+    write_docx_corpus("./data", size)
+    processor = make_processor(latency, directory_path="./data")
+    started = time.perf_counter()
+    processor.process_and_add_documents_from_local()
+    return _ingestion_result(processor, size, started)
+
+
+def run_ingest_drive(size, latency):
+    from benchmark_fakes import FakeDriveCrawler, make_drive_tree
+
+    folders, contents = make_drive_tree(size)
+    processor = make_processor(latency)
+    started = time.perf_counter()
+    processor.process_and_add_documents_from_drive("root", crawler=FakeDriveCrawler(folders, contents, latency))
+    return _ingestion_result(processor, size, started)
+
+
+def run_ingest_podcast(size, latency):
+    from audio_segmenter import FFMPEG_BINARY, make_test_audio
+    from benchmark_fakes import FakeWhisperClient, FeedServer
+
+    if shutil.which(FFMPEG_BINARY) is None:
+        return {"skipped": f"{FFMPEG_BINARY} not found"}
+    os.makedirs("./audio", exist_ok=True)
+    # Lengths differ by a second so every episode has distinct audio
+    episodes = [make_test_audio(f"./audio/episode_{i:03d}.mp3", seconds=EPISODE_SECONDS + i) for i in range(size)]
+    server = FeedServer(episodes)
+    whisper = FakeWhisperClient(latency)
+    try:
+        processor = make_processor(latency, rss_url=server.feed_url, openai_client=whisper)
+        started = time.perf_counter()
+        processor.process_and_add_new_podcasts(latest_n=size)
+        result = _ingestion_result(processor, size, started)
+    finally:
+        server.close()
+    result["whisper_requests"] = whisper.requests
+    return result
+
+
+def _chat_processor(latency):
+    from benchmark_fakes import DEFAULT_LATENCY, FakeChatModel, write_docx_corpus
+
+    latency = {**DEFAULT_LATENCY, **latency}
+    write_docx_corpus("./data", CHAT_CORPUS_SIZE)
+    processor = make_processor(latency, directory_path="./data")
+    processor.process_and_add_documents_from_local()
+    llm = FakeChatModel(first_token=latency["chat_first_token"], per_token=latency["chat_per_token"])
+    return processor, llm, latency
+
+
+def _chat_setup(latency):
+    from benchmark_fakes import FakeChatModel
+    from chain_setup import build_conversational_rag_chain, contextualize_q_prompt
+    from question_rewriter import QuestionContextualizer
+
+    processor, llm, latency = _chat_processor(latency)
+    rewriter = FakeChatModel(answer_tokens=15, first_token=latency["chat_first_token"] / 2,
+                             per_token=latency["chat_per_token"])
+    return build_conversational_rag_chain(
+        processor, llm=llm, contextualizer=QuestionContextualizer(rewriter, contextualize_q_prompt))
+
+
+def _question(turn):
+    if turn % 2 == 0:
+        return f"What does the corpus say about term{(turn * 37) % 4000} and term{(turn * 91) % 4000} in practice?"
+    return FOLLOW_UPS[turn // 2 % len(FOLLOW_UPS)]
+
+
+def _chat_session(chain, session_id, turns):
+    from chain_setup import stream_rag_response
+
+    return [stream_rag_response(chain, _question(turn), session_id) for turn in range(turns)]
+
+
+def _chat_result(timings, started):
+    return summarize(
+        len(timings), time.perf_counter() - started, [t["total_seconds"] for t in timings],
+        ttft_p50_seconds=round(percentile([t["time_to_first_token"] or 0.0 for t in timings], 0.5), 4),
+        ttft_p95_seconds=round(percentile([t["time_to_first_token"] or 0.0 for t in timings], 0.95), 4),
+    )
+
+
+def run_chat_single(size, latency):
+    chain = _chat_setup(latency)
+    started = time.perf_counter()
+    return _chat_result(_chat_session(chain, "session-0", size), started)
+
+
+def run_chat_multi(size, latency):
+    chain = _chat_setup(latency)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(size) as pool:
+        sessions = list(pool.map(lambda i: _chat_session(chain, f"session-{i}", TURNS_PER_SESSION), range(size)))
+    return _chat_result([timing for session in sessions for timing in session], started)
+
+
+async def _http_turn(port, question, session_id, disconnect_after_first_token=False):
+    """
+    One streamed chat turn against rag_server over a raw connection. Returns
+    its timings, or None when the server answered with an error status.
+    """
+    import asyncio
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps({"input": question, "session_id": session_id}).encode("utf-8")
+    started = time.perf_counter()
+    writer.write(f"POST /chat HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    time_to_first_token = None
+    try:
+        status = int((await reader.readline()).split()[1])
+        if status != 200:
+            return None
+        async for line in reader:
+            if line.startswith(b"event: token") and time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - started
+                if disconnect_after_first_token:
+                    return None
+    finally:
+        writer.close()
+    return {"time_to_first_token": time_to_first_token, "total_seconds": time.perf_counter() - started}
+
+
+def run_chat_server(size, latency):
+    import asyncio
+    from rag_server import RagServer
+
+    chain = _chat_setup(latency)
+
+    async def session(port, session_id):
+        return [await _http_turn(port, _question(turn), session_id) for turn in range(TURNS_PER_SESSION)]
+
+    async def load():
+        server = RagServer(chain_for_index=lambda index_name: chain)
+        await server.start("127.0.0.1", 0)
+        started = time.perf_counter()
+        # One extra client leaves after its first token; its turn must be cancelled
+        sessions = await asyncio.gather(
+            *(session(server.port, f"session-{i}") for i in range(size)),
+            _http_turn(server.port, _question(0), "session-disconnect", disconnect_after_first_token=True),
+        )
+        await asyncio.sleep(0.1)
+        server.server.close()
+        return sessions[:-1], started, server.health()
+
+    sessions, started, health = asyncio.run(load())
+    timings = [timing for turns in sessions for timing in turns if timing]
+    result = _chat_result(timings, started)
+    result.update(rejected=health["rejected"], cancelled=health["cancelled"])
+    return result
+
+
+def run_batch_qa(size, latency):
+    from batch_qa import BatchAnswerer
+
+    processor, llm, _ = _chat_processor(latency)
+    with open("questions.txt", "w") as fh:
+        fh.write("\n".join(_question(2 * i) for i in range(size)))
+    embedding_requests = processor.fake_embeddings.requests
+    started = time.perf_counter()
+    summary = BatchAnswerer(processor, llm=llm).run("questions.txt", "answers.jsonl")
+    wall = time.perf_counter() - started
+    with open("answers.jsonl") as fh:
+        latencies = [json.loads(line)["seconds"] for line in fh]
+    return summarize(size, wall, latencies, failed=summary["failed"], shared_chunks=summary["shared_chunks"],
+                     embedding_requests=processor.fake_embeddings.requests - embedding_requests)
+
+
+SCENARIOS = {
+    "ingest_local": run_ingest_local,
+    "ingest_drive": run_ingest_drive,
+    "ingest_podcast": run_ingest_podcast,
+    "chat_single": run_chat_single,
+    "chat_multi": run_chat_multi,
+    "chat_server": run_chat_server,
+    "batch_qa": run_batch_qa,
+}
+
+
+def run_child(scenario, size, latency, output):
+    """
+    Runs one scenario in this (fresh) interpreter inside a scratch directory
+    and writes its result to `output`.
+    """
+    repo = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, repo)
+    scratch = tempfile.mkdtemp(prefix=f"bench_{scenario}_")
+    os.chdir(scratch)
+    try:
+        result = SCENARIOS[scenario](size, latency)
+        if "skipped" not in result:
+            result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    finally:
+        os.chdir(repo)
+        shutil.rmtree(scratch, ignore_errors=True)
+    with open(output, "w") as fh:
+        json.dump(result, fh)
+
+
+def run_scenario(scenario, size, latency, verbose=False):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as fh:
+        output = fh.name
+    try:
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", scenario, str(size),
+             "--latency-json", json.dumps(latency), "--output", output],
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.PIPE, text=True,
+        )
+        if result.returncode != 0:
+            lines = (result.stderr or "").strip().splitlines()
+            return {"error": lines[-1] if lines else f"exit code {result.returncode}"}
+        with open(output) as fh:
+            return json.load(fh)
+    finally:
+        os.remove(output)
+
+
+def benchmark(scenarios, sizes, latency, verbose=False):
+    report = {}
+    for scenario in scenarios:
+        for size in sizes or SCENARIO_SIZES[scenario]:
+            key = f"{scenario}[{size}]"
+            result = run_scenario(scenario, size, latency, verbose)
+            report[key] = result
+            if "error" in result or "skipped" in result:
+                print(f"{key:<22} {result.get('error') or 'skipped: ' + result['skipped']}")
+                continue
+            print(f"{key:<22} {result['throughput']:>9.2f}/s  p50 {result['p50_seconds']:.3f}s  "
+                  f"p95 {result['p95_seconds']:.3f}s  peak {result['peak_rss_mb']:.0f} MB")
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns the scenarios whose throughput dropped, or whose p95 latency
+    grew, by more than `tolerance` (a fraction) against the baseline.
+    """
+    regressions = []
+    for key, result in report.items():
+        previous = baseline.get(key)
+        if not previous or "throughput" not in result or "throughput" not in previous:
+            continue
+        slower = result["throughput"] < previous["throughput"] * (1 - tolerance)
+        laggier = result["p95_seconds"] > previous["p95_seconds"] * (1 + tolerance)
+        print(f"{key}: throughput {previous['throughput']:.2f} -> {result['throughput']:.2f}/s, "
+              f"p95 {previous['p95_seconds']:.3f} -> {result['p95_seconds']:.3f}s")
+        if slower or laggier:
+            regressions.append(key)
+    return regressions
+
+
+def parse_latency(pairs):
+    from benchmark_fakes import DEFAULT_LATENCY
+
+    latency = {}
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        if name not in DEFAULT_LATENCY:
+            raise SystemExit(f"Unknown latency '{name}', expected one of {sorted(DEFAULT_LATENCY)}")
+        latency[name] = float(value)
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingestion and chat benchmarks.")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=f"Any of {', '.join(SCENARIOS)}.")
+    parser.add_argument("--sizes", help="Comma-separated sizes, overriding each scenario's defaults.")
+    parser.add_argument("--latency", action="append", default=[], metavar="NAME=SECONDS",
+                        help="Override a simulated latency (see benchmark_fakes.DEFAULT_LATENCY).")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--compare", action="store_true", help="Exit non-zero on regressions against the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression, as a fraction.")
+    parser.add_argument("--verbose", action="store_true", help="Show the scenarios' own output.")
+    parser.add_argument("--child", nargs=2, metavar=("SCENARIO", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--latency-json", default="{}", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]), json.loads(args.latency_json), args.output)
+        sys.exit(0)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {sorted(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else None
+    latency = parse_latency(args.latency)
+    report = benchmark(args.scenarios, sizes, latency, args.verbose)
+    if args.compare:
+        with open(args.baseline) as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+        if regressions:
+            print(f"Benchmark regressions: {regressions}")
+            sys.exit(1)
+    if args.save:
+        with open(args.baseline, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Baseline saved to {args.baseline}")
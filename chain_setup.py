@@ -1,45 +1,36 @@
 from prompts import general_prompt, contextualize_q_system_prompt, book_assistant_prompt
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.vectorstores import FAISS
-from langchain_community.chat_message_histories import ChatMessageHistory
+from operator import itemgetter
+import hashlib
+from functools import lru_cache
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEndpoint
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.messages import AIMessage
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from  data_ingestion import DocumentProcessor
+from context_packing import ContextPacker
+from hybrid_retrieval import build_retriever
+from question_rewriter import CONTEXTUALIZE_MODEL, QuestionContextualizer
+from session_store import HISTORY_SUMMARY_MODEL, HistoryWindow, SessionStore
+import openai_scheduler
+import telemetry
 import os
+import time
 from dotenv import load_dotenv
 from warnings import filterwarnings
 filterwarnings("ignore")
 load_dotenv()
 
-dl = DocumentProcessor("./data/")
+# Model clients, the ingestion stack (data_ingestion) and the answer cache are
+# imported inside the factories below, so importing this module does no
+# network setup and loads only langchain_core.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+
 groq_api_key =  os.getenv("GROQ_TOKEN")
 openai_api_key =  os.getenv("OPENAI_API_KEY")
 hf_token = os.getenv("HF_TOKEN")
 
 model_name = "sentence-transformers/all-MiniLM-L6-v2"
-embeddings = OpenAIEmbeddings(api_key=openai_api_key)
-openai_llm = ChatOpenAI( model="gpt-4o",
-                        temperature=0.2)
+# from langchain_groq import ChatGroq
 # groq_llm = ChatGroq(model="llama3-70b-8192", api_key=groq_api_key, temperature=0.2)
-vector_store_name = "context_for_book"
-
-# Load vector store
-print("loading vector store")
-try:
-    # vector_store = FAISS.load_local(vector_store_name, allow_dangerous_deserialization=True, embeddings=embeddings)
-    vector_store = dl.vector_store
-except:
-    print("Vector database not found. Creating vector database. This might take some time")
-
-else:
-    retriever = vector_store.as_retriever(search_kwargs={"k":40})
-    print("loaded successfully")
 
 contextualize_q_prompt = ChatPromptTemplate.from_messages(
     [
@@ -48,9 +39,6 @@ contextualize_q_prompt = ChatPromptTemplate.from_messages(
         ("human", "{input}"),
     ]
 )
-history_aware_retriever = create_history_aware_retriever(
-    openai_llm, retriever, contextualize_q_prompt
-)
 
 qa_prompt = ChatPromptTemplate.from_messages(
     [
@@ -60,45 +48,190 @@ qa_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-question_answer_chain = create_stuff_documents_chain(openai_llm, qa_prompt)
-rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+# Cached answers are only valid for the prompts they were generated with
+prompt_version = hashlib.sha256(
+    (contextualize_q_system_prompt + book_assistant_prompt).encode("utf-8")).hexdigest()[:12]
 
-
-store = {}
+session_store = SessionStore()
 user = "user"
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = ChatMessageHistory()
-    return store[session_id]
+    return session_store.get(session_id)
+
+
+@lru_cache(maxsize=None)
+def get_chat_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o", temperature=0.2, **openai_scheduler.client_options())
+
+
+@lru_cache(maxsize=None)
+def get_question_contextualizer():
+    """
+    Rewrites follow-ups into a standalone question with a smaller model,
+    skipping the call for questions that already stand on their own.
+    Shared by every index so its memo and stats cover all sessions.
+    """
+    from langchain_openai import ChatOpenAI
+    contextualize_llm = ChatOpenAI(model=CONTEXTUALIZE_MODEL, temperature=0, **openai_scheduler.client_options())
+    return QuestionContextualizer(contextualize_llm, contextualize_q_prompt)
+
+
+@lru_cache(maxsize=None)
+def get_history_window():
+    """
+    Caps the history tokens sent to both prompts, optionally summarizing older turns.
+    """
+    from langchain_openai import ChatOpenAI
+    return HistoryWindow(
+        summarizer=ChatOpenAI(model=HISTORY_SUMMARY_MODEL, temperature=0, **openai_scheduler.client_options())
+        if HISTORY_SUMMARY_MODEL else None)
+
+
+def build_rag_chain(processor, llm=None, contextualizer=None):
+    """
+    Builds the retrieval-augmented chain over a DocumentProcessor's vector
+    store: window history -> standalone question -> retrieve and pack
+    context -> answer, with the optional semantic answer cache in front of
+    retrieval. `llm` and `contextualizer` default to the shared OpenAI ones.
+    """
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    # Fuse BM25 and dense hits over the vector store (Pinecone or local, per VECTOR_BACKEND)
+    retriever = build_retriever(processor)
+
+    # Diversify, stitch and trim the retrieved chunks to a token budget
+    context_packer = ContextPacker()
+    packed_retriever = (
+        itemgetter("standalone_question")
+        | retriever
+        | RunnableLambda(context_packer.pack).with_config(run_name="pack_context")
+    ).with_config(run_name="retrieve_documents")
+
+    question_answer_chain = create_stuff_documents_chain(llm or get_chat_llm(), qa_prompt)
+    retrieval_chain = RunnablePassthrough.assign(context=packed_retriever).assign(answer=question_answer_chain)
+
+    if ANSWER_CACHE_ENABLED:
+        from answer_cache import SemanticAnswerCache
+        # Share the processor's cached embeddings so repeated queries are not re-embedded
+        answer_cache = SemanticAnswerCache(processor.embeddings)
+        retrieval_chain = answer_cache.wrap(retrieval_chain, processor.index_name, prompt_version)
+
+    history_window = get_history_window()
+    return (
+        RunnablePassthrough.assign(chat_history=RunnableLambda(lambda x: history_window(x["chat_history"])).with_config(run_name="window_history"))
+        | RunnablePassthrough.assign(
+            standalone_question=(contextualizer or get_question_contextualizer()).as_runnable())
+        | retrieval_chain
+    )
 
 
-conversational_rag_chain = RunnableWithMessageHistory(
-    rag_chain,
-    get_session_history,
-    input_messages_key="input",
-    history_messages_key="chat_history",
-    output_messages_key="answer",
-)
+def build_conversational_rag_chain(processor, **chain_options):
+    """
+    Wraps build_rag_chain with per-session chat history. With telemetry on,
+    every chat stage and LLM call is recorded as a span.
+    """
+    chain = RunnableWithMessageHistory(
+        build_rag_chain(processor, **chain_options),
+        get_session_history,
+        input_messages_key="input",
+        history_messages_key="chat_history",
+        output_messages_key="answer",
+    )
+    if telemetry.enabled:
+        chain = chain.with_config(callbacks=[telemetry.langchain_callback()])
+    return chain
+
+
+class _TurnProgress:
+    """
+    Collects the streamed chunks of one chat turn: calls on_sources once
+    retrieval finishes and on_token for every answer token, and tracks the
+    answer, sources and timings.
+    """
+
+    def __init__(self, on_sources=None, on_token=None):
+        self.on_sources = on_sources
+        self.on_token = on_token
+        self.started = time.perf_counter()
+        self.answer, self.sources = "", []
+        self.time_to_sources = self.time_to_first_token = None
+
+    def add(self, chunk):
+        if "context" in chunk:
+            self.sources = list(set([document.metadata['source'] for document in chunk["context"]]))
+            self.time_to_sources = time.perf_counter() - self.started
+            if self.on_sources:
+                self.on_sources(self.sources)
+        if chunk.get("answer"):
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - self.started
+            self.answer += chunk["answer"]
+            if self.on_token:
+                self.on_token(chunk["answer"])
+
+    def finish(self, turn):
+        turn.set(sources=len(self.sources), answer_chars=len(self.answer),
+                 time_to_sources=self.time_to_sources, time_to_first_token=self.time_to_first_token)
+        return {
+            "answer": self.answer,
+            "sources": self.sources,
+            "time_to_sources": self.time_to_sources,
+            "time_to_first_token": self.time_to_first_token,
+            "total_seconds": time.perf_counter() - self.started,
+        }
 
-if __name__ == "__main__":
 
-    while True:
-        if user in store:
-            for message in store[user].messages[1:]:
-                if isinstance(message, AIMessage):
-                    prefix = "AI"
-                else:
-                    prefix = "User"
+def stream_rag_response(conversational_rag_chain, user_input, session_id, on_sources=None, on_token=None):
+    """
+    Streams one chat turn through a conversational RAG chain.
+
+    on_sources(sources) is called as soon as retrieval finishes and
+    on_token(text) for every answer token. Chat history is written by
+    RunnableWithMessageHistory once the stream ends. Returns the answer,
+    sources and timings, including time to first token.
+    """
+    progress = _TurnProgress(on_sources, on_token)
+    with telemetry.span("chat.turn") as turn, openai_scheduler.priority(openai_scheduler.INTERACTIVE):
+        for chunk in conversational_rag_chain.stream(
+            {"input": user_input},
+            config={"configurable": {"session_id": session_id}},
+        ):
+            progress.add(chunk)
+        response = progress.finish(turn)
+    print(f"Time to sources: {response['time_to_sources'] or 0:.2f}s, time to first token: "
+          f"{response['time_to_first_token'] or 0:.2f}s, total: {response['total_seconds']:.2f}s")
+    return response
+
+
+async def astream_rag_response(conversational_rag_chain, user_input, session_id, on_sources=None, on_token=None):
+    """
+    Async counterpart of stream_rag_response, built on the chain's astream
+    path. Cancelling the awaiting task stops generation, and the turn is
+    then not written to the chat history.
+    """
+    progress = _TurnProgress(on_sources, on_token)
+    with telemetry.span("chat.turn") as turn, openai_scheduler.priority(openai_scheduler.INTERACTIVE):
+        async for chunk in conversational_rag_chain.astream(
+            {"input": user_input},
+            config={"configurable": {"session_id": session_id}},
+        ):
+            progress.add(chunk)
+        return progress.finish(turn)
+
 
-                print(f"{prefix}: {message.content}\n")
+if __name__ == "__main__":
+    from data_ingestion import DocumentProcessor, INDEX_NAME
+    conversational_rag_chain = build_conversational_rag_chain(DocumentProcessor(index_name=INDEX_NAME))
 
+    while True:
         user_input = input("User --> ")
-        response = conversational_rag_chain.invoke(
-        {"input": user_input},
-        config={
-            "configurable": {"session_id": user}
-        }
-    )
-        sources = list(set([document.metadata['source'] for document in response["context"]]))
-        print(sources)
\ No newline at end of file
+        print("AI: ", end="", flush=True)
+        response = stream_rag_response(
+            conversational_rag_chain,
+            user_input,
+            user,
+            on_token=lambda token: print(token, end="", flush=True),
+        )
+        print("\n")
+        print(response["sources"])
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+
+CHUNK_DEDUP_PATH = os.getenv("CHUNK_DEDUP_PATH", "./chunk_signatures.db")
+# Estimated Jaccard similarity of word shingles above which a chunk is a
+# near-duplicate of one already stored.
+DEDUP_THRESHOLD = float(os.getenv("CHUNK_DEDUP_THRESHOLD", 0.85))
+NUM_PERMUTATIONS = 128
+# 16 bands of 8 rows put the LSH candidate threshold near 0.7 similarity.
+LSH_BANDS = 16
+SHINGLE_WORDS = 5
+MERSENNE_PRIME = (1 << 31) - 1
+# SQLite's default limit on bound parameters per statement is 999.
+LOOKUP_BATCH_SIZE = 500
+WORD_PATTERN = re.compile(r"\w+")
+
+_random = np.random.RandomState(20240501)
+_PERM_A = _random.randint(1, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _random.randint(0, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def minhash_signature(text):
+    """
+    Returns the MinHash signature (uint32 array) of a text's word 5-shingles.
+    Shingles are hashed with crc32, so signatures are stable across processes.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(len(words) - SHINGLE_WORDS + 1, 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def lsh_buckets(signature, bands=LSH_BANDS):
+    """
+    Returns one 63-bit bucket key per band; the band number is part of the
+    key, so buckets of different bands never collide.
+    """
+    rows = len(signature) // bands
+    keys = []
+    for band in range(bands):
+        digest = hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(),
+                                 digest_size=8, key=band.to_bytes(2, "big")).digest()
+        keys.append(int.from_bytes(digest, "big") >> 1)
+    return keys
+
+
+def similarity(a, b):
+    return float(np.mean(a == b))
+
+
+class ChunkDeduplicator:
+    """
+    Drops near-duplicate chunks before they are embedded.
+
+    Every stored chunk's MinHash signature is kept in SQLite with its LSH
+    band buckets, so each new chunk is compared only with the few stored
+    chunks that share a bucket, across the whole index and across runs.
+    Chunks of the source being ingested are never compared with that
+    source's previous version. A source filtered in several batches passes
+    `append=True` after the first, so later batches are compared with its
+    earlier ones instead.
+
+    Nothing is written while filtering: `commit(source_id)` stores the kept
+    chunks' signatures, replacing the source's previous ones, once its
+    vectors are upserted, and `discard(source_id)` forgets a source that
+    failed. Each dropped chunk is stored with its text and metadata and a
+    link to the chunk it duplicates; `commit` returns the dropped chunks
+    whose kept chunk was removed or changed, to be embedded after all.
+    `stats()` reports the chunks dropped, which is the number of embedding
+    inputs and vectors saved, and the embedding tokens they would have cost.
+    """
+
+    def __init__(self, index_name, path=CHUNK_DEDUP_PATH, threshold=DEDUP_THRESHOLD):
+        self.index_name = index_name
+        self.path = path
+        self.threshold = threshold
+        self.checked = 0
+        self.dropped = 0
+        self.tokens_saved = 0
+        self._count_tokens = None
+        # source_id -> kept rows, dropped chunks and bucket lookup, until committed
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                index_name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                source_id TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (index_name, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS signatures_source ON signatures (index_name, source_id);
+            CREATE TABLE IF NOT EXISTS buckets (
+                index_name TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (index_name, bucket);
+            CREATE INDEX IF NOT EXISTS buckets_chunk ON buckets (index_name, chunk_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                index_name TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                source_id TEXT NOT NULL,
+                kept_chunk_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (index_name, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS duplicates_source ON duplicates (index_name, source_id);
+            CREATE INDEX IF NOT EXISTS duplicates_kept ON duplicates (index_name, kept_chunk_id);
+            """
+        )
+        self._conn.commit()
+
+    def _candidates(self, buckets, exclude_source=None):
+        """
+        Returns {bucket: [(chunk_id, signature), ...]} for stored chunks,
+        other than those of `exclude_source`, that fall into any of `buckets`.
+        """
+        candidates = {}
+        buckets = list(set(buckets))
+        exclude = [] if exclude_source is None else [exclude_source]
+        for start in range(0, len(buckets), LOOKUP_BATCH_SIZE):
+            batch = buckets[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                "SELECT b.bucket, s.chunk_id, s.signature FROM buckets b "
+                "JOIN signatures s ON s.index_name = b.index_name AND s.chunk_id = b.chunk_id "
+                f"WHERE b.index_name = ? AND b.bucket IN ({placeholders})"
+                + (" AND s.source_id != ?" if exclude else ""),
+                [self.index_name, *batch, *exclude],
+            ).fetchall()
+            for bucket, chunk_id, blob in rows:
+                candidates.setdefault(bucket, []).append((chunk_id, np.frombuffer(blob, dtype=np.uint32)))
+        return candidates
+
+    def filter(self, source_id, ids, chunks, append=False):
+        """
+        Takes (text, metadata) chunks and returns the positions of the chunks
+        to keep and a dict mapping each dropped chunk ID to the stored chunk
+        it duplicates. Without `append` the source starts over; with it,
+        chunks are also compared with the source's earlier batches.
+        """
+        texts = [text for text, _ in chunks]
+        signatures = [minhash_signature(text) for text in texts]
+        buckets = [lsh_buckets(signature) for signature in signatures]
+        keep, duplicates = [], {}
+        with self._lock:
+            if not append or source_id not in self._pending:
+                self._pending[source_id] = {"kept": [], "dropped": [], "seen": {}}
+            pending = self._pending[source_id]
+            stored = self._candidates([b for chunk in buckets for b in chunk], source_id)
+            seen = pending["seen"]  # bucket -> kept chunks of this source, for duplicates within it
+            for position, (chunk_id, signature, chunk_buckets) in enumerate(zip(ids, signatures, buckets)):
+                nearby = {cid: sig for bucket in chunk_buckets
+                          for cid, sig in stored.get(bucket, []) + seen.get(bucket, [])}
+                match = next((cid for cid, sig in nearby.items() if similarity(signature, sig) >= self.threshold), None)
+                if match is not None:
+                    duplicates[chunk_id] = match
+                    text, metadata = chunks[position]
+                    pending["dropped"].append((chunk_id, match, text, metadata))
+                    continue
+                keep.append(position)
+                pending["kept"].append((chunk_id, signature, chunk_buckets))
+                for bucket in chunk_buckets:
+                    seen.setdefault(bucket, []).append((chunk_id, signature))
+            self.checked += len(ids)
+            self.dropped += len(duplicates)
+        if duplicates:
+            if self._count_tokens is None:
+                from context_packing import token_counter
+                self._count_tokens = token_counter()
+            dropped_tokens = sum(self._count_tokens(text) for chunk_id, text in zip(ids, texts)
+                                 if chunk_id in duplicates)
+            with self._lock:
+                self.tokens_saved += dropped_tokens
+            print(f"Dropped {len(duplicates)} of {len(ids)} chunks of {source_id} as near-duplicates "
+                  f"({dropped_tokens} embedding tokens saved)")
+        return keep, duplicates
+
+    def commit(self, source_id):
+        """
+        Stores the filtered chunks of a source whose vectors are now in the
+        index, replacing its previous signatures and duplicate links.
+        Returns (chunk_id, source_id, text, metadata) for dropped chunks of
+        other sources whose kept chunk is gone or changed, or whose earlier
+        restore never completed; see `restored`.
+        """
+        with self._lock:
+            pending = self._pending.pop(source_id, None)
+            if pending is None:
+                return []
+            previous = dict(self._conn.execute(
+                "SELECT chunk_id, signature FROM signatures WHERE index_name = ? AND source_id = ?",
+                (self.index_name, source_id)))
+            changed = [cid for cid, signature, _ in pending["kept"] if cid in previous
+                       and similarity(signature, np.frombuffer(previous[cid], dtype=np.uint32)) < self.threshold]
+            self._delete_source(source_id, list(previous))
+            self._insert(source_id, pending["kept"])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO duplicates "
+                "(index_name, chunk_id, source_id, kept_chunk_id, text, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.index_name, cid, source_id, kept, text, json.dumps(metadata, default=str))
+                 for cid, kept, text, metadata in pending["dropped"]])
+            self._conn.commit()
+            return self._orphans(changed)
+
+    def discard(self, source_id):
+        """
+        Forgets the filtered chunks of a source that failed to ingest.
+        """
+        with self._lock:
+            self._pending.pop(source_id, None)
+
+    def restored(self, chunks):
+        """
+        Records (chunk_id, source_id, text, metadata) chunks returned by
+        `commit` as stored in their own right once they have been upserted.
+        """
+        rows = {}
+        for chunk_id, source_id, text, _ in chunks:
+            signature = minhash_signature(text)
+            rows.setdefault(source_id, []).append((chunk_id, signature, lsh_buckets(signature)))
+        with self._lock:
+            self._conn.executemany("DELETE FROM duplicates WHERE index_name = ? AND chunk_id = ?",
+                                   [(self.index_name, chunk_id) for chunk_id, _, _, _ in chunks])
+            for source_id, source_rows in rows.items():
+                self._insert(source_id, source_rows)
+            self._conn.commit()
+
+    def _orphans(self, changed):
+        orphans = self._conn.execute(
+            "SELECT d.chunk_id, d.source_id, d.text, d.metadata FROM duplicates d "
+            "LEFT JOIN signatures s ON s.index_name = d.index_name AND s.chunk_id = d.kept_chunk_id "
+            "WHERE d.index_name = ? AND s.chunk_id IS NULL", (self.index_name,)).fetchall()
+        for start in range(0, len(changed), LOOKUP_BATCH_SIZE):
+            batch = changed[start:start + LOOKUP_BATCH_SIZE]
+            orphans += self._conn.execute(
+                "SELECT chunk_id, source_id, text, metadata FROM duplicates "
+                f"WHERE index_name = ? AND kept_chunk_id IN ({','.join('?' * len(batch))})",
+                [self.index_name, *batch]).fetchall()
+        return [(chunk_id, source_id, text, json.loads(metadata)) for chunk_id, source_id, text, metadata in orphans]
+
+    def _delete_source(self, source_id, chunk_ids):
+        self._conn.executemany("DELETE FROM buckets WHERE index_name = ? AND chunk_id = ?",
+                               [(self.index_name, cid) for cid in chunk_ids])
+        self._conn.execute("DELETE FROM signatures WHERE index_name = ? AND source_id = ?",
+                           (self.index_name, source_id))
+        self._conn.execute("DELETE FROM duplicates WHERE index_name = ? AND source_id = ?",
+                           (self.index_name, source_id))
+
+    def _insert(self, source_id, rows):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO signatures (index_name, chunk_id, source_id, signature) VALUES (?, ?, ?, ?)",
+            [(self.index_name, cid, source_id, sig.tobytes()) for cid, sig, _ in rows])
+        self._conn.executemany(
+            "INSERT INTO buckets (index_name, bucket, chunk_id) VALUES (?, ?, ?)",
+            [(self.index_name, bucket, cid) for cid, _, chunk_buckets in rows for bucket in chunk_buckets])
+
+    def stats(self):
+        with self._lock:
+            stored = self._conn.execute(
+                "SELECT COUNT(*) FROM signatures WHERE index_name = ?", (self.index_name,)).fetchone()[0]
+            linked = self._conn.execute(
+                "SELECT COUNT(*) FROM duplicates WHERE index_name = ?", (self.index_name,)).fetchone()[0]
+            return {
+                "chunks_checked": self.checked,
+                "duplicates_dropped": self.dropped,
+                "embedding_inputs_saved": self.dropped,
+                "vectors_saved": self.dropped,
+                "embedding_tokens_saved": self.tokens_saved,
+                "signatures_stored": stored,
+                "duplicates_linked": linked,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+
+from langchain_core.documents import Document
+
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 12000))
+MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+# Chunks this similar to one already picked add nothing new and are dropped.
+DUPLICATE_SIMILARITY = 0.9
+# Shortest suffix/prefix match treated as splitter overlap when stitching.
+MIN_STITCH_OVERLAP = 20
+# RecursiveCharacterTextSplitter(chunk_overlap=200) repeats at most this much.
+MAX_STITCH_OVERLAP = 400
+CHUNK_ID_PATTERN = re.compile(r"_chunk_(\d+)$")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def token_counter():
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model("gpt-4o")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: len(text) // 4
+
+
+def _shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _chunk_index(document):
+    match = CHUNK_ID_PATTERN.search(getattr(document, "id", None) or "")
+    return int(match.group(1)) if match else None
+
+
+def _overlap(first, second):
+    """
+    Length of the longest suffix of `first` that is also a prefix of `second`.
+    """
+    longest = min(len(first), len(second), MAX_STITCH_OVERLAP)
+    for size in range(longest, MIN_STITCH_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks into a token budget before they reach the prompt.
+
+    1. Orders chunks by maximal marginal relevance, using retriever rank as
+       relevance and word-shingle overlap as the (cheap, local) similarity,
+       and drops chunks that are near copies of one already picked.
+    2. Stitches chunks that follow each other in the same source and page into
+       one passage, removing the text the splitter's overlap repeated.
+    3. Adds passages in MMR order until the token budget is full.
+
+    One packer is shared by every session of a chain, so `pack_with_stats`
+    returns each call's token counts with its result; only the running
+    `total_tokens_saved` is kept on the packer.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, mmr_lambda=MMR_LAMBDA):
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.count_tokens = token_counter()
+        self.total_tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def _mmr_order(self, documents):
+        shingles = [_shingles(document.page_content) for document in documents]
+        relevance = [1 - rank / len(documents) for rank in range(len(documents))]
+        remaining = list(range(len(documents)))
+        selected = []
+        while remaining:
+            best, best_score, best_similarity = None, None, 0.0
+            for i in remaining:
+                similarity = max((_jaccard(shingles[i], shingles[j]) for j in selected), default=0.0)
+                score = self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * similarity
+                if best_score is None or score > best_score:
+                    best, best_score, best_similarity = i, score, similarity
+            remaining.remove(best)
+            if best_similarity < DUPLICATE_SIMILARITY:
+                selected.append(best)
+        return selected
+
+    def _stitch(self, documents, order):
+        """
+        Returns passages as (rank, text, metadata), merging chunks of the same
+        source and page whose texts overlap or whose chunk IDs are consecutive.
+        """
+        groups = {}
+        for rank, i in enumerate(order):
+            document = documents[i]
+            key = (document.metadata.get("source"), document.metadata.get("page"))
+            groups.setdefault(key, []).append((rank, document))
+
+        passages = []
+        for members in groups.values():
+            if all(_chunk_index(document) is not None for _, document in members):
+                members.sort(key=lambda member: _chunk_index(member[1]))
+            parts = [[rank, document.page_content, document.metadata, _chunk_index(document)]
+                     for rank, document in members]
+            merged = True
+            while merged and len(parts) > 1:
+                merged = False
+                for a in range(len(parts)):
+                    for b in range(len(parts)):
+                        if a == b:
+                            continue
+                        first, second = parts[a], parts[b]
+                        size = _overlap(first[1], second[1])
+                        consecutive = first[3] is not None and second[3] == first[3] + 1
+                        if size or consecutive:
+                            first[1] = first[1] + (second[1][size:] if size else "\n" + second[1])
+                            first[0] = min(first[0], second[0])
+                            first[3] = second[3]
+                            del parts[b]
+                            merged = True
+                            break
+                    if merged:
+                        break
+            passages.extend((rank, text, metadata) for rank, text, metadata, _ in parts)
+        passages.sort(key=lambda passage: passage[0])
+        return passages
+
+    def pack(self, documents):
+        """
+        Returns the packed documents.
+        """
+        return self.pack_with_stats(documents)[0]
+
+    def pack_with_stats(self, documents):
+        """
+        Returns the packed documents and a dict of this call's chunk,
+        passage and token counts.
+        """
+        documents = list(documents)
+        if not documents:
+            return documents, {"chunks_in": 0, "passages_out": 0, "tokens_in": 0, "tokens_out": 0,
+                               "tokens_saved": 0}
+        tokens_in = sum(self.count_tokens(document.page_content) for document in documents)
+
+        packed, tokens_out = [], 0
+        for _, text, metadata in self._stitch(documents, self._mmr_order(documents)):
+            tokens = self.count_tokens(text)
+            if tokens_out + tokens > self.token_budget:
+                continue
+            packed.append(Document(page_content=text, metadata=metadata))
+            tokens_out += tokens
+
+        stats = {
+            "chunks_in": len(documents),
+            "passages_out": len(packed),
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": tokens_in - tokens_out,
+        }
+        with self._lock:
+            self.total_tokens_saved += tokens_in - tokens_out
+        print(f"Context packing: {len(documents)} chunks -> {len(packed)} passages, "
+              f"{tokens_in} -> {tokens_out} tokens (saved {tokens_in - tokens_out})")
+        return packed, stats
@@ -1,77 +1,200 @@
 DIRECTORY_PATH = "./data/"
 INDEX_NAME = "test"
 
-import io
+import itertools
 import json
 import os
-import streamlit as st
-import feedparser
-from langchain_core.documents import Document
-from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from pinecone import Pinecone, ServerlessSpec
-from langchain_pinecone import PineconeVectorStore
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from google.oauth2 import service_account
 from warnings import filterwarnings
-from moviepy.editor import AudioFileClip
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
-from pydub import AudioSegment
-import unicodedata
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor, wait
 filterwarnings("ignore")
 import time
 import re
 from dotenv import load_dotenv
+from ingestion_ledger import IngestionLedger, hash_file, hash_text
+from ingestion_pipeline import (CHUNK_SIZE, EMBED_BATCH_SIZE, EMBED_WORKERS, UPSERT_BATCH_SIZE, IngestionPipeline,
+                                split_pages)
+from drive_crawler import DriveCrawler
+from audio_segmenter import AudioSegmenter
+from podcast_scheduler import PodcastScheduler, TRANSCRIBE_WORKERS
+from feed_poller import FeedPoller
+from transcript_store import TranscriptStore, join_timed_segments, time_range_for_span
+import openai_scheduler
+import telemetry
+
+# Heavy dependencies (Streamlit, OpenAI, Pinecone, Google API client, feedparser,
+# moviepy, pydub, PyMuPDF) are imported inside the methods that use them, so importing
+# this module for chat alone stays cheap.
 
 
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 TEMP_DOWNLOAD_DIR = './temp_downloads'
+SEGMENT_ON_SILENCE = os.getenv("SEGMENT_ON_SILENCE", "false").lower() == "true"
+CHUNK_DEDUP_ENABLED = os.getenv("CHUNK_DEDUP_ENABLED", "true").lower() == "true"
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+# Dimensions of new vector indexes; existing ones keep the dimension they were created with.
+# text-embedding-3 models return shortened embeddings for any value up to their full size.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 1536))
+FULL_EMBEDDING_DIMENSIONS = 1536
 
 
 class DocumentProcessor:
     def __init__(self, directory_path="./data/",
                 index_name="test",
                 drive_folder_id=None,
-                rss_url = "https://feeds.simplecast.com/XFfCG1w8"):
+                rss_url = "https://feeds.simplecast.com/XFfCG1w8",
+                backend=None,
+                embeddings=None,
+                openai_client=None,
+                dimensions=None,
+                vector_index_name=None):
+        """
+        `embeddings` and `openai_client` (used for Whisper) default to OpenAI
+        clients built from st.secrets; offline benchmarks pass fakes.
+
+        Vectors are stored in `vector_index_name`, by default the index the
+        name is aliased to (see index_migration) or the name itself. Its
+        `dimensions` default to those of the existing vector index, else
+        EMBEDDING_DIMENSIONS, and the embeddings are requested at that size.
+        """
         load_dotenv()
-        self.rss_url = rss_url
+        from vector_backends import VECTOR_BACKEND, resolve_index_name
+
+        self.backend = backend or VECTOR_BACKEND
+        # One feed URL or a list of them
+        self.rss_urls = [rss_url] if isinstance(rss_url, str) else list(rss_url)
+        self.rss_url = self.rss_urls[0]
         self.drive_folder_id = drive_folder_id
-        self.dimensions = 1536
         self.directory = directory_path
         self.index_name = index_name
-        # openai_api_key = os.getenv("OPENAI_API_KEY")
-        openai_api_key = st.secrets['OPENAI_API_KEY']
-
-        self.client = OpenAI(api_key=openai_api_key)
-        self.embeddings = OpenAIEmbeddings(api_key=openai_api_key, model="text-embedding-3-small")
-        self.vector_store = self.load_pinecone_vector_store()
+        self._pinecone = None
+        self.vector_index_name = vector_index_name or resolve_index_name(index_name)
+        self.dimensions = dimensions or self.vector_index_dimension() or EMBEDDING_DIMENSIONS
+        self.embedding_model = "text-embedding-3-small"
+        self.ledger = IngestionLedger(index_name)
+        self.transcripts = TranscriptStore()
+        self.feed_poller = FeedPoller(index_name)
+        self.dedup = None
+        if CHUNK_DEDUP_ENABLED:
+            from chunk_dedup import ChunkDeduplicator
+            self.dedup = ChunkDeduplicator(index_name)
+        # BM25 index of every chunk, for hybrid retrieval in chain_setup
+        self.lexical = None
+        if LEXICAL_INDEX_ENABLED:
+            from lexical_index import LexicalIndex
+            self.lexical = LexicalIndex(index_name)
+        from embedding_cache import CachedEmbeddings
+
+        # Pipeline embed batch size, unless INGEST_EMBED_BATCH_SIZE is set
+        self.embed_batch_size = None
+        if embeddings is None or openai_client is None:
+            # openai_api_key = os.getenv("OPENAI_API_KEY")
+            import streamlit as st
+            openai_api_key = st.secrets['OPENAI_API_KEY']
+            from openai import OpenAI
+            from langchain_openai import OpenAIEmbeddings
+
+            # Whisper, embedding and chat calls share one rate-limit scheduler
+            openai_client = openai_client or OpenAI(
+                api_key=openai_api_key, **openai_scheduler.client_options(async_client=False))
+            if embeddings is None:
+                # Full-size embeddings are requested without `dimensions`, which keeps their cache keys
+                # Requests are split on real token counts to stay under OpenAI's per-request cap
+                embeddings = openai_scheduler.TokenCappedEmbeddings(OpenAIEmbeddings(
+                    api_key=openai_api_key, model=self.embedding_model,
+                    dimensions=None if self.dimensions == FULL_EMBEDDING_DIMENSIONS else self.dimensions,
+                    chunk_size=openai_scheduler.MAX_EMBEDDING_INPUTS,
+                    **openai_scheduler.client_options()))
+                if "INGEST_EMBED_BATCH_SIZE" not in os.environ:
+                    # Fill the model's token rate (~4 characters per token)
+                    self.embed_batch_size = openai_scheduler.scheduler.embedding_batch_size(
+                        self.embedding_model, CHUNK_SIZE // 4, EMBED_WORKERS)
+        self.client = openai_client
+        self.embeddings = CachedEmbeddings(embeddings)
+        self.vector_store = self.load_vector_store()
         print("Document Processor initialized.")
 
-    def load_pinecone_vector_store(self):
-        # pinecone_api_key = os.getenv("PINECONE_API_KEY")
-        pinecone_api_key = st.secrets['PINECONE_API_KEY']
-        if not pinecone_api_key:
-            raise ValueError("No Pinecone API key found in environment variables.")
-        print("LOading {} index".format(self.index_name))
-        pc = Pinecone(api_key=pinecone_api_key)
-
-        if self.index_name not in pc.list_indexes().names():
+    def load_vector_store(self):
+        """
+        Loads the vector store for the backend selected by VECTOR_BACKEND
+        ("pinecone" or "local"). Both expose `self.index` with the Pinecone
+        Index methods ingestion relies on.
+        """
+        from vector_backends import load_local_vector_store
+
+        if self.backend == "local":
+            self.index, self.vector_store = load_local_vector_store(
+                self.vector_index_name, self.embeddings, self.dimensions)
+            return self.vector_store
+        if self.backend != "pinecone":
+            raise ValueError(f"Unknown vector backend: {self.backend}")
+        return self.load_pinecone_vector_store()
+
+    def pinecone_client(self):
+        if self._pinecone is None:
+            # pinecone_api_key = os.getenv("PINECONE_API_KEY")
+            import streamlit as st
+            pinecone_api_key = st.secrets['PINECONE_API_KEY']
+            if not pinecone_api_key:
+                raise ValueError("No Pinecone API key found in environment variables.")
+            from pinecone import Pinecone
+            self._pinecone = Pinecone(api_key=pinecone_api_key)
+        return self._pinecone
+
+    def vector_index_dimension(self, name=None):
+        """
+        Returns the dimension of an existing vector index (by default this
+        processor's), or None if it does not exist yet.
+        """
+        name = name or self.vector_index_name
+        if self.backend == "local":
+            from vector_backends import local_index_dimension
+            return local_index_dimension(name)
+        if self.backend != "pinecone":
+            raise ValueError(f"Unknown vector backend: {self.backend}")
+        pc = self.pinecone_client()
+        if name not in pc.list_indexes().names():
+            return None
+        return pc.describe_index(name).dimension
+
+    def open_vector_index(self, name, dimensions):
+        """
+        Opens a vector index of this processor's backend, creating it with
+        `dimensions` if it does not exist.
+        """
+        if self.backend == "local":
+            from vector_backends import LocalIndex
+            return LocalIndex(name, dimensions)
+        from pinecone import ServerlessSpec
+
+        pc = self.pinecone_client()
+        if name not in pc.list_indexes().names():
             pc.create_index(
-                name=self.index_name,
-                dimension=1536,
+                name=name,
+                dimension=dimensions,
                 metric="cosine",
                 spec=ServerlessSpec(cloud="aws", region="us-east-1")
             )
-            while not pc.describe_index(self.index_name).status["ready"]:
+            while not pc.describe_index(name).status["ready"]:
                 time.sleep(1)
-                
-        self.index = pc.Index(self.index_name)
-        print(f"Pinecone vector store '{self.index_name}' loaded.")
+        return pc.Index(name)
+
+    def load_pinecone_vector_store(self):
+        print("LOading {} index".format(self.vector_index_name))
+        from langchain_pinecone import PineconeVectorStore
+
+        self.index = self.open_vector_index(self.vector_index_name, self.dimensions)
+        print(f"Pinecone vector store '{self.vector_index_name}' loaded.")
         self.vector_store = PineconeVectorStore(index=self.index, embedding=self.embeddings)
         return self.vector_store
+
+    def close(self):
+        """
+        Closes the processor's SQLite stores (ledger, caches, feed state,
+        dedup signatures and lexical index).
+        """
+        for store in (self.ledger, self.transcripts, self.feed_poller, self.dedup, self.lexical, self.embeddings):
+            if store is not None:
+                store.close()
     
 
     def get_file_paths_from_directory_and_subdirectories(self):
@@ -90,70 +213,166 @@ class DocumentProcessor:
 
     def check_existing_docs_by_id(self, doc_ids):
         """
-        Check if the document IDs (filenames) exist in the Pinecone index.
+        Check which document IDs (filenames) have been ingested into the index,
+        using one bulk lookup against the local ingestion ledger.
         """
-        # print(doc_ids)
-        existing_ids = set()
-        for doc_id in doc_ids:
+        return set(self.ledger.lookup(doc_ids))
+
+    def plan_ingestion(self, sources):
+        """
+        Takes a dict of source ID -> content hash and returns the set of IDs
+        that are new or have changed since they were last ingested.
+        """
+        new_ids, changed_ids, _ = self.ledger.plan(sources, self.embedding_model)
+        if changed_ids:
+            print(f"{len(changed_ids)} changed documents will be re-ingested: {changed_ids}")
+        return set(new_ids) | set(changed_ids)
+
+    def upsert_source_chunks(self, source_id, chunks, content_hash):
+        """
+        Adds a source's chunks under `{source_id}_chunk_{i}` IDs, deletes chunk
+        vectors left over from a previous, longer version of the source and
+        records the ingestion in the ledger.
+
+        `chunks` may be a generator (e.g. pages split as they load); chunks
+        are embedded and upserted in batches of the pipeline's embed batch
+        size, so only one batch is held at a time.
+        """
+        batch_size = self.embed_batch_size or EMBED_BATCH_SIZE
+        chunks = iter(chunks)
+        ids, split = [], 0
+        with telemetry.span("index.upsert_source", source=source_id) as span:
+            while True:
+                batch = list(itertools.islice(chunks, batch_size))
+                if not batch:
+                    break
+                # IDs number all chunks, so dropped duplicates leave gaps as before
+                batch_ids = [f"{source_id}_chunk_{i}" for i in range(split, split + len(batch))]
+                append, split = split > 0, split + len(batch)
+                batch_ids, batch = self.drop_duplicate_chunks(
+                    source_id, batch_ids, batch, lambda chunk: (chunk.page_content, chunk.metadata), append)
+                if batch:
+                    self.vector_store.add_documents(documents=batch, ids=batch_ids)
+                    if self.lexical is not None:
+                        self.lexical.add(batch_ids, [chunk.page_content for chunk in batch],
+                                         [chunk.metadata for chunk in batch])
+                ids += batch_ids
+            span.set(chunks=len(ids))
+            self.finalize_source(source_id, ids, content_hash)
+        return ids
+
+    def index_lexical_chunks(self, vectors):
+        """
+        Adds upserted (id, values, metadata) vectors to the lexical index.
+        """
+        self.lexical.add([vector_id for vector_id, _, _ in vectors],
+                         [metadata["text"] for _, _, metadata in vectors],
+                         [metadata for _, _, metadata in vectors])
+
+    def drop_duplicate_chunks(self, source_id, ids, chunks, unpack, append=False):
+        """
+        Removes chunks that near-duplicate chunks already in the index (or
+        earlier in the same source). Kept chunks keep their original IDs.
+        `unpack(chunk)` returns a chunk's (text, metadata) and `append` marks
+        a source's batches after its first.
+        """
+        if self.dedup is None or not chunks:
+            return ids, chunks
+        with telemetry.span("ingest.dedup", source=source_id, chunks=len(chunks)) as span:
+            keep, duplicates = self.dedup.filter(source_id, ids, [unpack(chunk) for chunk in chunks], append)
+            span.set(dropped=len(duplicates))
+        return [ids[i] for i in keep], [chunks[i] for i in keep]
+
+    def finalize_source(self, source_id, ids, content_hash):
+        """
+        Deletes chunk vectors of a source that are not in `ids` (left over from
+        a previous, longer version) and records the source in the ledger.
+        """
+        previous = self.ledger.lookup([source_id]).get(source_id)
+        if previous:
+            current = set(ids)
+            stale_ids = [chunk_id for chunk_id in previous["chunk_ids"] if chunk_id not in current]
+            if stale_ids:
+                self.index.delete(ids=stale_ids)
+                if self.lexical is not None:
+                    self.lexical.delete(stale_ids)
+                print(f"Deleted {len(stale_ids)} stale chunks of {source_id}")
+
+        self.ledger.record(source_id, content_hash, ids, self.embedding_model)
+        if self.dedup is not None:
+            # Signatures are stored only now that the chunks are in the index
+            orphans = self.dedup.commit(source_id)
+            if orphans:
+                self.restore_duplicate_chunks(orphans)
+
+        from answer_cache import invalidate_answer_cache
+        invalidate_answer_cache(self.index_name)
+
+    def restore_duplicate_chunks(self, chunks):
+        """
+        Embeds and upserts (chunk_id, source_id, text, metadata) chunks that
+        were dropped as duplicates of a chunk that has since been removed or
+        changed, and adds them to their sources' ledger rows.
+        """
+        with telemetry.span("ingest.dedup_restore", chunks=len(chunks)) as span:
             try:
-                response = self.index.fetch(ids=[doc_id])
-                # print(response)
-                if response["vectors"]:
-                    existing_ids.add(doc_id)
+                vectors = [(chunk_id, vector, {**metadata, "text": text})
+                           for (chunk_id, _, text, metadata), vector
+                           in zip(chunks, self.embeddings.embed_documents([chunk[2] for chunk in chunks]))]
+                for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+                    self.index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE])
             except Exception as e:
-                print(f"Error checking document ID {doc_id}: {str(e)}")
-        return existing_ids
+                # The links stay stored, so the next commit retries them
+                span.set(error=repr(e))
+                print(f"Error restoring {len(chunks)} chunks dropped as duplicates: {e}")
+                return
+            if self.lexical is not None:
+                self.index_lexical_chunks(vectors)
+            restored = {}
+            for chunk_id, source_id, _, _ in chunks:
+                restored.setdefault(source_id, []).append(chunk_id)
+            rows = self.ledger.lookup(restored)
+            for source_id, chunk_ids in restored.items():
+                if source_id in rows:
+                    row = rows[source_id]
+                    self.ledger.record(source_id, row["content_hash"],
+                                       list(dict.fromkeys(row["chunk_ids"] + chunk_ids)), row["embedding_model"])
+            self.dedup.restored(chunks)
+        print(f"Restored {len(chunks)} chunks whose duplicate was removed from the index")
     
     
     def authenticate_drive_with_service_account(self):
+        return self.drive_service_factory()()
+
+    def drive_service_factory(self):
+        """
+        Reads the service account credentials once and returns a callable that
+        builds a Drive client. googleapiclient clients are not thread safe, so
+        each crawler worker builds its own.
+        """
+        import streamlit as st
+        from googleapiclient.discovery import build
+        from google.oauth2 import service_account
+
         service_account_info = st.secrets["google_drive"]["service_account_info"]
         service_account_info = json.loads(service_account_info)
         creds = service_account.Credentials.from_service_account_info(
             service_account_info, scopes=SCOPES)
-        return build('drive', 'v3', credentials=creds)
-
-
-    def download_file_from_drive(self, service, file_id, file_name):
-        os.makedirs(TEMP_DOWNLOAD_DIR, exist_ok=True)
-        destination = os.path.join(TEMP_DOWNLOAD_DIR, file_name)
-        request = service.files().get_media(fileId=file_id)
-        with io.FileIO(destination, 'wb') as fh:
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                print(f"Fetching {int(status.progress() * 100)}% of {file_name}.")
-        return destination
-    
+        return lambda: build('drive', 'v3', credentials=creds, cache_discovery=False)
 
-    def list_files_in_drive(self, service, folder_id):
-        """Returns list of all files in a given folder and its subfolders each
-        as dict with values:
-        1.mimeType
-        2. id
-        3. name
-        """
-        files = []
-        folder_queue = [folder_id]
-        while folder_queue:
-            current_folder_id = folder_queue.pop(0)
-            query = f"'{current_folder_id}' in parents"
-            results = service.files().list(q=query, fields="files(id, name, mimeType)").execute()
-            items = results.get('files', [])
-            for item in items:
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    folder_queue.append(item['id'])
-                else:
-                    files.append(item)
-        return files
+    @telemetry.traced("ingest.drive")
+    def process_and_add_documents_from_drive(self, folder_id=None, crawler=None):
+        import streamlit as st
 
-    def process_and_add_documents_from_drive(self, folder_id=None):
         print(folder_id)
-        service = self.authenticate_drive_with_service_account()
+        crawler = crawler or DriveCrawler(self.drive_service_factory())
         # folder_id = folder_id if folder_id else self.drive_folder_id
+        progress_bar = st.progress(0.0, text="Listing Drive folders")
+        report_progress = lambda done, total, message: progress_bar.progress(min(done / max(total, 1), 1.0), text=message)
         try:
-            files = self.list_files_in_drive(service, folder_id=folder_id)
+            files = crawler.list_files(folder_id, progress=report_progress)
         except Exception as e:
+            print(f"Error listing Drive folder {folder_id}: {e}")
             st.error("Folder ID invalid or not given access")
             return
 
@@ -162,16 +381,27 @@ class DocumentProcessor:
             st.warning("No documents found in the specified folder.")
             return
 
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=200)
+        from document_loaders import iter_pages_from_bytes
+
+        # Step 1: Extract filenames (without extensions) to use as IDs, with
+        # Drive's checksum (or modified time) as the content hash
+        file_hashes = {
+            os.path.splitext(file['name'])[0]: file.get('md5Checksum') or file.get('modifiedTime')
+            for file in files
+        }
 
-        # Step 1: Extract filenames (without extensions) to use as IDs
-        filenames = [os.path.splitext(file['name'])[0] for file in files]
-        
-        # Step 2: Check if the document IDs already exist in Pinecone
-        existing_ids = self.check_existing_docs_by_id(filenames)
+        # Step 2: Find new or changed documents with one ledger lookup
+        pending_ids = self.plan_ingestion(file_hashes)
 
-        # Step 3: Filter out files that already exist in Pinecone
-        new_files = [file for file in files if os.path.splitext(file['name'])[0] not in existing_ids]
+        # Step 3: Keep only the supported files that need (re-)ingesting
+        new_files = []
+        for file in files:
+            if os.path.splitext(file['name'])[0] not in pending_ids:
+                continue
+            if not file['name'].endswith((".pdf", ".docx")):
+                print(f"Unsupported file format: {file['name']}")
+                continue
+            new_files.append(file)
 
         if not new_files:
             print("No new documents to add.")
@@ -179,138 +409,102 @@ class DocumentProcessor:
             return
         else:
             st.success("New files found. Fetching:")
-        # Step 4: Process and add only the new files to Pinecone
-        for file in new_files:
-            file_id = file['id']
+        # Step 4: Download the new files concurrently into memory and add them
+        # to Pinecone as each download finishes
+        for file, buffer, error in crawler.download_files(new_files, progress=report_progress):
             file_name = file['name']
-            st.write(f"Fetching file from Drive: {file_name}")
-
-            # Download the file temporarily
-            downloaded_path = self.download_file_from_drive(service, file_id, file_name)
-
-            # Load the file using the appropriate loader
-            if file_name.endswith(".pdf"):
-                loader = PyMuPDFLoader(file_path=downloaded_path)
-            elif file_name.endswith(".docx"):
-                loader = Docx2txtLoader(file_path=downloaded_path)
-            else:
-                print(f"Unsupported file format: {file_name}")
+            if error is not None:
+                print(f"Error fetching {file_name}: {error}")
+                st.error(f"Could not fetch {file_name} from Drive.")
                 continue
 
             filename = os.path.splitext(file_name)[0]
             # print(f"Processing document: {filename}")
             st.write(f"Processing document: {filename}")
-            
-            # Add document-level dummy vector
-            dummy_vector = [1.0] * 1536  # Ensure vector values are floats
-            self.index.upsert(vectors=[(filename, dummy_vector)])  # Add document-level vector for tracking
-
-            # Load and split the document into chunks
-            file_docs = loader.load()
-            chunks = text_splitter.split_documents(file_docs)
-            print(f"Processed {len(chunks)} chunks from document {filename}")
-
-            # Generate IDs for the chunks
-            ids = [f"{filename}_chunk_{i}" for i, _ in enumerate(chunks)]
-            
-            # Add chunk-level vectors using add_documents
-            self.vector_store.add_documents(documents=chunks, ids=ids)
+
+            # Load and split the document page by page, adding chunk-level
+            # vectors in batches as they are split, and record them in the
+            # ledger. The source keeps the path earlier temp-file ingestion
+            # recorded, so metadata is unchanged.
+            pages = iter_pages_from_bytes(buffer.getvalue(), file_name,
+                                          source=os.path.join(TEMP_DOWNLOAD_DIR, file_name))
+            buffer.close()
+            try:
+                ids = self.upsert_source_chunks(filename, split_pages(pages), file_hashes[filename])
+            finally:
+                pages.close()
+            print(f"Processed {len(ids)} chunks from document {filename}")
             st.write(f"Document processing and vector store update complete for {filename}.")
             print(f"Document processing and vector store update complete for {filename}.")
-
-            # Clean up the downloaded file
-            os.remove(downloaded_path)
+        progress_bar.empty()
 
 
-    def process_and_add_documents_from_local(self):
+    @telemetry.traced("ingest.local")
+    def process_and_add_documents_from_local(self, **pipeline_options):
         """
         Process new PDF and DOCX documents from the directory and add them to Pinecone.
-        Only new documents (not already in Pinecone) are processed.
+        Only new or changed documents are processed. Keyword arguments (worker
+        counts, batch sizes) are passed on to IngestionPipeline.
         """
         # Step 1: Get all PDF and DOCX file paths from the directory and its subdirectories
         file_paths = self.get_file_paths_from_directory_and_subdirectories()
 
-        # Step 2: Extract filenames (without extensions) to use as IDs
-        filenames = [os.path.splitext(os.path.basename(path))[0] for path in file_paths]
+        # Step 2: Extract filenames (without extensions) to use as IDs and hash their contents
+        file_hashes = {os.path.splitext(os.path.basename(path))[0]: hash_file(path) for path in file_paths}
 
-        # Step 3: Check if the document IDs already exist in Pinecone
-        existing_ids = self.check_existing_docs_by_id(filenames)
+        # Step 3: Find new or changed documents with one ledger lookup
+        pending_ids = self.plan_ingestion(file_hashes)
 
-        # Step 4: Filter out paths of files that already exist
-        new_file_paths = [path for path in file_paths if os.path.splitext(os.path.basename(path))[0] not in existing_ids]
+        # Step 4: Keep only the paths of files that need (re-)ingesting
+        new_file_paths = [path for path in file_paths if os.path.splitext(os.path.basename(path))[0] in pending_ids]
 
         if not new_file_paths:
             print("No new documents to add.")
             return
 
-        # Initialize text splitter for chunking documents
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=200)
-
-        # Step 5: Process new files
-        for file_path in new_file_paths:
-            # Load PDF or DOCX file
-            if file_path.endswith(".pdf"):
-                loader = PyMuPDFLoader(file_path=file_path)
-                print(f"Processing PDF: {file_path}")
-            elif file_path.endswith(".docx"):
-                loader = Docx2txtLoader(file_path=file_path)
-                print(f"Processing DOCX: {file_path}")
-            else:
-                print(f"Unsupported file format: {file_path}")
-                continue
-            filename = os.path.splitext(os.path.basename(file_path))[0]
-            print(filename)
-            # Step 5: Add document-level dummy vector
-            dummy_vector = [1.0] * 1536  # Ensure vector values are floats
-            self.index.upsert(vectors=[(filename, dummy_vector)])  # Add document-level vector for tracking
-
-            # Step 6: Load and split the document into chunks
-            file_docs = loader.load()
-            chunks = text_splitter.split_documents(file_docs)
-            print(f"Processed {len(chunks)} chunks from document {filename}")
-
-            # Generate IDs for the chunks
-            ids = [f"{filename}_chunk_{i}" for i, _ in enumerate(chunks)]
-            
-            # Step 7: Add chunk-level vectors using add_documents
-            self.vector_store.add_documents(documents=chunks, ids=ids)
-            print("Document processing and vector store update complete.")
-
-    def get_podcasts(self):
-        """
-        Fetches podcasts from an RSS feed and extracts MP3 URLs.
-        
-        Parameters:
-        self.rss_url (str): URL of the RSS feed.
-        
+        # Step 5: Parse, embed and upsert new files through the staged pipeline,
+        # recording each file in the ledger once all of its chunks are stored
+        if self.embed_batch_size:
+            pipeline_options.setdefault("embed_batch_size", self.embed_batch_size)
+        pipeline = IngestionPipeline(
+            self.embeddings, self.index,
+            chunk_filter=lambda source_id, ids, chunks, append: self.drop_duplicate_chunks(
+                source_id, ids, chunks, tuple, append),
+            on_upsert=self.index_lexical_chunks if self.lexical is not None else None,
+            **pipeline_options,
+        )
+        report = pipeline.run(
+            new_file_paths,
+            on_source_complete=lambda source_id, ids: self.finalize_source(source_id, ids, file_hashes[source_id]),
+        )
+        if report["failed_sources"]:
+            print(f"Failed to ingest: {report['failed_sources']}")
+        if self.dedup is not None:
+            for source_id in report["failed_sources"]:
+                self.dedup.discard(source_id)
+            report["dedup"] = self.dedup.stats()
+            print(f"Near-duplicate chunks skipped: {report['dedup']}")
+        print("Document processing and vector store update complete.")
+        return report
+
+    @telemetry.traced("podcast.poll_feeds")
+    def poll_podcast_feeds(self):
+        """
+        Polls every RSS feed in self.rss_urls with a conditional request.
+
         Returns:
-        list: A list of dictionaries with new podcast details including title, published date, and MP3 URL.
+        list: One FeedUpdate per feed. Its entries are the episodes not seen
+        before, as dictionaries with GUID, title, published date and MP3 URL.
         """
         print("Getting RSS Feed")
-        feed = feedparser.parse(self.rss_url)
-        new_podcasts = []
-
-        for entry in feed.entries:
-            mp3_url = next(
-                (enclosure.href for enclosure in entry.get('enclosures', [])
-                if enclosure.type == 'audio/mpeg'), None
-            )
-            title = entry.title.strip()
-            title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii')
-            if mp3_url:
-                podcast_info = {
-                    'title': title,
-                    'published': entry.published.strip() if 'published' in entry else entry.updated,
-                    'mp3_url': mp3_url
-                }
-                new_podcasts.append(podcast_info)
+        return self.feed_poller.poll_all(self.rss_urls)
 
-        return new_podcasts
-
-    def split_audio_with_pydub(input_path, output_dir, chunk_duration=1200):
+    def split_audio_with_pydub(self, input_path, output_dir, chunk_duration=1200):
         """
         Splits the audio file into chunks using pydub, with parallel processing.
         """
+        from pydub import AudioSegment
+
         os.makedirs(output_dir, exist_ok=True)
         audio = AudioSegment.from_file(input_path)
         total_duration = len(audio)  # Duration in milliseconds
@@ -338,6 +532,8 @@ class DocumentProcessor:
         """
         Splits the audio file into chunks using moviepy.
         """
+        from moviepy.editor import AudioFileClip
+
         os.makedirs(output_dir, exist_ok=True)
         audio_clip = AudioFileClip(input_path)
         total_duration = audio_clip.duration
@@ -350,11 +546,14 @@ class DocumentProcessor:
             chunk_path = os.path.join(output_dir, f"chunk_{i//chunk_duration:03d}.mp3")
             chunk.write_audiofile(chunk_path, codec='mp3')
 
-    def transcribe_chunk(self, chunk_path):
+    def transcribe_chunk(self, chunk_path, offset=0.0):
         """
-        Transcribes a single audio chunk using OpenAI Whisper API.
+        Transcribes a single audio chunk using OpenAI Whisper API. Returns
+        Whisper's timed segments, shifted by `offset` seconds onto the
+        episode's timeline.
         """
-        with open(chunk_path, "rb") as audio_file:
+        with open(chunk_path, "rb") as audio_file, \
+                telemetry.span("whisper.transcribe", bytes=os.path.getsize(chunk_path)) as span:
             print("Converting to text ", chunk_path)
             transcription = self.client.audio.transcriptions.create(
                 file=audio_file,
@@ -362,70 +561,184 @@ class DocumentProcessor:
                 response_format="verbose_json",
                 timestamp_granularities=["segment"]
             )
-        os.remove(chunk_path)  # Clean up chunk file after transcription
-        return transcription.text  # Collect only text
-
-    def process_podcast_audio(self, audio_url, chunk_duration=1200):
+            span.set(audio_seconds=getattr(transcription, "duration", None) or 0.0)
+        segments = getattr(transcription, "segments", None) or []
+        if not segments:
+            duration = getattr(transcription, "duration", None) or 0.0
+            return [{"start": offset, "end": offset + duration, "text": transcription.text}]
+        return [
+            {"start": round(offset + segment.start, 3), "end": round(offset + segment.end, 3), "text": segment.text}
+            for segment in segments
+        ]
+
+    def transcribe_segment(self, episode_id, segment):
         """
-        Downloads, segments, and transcribes an audio file using OpenAI Whisper API.
+        Returns the timed transcript of one audio segment, from the transcript
+        cache when this exact audio was transcribed before.
         """
-        output_dir = os.path.join(TEMP_DOWNLOAD_DIR, "chunks")
-        self.split_audio_with_moviepy(audio_url, output_dir, chunk_duration=chunk_duration)
-
-        transcripts = []
-
-        # Use ProcessPoolExecutor to transcribe each chunk in parallel
-        with ThreadPoolExecutor() as executor:
-            # Submit all transcriptions tasks to the pool
-            futures = {
-                executor.submit(self.transcribe_chunk, os.path.join(output_dir, chunk_filename)): chunk_filename
-                for chunk_filename in sorted(os.listdir(output_dir))
-            }
-            
-            # Collect results as they complete
-            for future in as_completed(futures):
-                transcripts.append(future.result())
-
-        os.rmdir(output_dir)  # Remove the chunks directory after all transcriptions are done
-        return " ".join(transcripts)
-
+        audio_hash = hash_file(segment.path)
+        timed_segments = self.transcripts.get(episode_id, segment.index, audio_hash)
+        if timed_segments is None:
+            telemetry.count("transcript_cache_misses_total")
+            timed_segments = self.transcribe_chunk(segment.path, offset=segment.start)
+            self.transcripts.put(episode_id, segment.index, audio_hash, timed_segments)
+        else:
+            telemetry.count("transcript_cache_hits_total")
+            print(f"Reusing cached transcript of {episode_id} segment {segment.index}")
+        os.remove(segment.path)  # Clean up chunk file after transcription
+        return timed_segments
 
-    def add_podcast_to_index(self, podcast_id, transcript):
+    def process_podcast_audio(self, audio_url, chunk_duration=1200, output_dir=None, submit=None, progress=None,
+                              episode_id=None):
+        """
+        Segments and transcribes an audio file using OpenAI Whisper API.
+
+        Segments are cut by stream copy while the source is read, and each one
+        is sent for transcription as soon as it is written, so segmenting and
+        transcription overlap. Cutting pauses while SEGMENT_MAX_PENDING
+        segments wait for transcription. Segment transcripts are cached per
+        `episode_id` (the audio URL by default), so a rerun after a crash only
+        transcribes the segments that were not finished. Returns the timed
+        segments of the whole episode in audio order.
+        `submit` schedules a transcription on a shared pool (one is created
+        otherwise) and `progress(done, cut)` is called as segments finish.
+        """
+        import shutil
+
+        episode_id = episode_id or audio_url
+        output_dir = output_dir or os.path.join(TEMP_DOWNLOAD_DIR, "chunks")
+        segmenter = AudioSegmenter(max_segment_seconds=chunk_duration, split_on_silence=SEGMENT_ON_SILENCE)
+        executor = None
+        if submit is None:
+            executor = ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS)
+            submit = executor.submit
+        done_count = itertools.count(1)
+
+        futures = []
+        with telemetry.span("podcast.transcribe_episode", episode=episode_id) as span:
+            try:
+                try:
+                    # ffmpeg pauses while this episode has segments waiting for transcription
+                    pending = lambda: sum(not future.done() for future in futures)
+                    for segment in segmenter.segments(audio_url, output_dir, pending=pending):
+                        print(f"Segment {segment.index} ready ({segment.start:.0f}s-{segment.end:.0f}s)")
+                        future = submit(self.transcribe_segment, episode_id, segment)
+                        if progress:
+                            future.add_done_callback(lambda _: progress(next(done_count), len(futures)))
+                        futures.append(future)
+                except Exception:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                timed_segments = [timed for future in futures for timed in future.result()]
+            finally:
+                wait(futures)
+                if executor:
+                    executor.shutdown()
+                shutil.rmtree(output_dir, ignore_errors=True)  # Remove the chunks directory after all transcriptions are done
+            span.set(segments=len(futures))
+        return timed_segments
+
+
+    @telemetry.traced("podcast.index")
+    def add_podcast_to_index(self, podcast_id, timed_segments, content_hash=None, title=None):
         """
         Splits the transcript into smaller chunks, converts each to a Document,
-        and adds them to the Pinecone index.
+        and adds them to the Pinecone index. Each chunk records the start and
+        end time (in seconds) of the audio it was transcribed from. Chunk IDs
+        use `podcast_id`; the source shown with answers is `title` if given.
+        Once indexed, the episode's cached segment transcripts are dropped.
         """
-        self.index.upsert([(podcast_id, [1.0] * self.dimensions)])
-
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=200)
-        chunks = text_splitter.split_text(transcript)
-        documents = [Document(page_content=chunk, metadata={"source": podcast_id}) for chunk in chunks]
-        self.vector_store.add_documents(documents=documents, ids=[f"{podcast_id}_chunk_{i}" for i in range(len(documents))])
-
-    def process_and_add_new_podcasts(self, latest_n=-1):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        transcript, offsets = join_timed_segments(timed_segments)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=200, add_start_index=True)
+        documents = text_splitter.create_documents([transcript], metadatas=[{"source": title or podcast_id}])
+        for document in documents:
+            start_index = document.metadata.pop("start_index")
+            start, end = time_range_for_span(timed_segments, offsets, start_index, len(document.page_content))
+            if start is not None:
+                document.metadata.update({"start_time": start, "end_time": end})
+        self.upsert_source_chunks(podcast_id, documents, content_hash or hash_text(transcript))
+        # The cache only exists to resume an interrupted episode
+        self.transcripts.discard(podcast_id)
+
+    @telemetry.traced("ingest.podcasts")
+    def process_and_add_new_podcasts(self, latest_n=None):
         """
         Main method to retrieve, process, and add new podcasts from RSS feed.
+        Episodes are keyed by their GUID. At most `latest_n` new episodes
+        are ingested (all when None or negative); the rest stay in the feed
+        backlog for later runs.
         """
+        import streamlit as st
+
         print("Fetching podcasts from RSS feed...")
         st.success("Fetching podcasts from RSS feed...")
-        podcasts = self.get_podcasts()
+        updates = self.poll_podcast_feeds()
+        for update in updates:
+            if update.error is not None:
+                st.error(f"Could not read feed {update.feed_url}")
+        podcasts = [podcast for update in updates for podcast in update.entries]
+        # Unchanged feeds without a backlog stop here, before any ledger or index lookups
+        if not podcasts:
+            st.success("No new podcasts to be ingested")
+            return
 
-        podcast_ids = [podcast["title"] for podcast in podcasts]
+        # An episode's audio URL and publish date stand in for its content hash
+        podcast_hashes = {
+            podcast["guid"]: hash_text(f"{podcast['mp3_url']}|{podcast['published']}")
+            for podcast in podcasts
+        }
         st.success("Checking dupes for podcasts")
-        existing_ids = self.check_existing_docs_by_id(podcast_ids)
-        new_podcasts = [podcast for podcast in podcasts if podcast['title'] not in existing_ids][:latest_n]
+        pending_ids = self.plan_ingestion(podcast_hashes)
+        # Episodes ingested before GUID keying are recorded under their title
+        legacy_titles = self.check_existing_docs_by_id([podcast["title"] for podcast in podcasts])
+        pending_ids -= {podcast["guid"] for podcast in podcasts if podcast["title"] in legacy_titles}
+        handled = {podcast["guid"] for podcast in podcasts if podcast["guid"] not in pending_ids}
+
+        if latest_n is not None and latest_n < 0:
+            latest_n = None
+        new_podcasts = [podcast for podcast in podcasts if podcast['guid'] in pending_ids][:latest_n]
         print(new_podcasts)
-        if new_podcasts:
-            st.success("New podcasts found.")
-            for podcast in new_podcasts:
-                podcast_id = podcast["title"]
-                st.info("Making transcription..for {}".format(podcast_id))
-                print(podcast_id)
-                transcript = self.process_podcast_audio(podcast["mp3_url"])
-                self.add_podcast_to_index(podcast_id, transcript)
-                st.success(f"Podcast '{podcast_id}' processed and added to Pinecone.")
-        else:
+        if not new_podcasts:
+            self.acknowledge_podcasts(updates, handled)
             st.success("No new podcasts to be ingested")
+            return
+
+        st.success("New podcasts found.")
+        # Episodes run concurrently, each in its own scratch directory; one
+        # status line per episode, in feed order, is updated from this thread.
+        status_lines = {podcast["guid"]: st.empty() for podcast in new_podcasts}
+        scheduler = PodcastScheduler(
+            lambda podcast, **options: self.process_podcast_audio(
+                podcast["mp3_url"], episode_id=podcast["guid"], **options),
+            lambda podcast, transcript: self.add_podcast_to_index(
+                podcast["guid"], transcript, podcast_hashes[podcast["guid"]], title=podcast["title"]),
+            scratch_dir=TEMP_DOWNLOAD_DIR,
+        )
+        try:
+            for podcast, status, error in scheduler.run(new_podcasts):
+                title = podcast["title"]
+                print(title, status, error or "")
+                if status == "failed":
+                    status_lines[podcast["guid"]].error(f"Podcast '{title}' failed: {error}")
+                elif status == "done":
+                    handled.add(podcast["guid"])
+                    status_lines[podcast["guid"]].success(f"Podcast '{title}' processed and added to Pinecone.")
+                else:
+                    status_lines[podcast["guid"]].info(f"{title}: {status}")
+        finally:
+            self.acknowledge_podcasts(updates, handled)
+
+    def acknowledge_podcasts(self, updates, guids):
+        """
+        Records handled episodes in the feed state, so the next poll skips
+        them, and keeps the others in the feed's backlog.
+        """
+        for update in updates:
+            if update.entries:
+                self.feed_poller.acknowledge(update, {p["guid"] for p in update.entries} & guids)
     
 # Example usage:
 if __name__ == "__main__": ## TESTING ##    
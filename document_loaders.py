@@ -0,0 +1,70 @@
+import io
+
+from langchain_core.documents import Document
+
+
+def iter_pdf_pages_from_bytes(data, source):
+    """
+    Yields one Document per page of a PDF held in memory, with the same
+    content and metadata PyMuPDFLoader produces for a file on disk. Only the
+    current page's text is held at a time.
+    """
+    import fitz
+
+    with fitz.open(stream=data, filetype="pdf") as pdf:
+        extra_metadata = {
+            key: value for key, value in pdf.metadata.items()
+            if isinstance(value, (str, int))
+        }
+        for page in pdf:
+            yield Document(
+                page_content=page.get_text(),
+                metadata=dict(
+                    {
+                        "source": source,
+                        "file_path": source,
+                        "page": page.number,
+                        "total_pages": len(pdf),
+                    },
+                    **extra_metadata,
+                ),
+            )
+
+
+def load_docx_from_bytes(data, source):
+    """
+    Loads a DOCX held in memory into a single Document, like Docx2txtLoader.
+    """
+    import docx2txt
+
+    return [Document(page_content=docx2txt.process(io.BytesIO(data)), metadata={"source": source})]
+
+
+def iter_pages_from_bytes(data, file_name, source=None):
+    """
+    Yields the pages of a PDF, or the single Document of a DOCX, held in
+    memory. Raises ValueError for other formats.
+    """
+    source = source or file_name
+    if file_name.endswith(".pdf"):
+        yield from iter_pdf_pages_from_bytes(data, source)
+    elif file_name.endswith(".docx"):
+        yield from load_docx_from_bytes(data, source)
+    else:
+        raise ValueError(f"Unsupported file format: {file_name}")
+
+
+def iter_file_pages(file_path):
+    """
+    Yields the pages of a PDF or DOCX file on disk through the loaders'
+    lazy_load, so a PDF is read one page at a time.
+    """
+    from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader
+
+    if file_path.endswith(".pdf"):
+        loader = PyMuPDFLoader(file_path=file_path)
+    elif file_path.endswith(".docx"):
+        loader = Docx2txtLoader(file_path=file_path)
+    else:
+        raise ValueError(f"Unsupported file format: {file_path}")
+    return loader.lazy_load()
@@ -0,0 +1,128 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import telemetry
+
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+LIST_WORKERS = int(os.getenv("DRIVE_LIST_WORKERS", 8))
+DOWNLOAD_WORKERS = int(os.getenv("DRIVE_DOWNLOAD_WORKERS", 4))
+PAGE_SIZE = 1000
+DOWNLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+LIST_FIELDS = "nextPageToken, files(id, name, mimeType, md5Checksum, modifiedTime, size)"
+
+
+class DriveCrawler:
+    """
+    Lists a Drive folder tree and downloads its files into memory.
+
+    Folders are listed concurrently and every `files().list` result is paged
+    through with `pageToken`. googleapiclient service objects are not thread
+    safe, so each worker thread builds its own from `service_factory`.
+    """
+
+    def __init__(self, service_factory, list_workers=LIST_WORKERS,
+                 download_workers=DOWNLOAD_WORKERS, page_size=PAGE_SIZE):
+        self.service_factory = service_factory
+        self.list_workers = list_workers
+        self.download_workers = download_workers
+        self.page_size = page_size
+        self._local = threading.local()
+
+    def _service(self):
+        if not hasattr(self._local, "service"):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def list_folder(self, folder_id):
+        """
+        Returns every item directly inside a folder, across all result pages.
+        """
+        items = []
+        page_token = None
+        while True:
+            results = self._service().files().list(
+                q=f"'{folder_id}' in parents",
+                fields=LIST_FIELDS,
+                pageSize=self.page_size,
+                pageToken=page_token,
+            ).execute()
+            items.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return items
+
+    def list_files(self, folder_id, progress=None):
+        """
+        Returns all non-folder files in a folder and its subfolders, each as a
+        dict with id, name, mimeType, md5Checksum, modifiedTime and size.
+        """
+        files = []
+        folders_listed = 0
+        with telemetry.span("drive.list_files") as span, \
+                ThreadPoolExecutor(self.list_workers, thread_name_prefix="drive-list") as pool:
+            in_flight = {pool.submit(self.list_folder, folder_id)}
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folders_listed += 1
+                    for item in future.result():
+                        if item["mimeType"] == FOLDER_MIME_TYPE:
+                            in_flight.add(pool.submit(self.list_folder, item["id"]))
+                        else:
+                            files.append(item)
+                if progress:
+                    progress(folders_listed, folders_listed + len(in_flight),
+                             f"Listed {folders_listed} folders, found {len(files)} files")
+            span.set(folders=folders_listed, files=len(files))
+        return files
+
+    def download_to_buffer(self, file):
+        """
+        Downloads a Drive file into an in-memory buffer.
+        """
+        from googleapiclient.http import MediaIoBaseDownload
+
+        with telemetry.span("drive.download", file=file["name"]) as span:
+            buffer = io.BytesIO()
+            request = self._service().files().get_media(fileId=file["id"])
+            downloader = MediaIoBaseDownload(buffer, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+            done = False
+            while not done:
+                _, done = downloader.next_chunk()
+            span.set(bytes=buffer.tell())
+        buffer.seek(0)
+        return buffer
+
+    def download_files(self, files, progress=None):
+        """
+        Downloads files through a bounded worker pool and yields
+        (file, buffer, error) in completion order. At most two downloads per
+        worker are held in memory before the caller consumes them.
+        """
+        window = max(1, self.download_workers * 2)
+        pending = iter(files)
+        completed = 0
+        with ThreadPoolExecutor(self.download_workers, thread_name_prefix="drive-download") as pool:
+            in_flight = {}
+            while True:
+                while len(in_flight) < window:
+                    file = next(pending, None)
+                    if file is None:
+                        break
+                    in_flight[pool.submit(self.download_to_buffer, file)] = file
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = in_flight.pop(future)
+                    completed += 1
+                    if progress:
+                        progress(completed, len(files), f"Fetched {file['name']}")
+                    try:
+                        buffer, error = future.result(), None
+                    except Exception as e:
+                        buffer, error = None, e
+                    yield file, buffer, error
@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+
+FEED_STATE_PATH = os.getenv("FEED_STATE_PATH", "./feed_state.db")
+FEED_POLL_WORKERS = int(os.getenv("FEED_POLL_WORKERS", 4))
+
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', text.strip()).encode('ascii', 'ignore').decode('ascii')
+
+
+def parse_entry(entry, feed_url):
+    """
+    Returns the podcast details of a feed entry, or None when it has no MP3
+    enclosure. The GUID falls back to the MP3 URL for feeds without one.
+    """
+    mp3_url = next(
+        (enclosure.href for enclosure in entry.get('enclosures', [])
+         if enclosure.get('type') == 'audio/mpeg'), None
+    )
+    if not mp3_url:
+        return None
+    return {
+        'guid': _ascii(entry.get('id') or mp3_url),
+        'title': _ascii(entry.get('title', '')),
+        'published': (entry.get('published') or entry.get('updated') or '').strip(),
+        'mp3_url': mp3_url,
+        'feed_url': feed_url,
+    }
+
+
+@dataclass
+class FeedUpdate:
+    feed_url: str
+    status: int
+    etag: str = None
+    modified: str = None
+    entries: list = field(default_factory=list)
+    error: Exception = None
+
+
+class FeedPoller:
+    """
+    Polls podcast RSS feeds with conditional GETs and returns only unseen
+    episodes.
+
+    For each (index, feed) pair the ETag and Last-Modified validators and the
+    GUIDs of handled episodes are kept in SQLite. An unchanged feed answers
+    304 and costs one request; a changed feed is filtered down to the GUIDs
+    not handled yet. Acknowledging a response stores its validators and
+    keeps the entries it left unhandled (episodes that failed or were
+    beyond the run's limit) as a backlog, which every later poll offers
+    again, whether or not the feed changed.
+    """
+
+    def __init__(self, index_name, path=FEED_STATE_PATH, workers=FEED_POLL_WORKERS):
+        self.index_name = index_name
+        self.path = path
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS feeds (
+                index_name TEXT NOT NULL,
+                feed_url TEXT NOT NULL,
+                etag TEXT,
+                modified TEXT,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (index_name, feed_url)
+            );
+            CREATE TABLE IF NOT EXISTS seen_entries (
+                index_name TEXT NOT NULL,
+                feed_url TEXT NOT NULL,
+                guid TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (index_name, feed_url, guid)
+            );
+            CREATE TABLE IF NOT EXISTS backlog (
+                index_name TEXT NOT NULL,
+                feed_url TEXT NOT NULL,
+                guid TEXT NOT NULL,
+                entry TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (index_name, feed_url, guid)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _validators(self, feed_url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, modified FROM feeds WHERE index_name = ? AND feed_url = ?",
+                (self.index_name, feed_url),
+            ).fetchone()
+        return row or (None, None)
+
+    def seen(self, feed_url):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT guid FROM seen_entries WHERE index_name = ? AND feed_url = ?",
+                (self.index_name, feed_url),
+            ).fetchall()
+        return {guid for guid, in rows}
+
+    def backlog(self, feed_url):
+        """
+        Entries of earlier responses that have not been handled yet.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM backlog WHERE index_name = ? AND feed_url = ? ORDER BY rowid",
+                (self.index_name, feed_url),
+            ).fetchall()
+        return [json.loads(entry) for entry, in rows]
+
+    def _save_validators(self, update):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO feeds (index_name, feed_url, etag, modified, checked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.index_name, update.feed_url, update.etag, update.modified, time.time()),
+            )
+            self._conn.commit()
+
+    def poll(self, feed_url):
+        """
+        Fetches one feed and returns a FeedUpdate holding its unseen
+        episodes, followed by any backlog no longer in the feed.
+        """
+        import feedparser
+
+        etag, modified = self._validators(feed_url)
+        feed = feedparser.parse(feed_url, etag=etag, modified=modified)
+        status = feed.get('status', 200)
+        if status == 304:
+            backlog = self.backlog(feed_url)
+            print(f"Feed unchanged: {feed_url} ({len(backlog)} backlog entries)")
+            return FeedUpdate(feed_url, status, etag, modified, backlog)
+        if feed.get('bozo') and not feed.entries:
+            print(f"Error fetching feed {feed_url}: {feed.get('bozo_exception')}")
+            return FeedUpdate(feed_url, status, etag, modified, self.backlog(feed_url),
+                              error=feed.get('bozo_exception'))
+
+        seen = self.seen(feed_url)
+        entries, guids = [], set()
+        for entry in feed.entries:
+            podcast = parse_entry(entry, feed_url)
+            if podcast and podcast['guid'] not in seen and podcast['guid'] not in guids:
+                guids.add(podcast['guid'])
+                entries.append(podcast)
+        entries += [podcast for podcast in self.backlog(feed_url) if podcast['guid'] not in guids]
+        update = FeedUpdate(feed_url, status, feed.get('etag'), feed.get('modified'), entries)
+        print(f"Feed {feed_url}: {len(entries)} new of {len(feed.entries)} entries")
+        if not entries:
+            self._save_validators(update)
+        return update
+
+    def poll_all(self, feed_urls):
+        """
+        Polls several feeds concurrently and returns their updates in order.
+        """
+        with ThreadPoolExecutor(max(1, min(self.workers, len(feed_urls)))) as pool:
+            return list(pool.map(self.poll, feed_urls))
+
+    def acknowledge(self, update, guids):
+        """
+        Marks episodes of `update` as handled, keeps its other entries as the
+        feed's backlog and stores the validators for the next conditional
+        request.
+        """
+        guids = set(guids)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO seen_entries (index_name, feed_url, guid, seen_at) VALUES (?, ?, ?, ?)",
+                [(self.index_name, update.feed_url, guid, now) for guid in guids],
+            )
+            self._conn.executemany(
+                "DELETE FROM backlog WHERE index_name = ? AND feed_url = ? AND guid = ?",
+                [(self.index_name, update.feed_url, guid) for guid in guids],
+            )
+            # INSERT OR IGNORE keeps a backlog entry's original rowid, and with it its position
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO backlog (index_name, feed_url, guid, entry, added_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.index_name, update.feed_url, entry['guid'], json.dumps(entry), now)
+                 for entry in update.entries if entry['guid'] not in guids],
+            )
+            self._conn.commit()
+        if update.error is None:
+            self._save_validators(update)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
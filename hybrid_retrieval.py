@@ -0,0 +1,135 @@
+import os
+import time
+
+from langchain_core.retrievers import BaseRetriever
+
+import telemetry
+from lexical_index import tokenize
+
+
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")  # "hybrid" or "dense"
+DENSE_ONLY_K = 40
+HYBRID_DENSE_K = int(os.getenv("HYBRID_DENSE_K", 16))
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", 16))
+HYBRID_K = int(os.getenv("HYBRID_K", 20))
+# Standard reciprocal rank fusion constant; damps the weight of top ranks.
+RRF_K = 60
+# Short queries whose terms are all this rare (fraction of chunks containing
+# them) and all occur in one chunk are answered from the lexical index alone.
+LEXICAL_ONLY_MAX_TERMS = int(os.getenv("LEXICAL_ONLY_MAX_TERMS", 4))
+LEXICAL_ONLY_MAX_DF = float(os.getenv("LEXICAL_ONLY_MAX_DF", 0.02))
+# Lexical hits are used only once the lexical index holds at least this
+# fraction of the vector index's chunks, re-checked at this interval or when
+# the lexical index changes size.
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", 0.95))
+LEXICAL_COVERAGE_CHECK_SECONDS = 300
+
+
+def _key(document):
+    return document.id or (document.metadata.get("source"), document.page_content)
+
+
+def reciprocal_rank_fusion(rankings, k=HYBRID_K, rrf_k=RRF_K):
+    """
+    Merges ranked document lists by summing 1 / (rrf_k + rank) per list.
+    """
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = _key(document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 hits from the local lexical index with dense hits from the
+    vector store, so a smaller k on each side covers both exact terms
+    (names, policies, guests) and paraphrases.
+
+    Exact-term queries, short ones made only of rare terms that one chunk
+    contains together, skip the dense search and with it the query
+    embedding request. Until the lexical index covers LEXICAL_MIN_COVERAGE
+    of the chunks in `index` (the vector index, for its vector count),
+    retrieval is dense-only with the previous k, so an index ingested before
+    the lexical one existed is not half-searched; run
+    `python lexical_index.py rebuild --index <name>` to backfill it.
+    """
+
+    vector_store: object
+    lexical: object
+    index: object = None
+    dense_k: int = HYBRID_DENSE_K
+    lexical_k: int = HYBRID_LEXICAL_K
+    k: int = HYBRID_K
+    _covered: bool = False
+    _checked: tuple = (None, None)  # (monotonic time, lexical count) of the last check
+
+    def _lexical_covers_index(self):
+        now, lexical_count = time.monotonic(), len(self.lexical)
+        checked_at, checked_count = self._checked
+        if lexical_count == checked_count and now - checked_at < LEXICAL_COVERAGE_CHECK_SECONDS:
+            return self._covered
+        self._checked = (now, lexical_count)
+        vector_count = None
+        if self.index is not None:
+            try:
+                vector_count = self.index.describe_index_stats()["total_vector_count"]
+            except Exception as e:
+                print(f"Could not count vectors for lexical coverage: {e}")
+        covered = lexical_count > 0 and (vector_count is None or lexical_count >= LEXICAL_MIN_COVERAGE * vector_count)
+        if lexical_count and not covered:
+            print(f"Lexical index holds {lexical_count} of {vector_count} chunks; retrieving dense-only "
+                  f"until it is rebuilt (python lexical_index.py rebuild --index {self.lexical.name}).")
+        self._covered = covered
+        return covered
+
+    def _is_exact_term_query(self, query, lexical_hits):
+        terms = set(tokenize(query))
+        if not lexical_hits or not 0 < len(terms) <= LEXICAL_ONLY_MAX_TERMS:
+            return False
+        max_df = max(1, LEXICAL_ONLY_MAX_DF * len(self.lexical))
+        if any(df > max_df for df in self.lexical.document_frequencies(terms).values()):
+            return False
+        return terms <= set(tokenize(lexical_hits[0][0].page_content))
+
+    def _dense_search(self, query, k, embedding=None):
+        with telemetry.span("retrieval.dense", k=k):
+            if embedding is not None:
+                return self.vector_store.similarity_search_by_vector(embedding, k=k)
+            return self.vector_store.similarity_search(query, k=k)
+
+    def search(self, query, embedding=None):
+        """
+        Retrieves for `query`; a precomputed query `embedding` (e.g. from a
+        batch request) is used instead of embedding the query again.
+        """
+        if not self._lexical_covers_index():
+            return self._dense_search(query, DENSE_ONLY_K, embedding)
+        with telemetry.span("retrieval.lexical", k=self.lexical_k) as span:
+            lexical_hits = self.lexical.search(query, self.lexical_k)
+            span.set(hits=len(lexical_hits))
+        if self._is_exact_term_query(query, lexical_hits):
+            telemetry.count("retrieval_lexical_only_total")
+            return [document for document, _ in lexical_hits[:self.k]]
+        dense_documents = self._dense_search(query, self.dense_k, embedding)
+        return reciprocal_rank_fusion([dense_documents, [document for document, _ in lexical_hits]], self.k)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.search(query)
+
+
+def build_retriever(processor):
+    """
+    Returns the hybrid retriever over a DocumentProcessor's vector store and
+    lexical index, or the dense retriever when RETRIEVAL_MODE is "dense" or
+    the processor has no lexical index.
+    """
+    lexical = getattr(processor, "lexical", None)
+    if RETRIEVAL_MODE == "dense" or lexical is None:
+        return processor.vector_store.as_retriever(search_kwargs={"k": DENSE_ONLY_K})
+    if RETRIEVAL_MODE != "hybrid":
+        raise ValueError(f"Unknown retrieval mode: {RETRIEVAL_MODE}")
+    return HybridRetriever(vector_store=processor.vector_store, lexical=lexical,
+                           index=getattr(processor, "index", None))
@@ -0,0 +1,132 @@
+"""
+Re-embeds an index into a new vector index with a different embedding size,
+then switches the index name over to it.
+
+    python index_migration.py --index test --dimensions 512
+
+Chunk text is read back from the stored vectors' metadata, so nothing is
+re-parsed or re-transcribed. Vectors already in the target with the same
+text are skipped, so an interrupted migration resumes where it stopped.
+Passes repeat until one finds nothing left to do, which also picks up chunks
+ingested into the old index meanwhile. The index name is then aliased to the
+new vector index in one file rename and its cached answers are dropped;
+running apps switch on their next turn. The old vector index is left in
+place, to delete once nothing uses it.
+"""
+import argparse
+
+import telemetry
+from ingestion_pipeline import EMBED_BATCH_SIZE, UPSERT_BATCH_SIZE
+from vector_backends import FETCH_BATCH_SIZE, resolve_index_name, set_index_alias
+
+
+MIGRATION_MAX_PASSES = 3
+DELETE_BATCH_SIZE = 1000
+
+
+def migrate_vectors(source_index, target_index, embeddings, batch_size=EMBED_BATCH_SIZE, text_key="text"):
+    """
+    One migration pass between two Pinecone-like indexes (list/fetch/upsert/
+    delete): re-embeds the stored text of every source vector that is
+    missing from the target or whose text changed, in batches of
+    `batch_size`, and deletes target vectors no longer in the source.
+    Returns counts for the pass.
+    """
+    counts = {"checked": 0, "embedded": 0, "unchanged": 0, "without_text": 0, "deleted": 0}
+    pending = []
+
+    def flush():
+        with telemetry.span("migration.embed", batch_size=len(pending)):
+            vectors = embeddings.embed_documents([metadata[text_key] for _, metadata in pending])
+        records = [(vector_id, vector, metadata) for (vector_id, metadata), vector in zip(pending, vectors)]
+        for start in range(0, len(records), UPSERT_BATCH_SIZE):
+            target_index.upsert(vectors=records[start:start + UPSERT_BATCH_SIZE])
+        counts["embedded"] += len(records)
+        pending.clear()
+
+    source_ids = set()
+    for page in source_index.list(limit=FETCH_BATCH_SIZE):
+        for start in range(0, len(page), FETCH_BATCH_SIZE):
+            ids = page[start:start + FETCH_BATCH_SIZE]
+            source_ids.update(ids)
+            fetched = source_index.fetch(ids=ids)["vectors"]
+            migrated = target_index.fetch(ids=ids)["vectors"]
+            for vector_id, vector in fetched.items():
+                counts["checked"] += 1
+                metadata = vector.get("metadata") or {}
+                if not metadata.get(text_key):
+                    counts["without_text"] += 1
+                    continue
+                if (migrated.get(vector_id, {}).get("metadata") or {}).get(text_key) == metadata[text_key]:
+                    counts["unchanged"] += 1
+                    continue
+                pending.append((vector_id, metadata))
+                if len(pending) >= batch_size:
+                    flush()
+        print(f"Checked {counts['checked']} vectors, re-embedded {counts['embedded']}.")
+    if pending:
+        flush()
+
+    stale = [vector_id for page in target_index.list(limit=FETCH_BATCH_SIZE)
+             for vector_id in page if vector_id not in source_ids]
+    for start in range(0, len(stale), DELETE_BATCH_SIZE):
+        target_index.delete(ids=stale[start:start + DELETE_BATCH_SIZE])
+    counts["deleted"] = len(stale)
+    return counts
+
+
+def migrate_index(index_name, dimensions, target_name=None, batch_size=EMBED_BATCH_SIZE,
+                  max_passes=MIGRATION_MAX_PASSES, switch=True):
+    """
+    Migrates the vector index behind `index_name` to a `dimensions`-sized
+    one named `target_name` (default "{index_name}-{dimensions}") and, once
+    a pass finds nothing left to migrate, aliases the name to it. Returns
+    True if the name was switched.
+    """
+    from answer_cache import invalidate_answer_cache
+    from data_ingestion import DocumentProcessor
+
+    source = DocumentProcessor(index_name=index_name)
+    target_name = target_name or f"{index_name}-{dimensions}"
+    if target_name == source.vector_index_name:
+        raise ValueError(f"Index '{index_name}' is already served by '{target_name}'.")
+    existing_dimensions = source.vector_index_dimension(target_name)
+    if existing_dimensions not in (None, dimensions):
+        raise ValueError(f"Vector index '{target_name}' exists with dimension {existing_dimensions}.")
+    target = DocumentProcessor(index_name=index_name, dimensions=dimensions, vector_index_name=target_name)
+    print(f"Migrating '{index_name}' from '{source.vector_index_name}' ({source.dimensions} dimensions) "
+          f"to '{target_name}' ({dimensions} dimensions)")
+
+    for attempt in range(1, max_passes + 1):
+        with telemetry.span("migration.pass", index=index_name, attempt=attempt) as span:
+            counts = migrate_vectors(source.index, target.index, target.embeddings, batch_size)
+            span.set(**counts)
+        print(f"Pass {attempt}: {counts}")
+        if not counts["embedded"] and not counts["deleted"]:
+            break
+    else:
+        print(f"'{index_name}' was still changing after {max_passes} passes; rerun to finish and switch.")
+        return False
+
+    if not switch:
+        print(f"'{target_name}' is up to date; rerun without --no-switch to switch '{index_name}' to it.")
+        return False
+    set_index_alias(index_name, target_name)
+    invalidate_answer_cache(index_name)
+    print(f"'{index_name}' now served by '{resolve_index_name(index_name)}'. "
+          f"'{source.vector_index_name}' can be deleted once nothing uses it.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-embed an index at another embedding size and switch to it.")
+    parser.add_argument("--index", required=True, help="Index name to migrate.")
+    parser.add_argument("--dimensions", type=int, required=True, help="Embedding dimensions of the new index.")
+    parser.add_argument("--target", help="Name of the new vector index (default: {index}-{dimensions}).")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding request.")
+    parser.add_argument("--max-passes", type=int, default=MIGRATION_MAX_PASSES)
+    parser.add_argument("--no-switch", action="store_true", help="Migrate without switching the index name over.")
+    args = parser.parse_args()
+
+    migrate_index(args.index, args.dimensions, args.target, args.batch_size, args.max_passes,
+                  switch=not args.no_switch)
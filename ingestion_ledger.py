@@ -0,0 +1,211 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+LEDGER_PATH = os.getenv("INGESTION_LEDGER_PATH", "./ingestion_ledger.db")
+CHUNK_ID_PATTERN = re.compile(r"^(?P<source>.+)_chunk_(?P<index>\d+)$")
+# SQLite's default limit on bound parameters per statement is 999.
+LOOKUP_BATCH_SIZE = 500
+
+
+def hash_file(path, block_size=1 << 20):
+    """
+    Returns the sha256 hex digest of a file's contents, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text):
+    """
+    Returns the sha256 hex digest of a string.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestionLedger:
+    """
+    Local SQLite record of what has been ingested into each index.
+
+    Every source (local file, Drive file or podcast episode) gets one row per
+    index holding its content hash, the chunk IDs written for it and the
+    embedding model used. This replaces the per-ID Pinecone fetches and the
+    document-level dummy vectors previously used to detect ingested documents.
+    """
+
+    def __init__(self, index_name, path=LEDGER_PATH):
+        self.index_name = index_name
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                index_name TEXT NOT NULL,
+                source_id TEXT NOT NULL,
+                content_hash TEXT,
+                chunk_ids TEXT NOT NULL,
+                embedding_model TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (index_name, source_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, source_ids):
+        """
+        Bulk lookup of ledger rows. Returns a dict of source_id -> row dict
+        for the IDs that have been ingested into this index.
+        """
+        source_ids = list(dict.fromkeys(source_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(source_ids), LOOKUP_BATCH_SIZE):
+                batch = source_ids[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    "SELECT source_id, content_hash, chunk_ids, embedding_model, updated_at "
+                    f"FROM sources WHERE index_name = ? AND source_id IN ({placeholders})",
+                    [self.index_name, *batch],
+                ).fetchall()
+                for source_id, content_hash, chunk_ids, embedding_model, updated_at in rows:
+                    found[source_id] = {
+                        "content_hash": content_hash,
+                        "chunk_ids": json.loads(chunk_ids),
+                        "embedding_model": embedding_model,
+                        "updated_at": updated_at,
+                    }
+        return found
+
+    def plan(self, sources, embedding_model):
+        """
+        Splits sources into what needs ingesting.
+
+        sources: dict of source_id -> content hash.
+        Returns (new_ids, changed_ids, unchanged_ids). A source counts as
+        changed when its hash or embedding model differs from the ledger.
+        Rows created by `reconcile_from_index` have no hash yet; those are
+        treated as unchanged and adopt the hash seen now.
+        """
+        existing = self.lookup(sources.keys())
+        new_ids, changed_ids, unchanged_ids = [], [], []
+        adopted = []
+        for source_id, content_hash in sources.items():
+            row = existing.get(source_id)
+            if row is None:
+                new_ids.append(source_id)
+            elif row["content_hash"] is None:
+                adopted.append((source_id, content_hash))
+                unchanged_ids.append(source_id)
+            elif row["content_hash"] != content_hash or row["embedding_model"] not in (None, embedding_model):
+                changed_ids.append(source_id)
+            else:
+                unchanged_ids.append(source_id)
+        if adopted:
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE sources SET content_hash = ? WHERE index_name = ? AND source_id = ?",
+                    [(content_hash, self.index_name, source_id) for source_id, content_hash in adopted],
+                )
+                self._conn.commit()
+        return new_ids, changed_ids, unchanged_ids
+
+    def record(self, source_id, content_hash, chunk_ids, embedding_model):
+        """
+        Records a completed ingestion of a source, replacing any previous row.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources "
+                "(index_name, source_id, content_hash, chunk_ids, embedding_model, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.index_name, source_id, content_hash, json.dumps(list(chunk_ids)),
+                 embedding_model, time.time()),
+            )
+            self._conn.commit()
+
+    def remove(self, source_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sources WHERE index_name = ? AND source_id = ?",
+                (self.index_name, source_id),
+            )
+            self._conn.commit()
+
+    def source_ids(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source_id FROM sources WHERE index_name = ?", (self.index_name,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def reconcile_from_index(self, index, embedding_model=None, drop_markers=False):
+        """
+        Rebuilds this index's ledger rows from the IDs stored in the vector index.
+
+        Chunk vectors are grouped by their `{source}_chunk_{i}` ID. Bare IDs are
+        the old document-level dummy vectors; they mark a source as ingested and
+        are deleted from the index when drop_markers is set. Content hashes are
+        unknown at this point and get filled in on the next ingestion run.
+        """
+        chunks_by_source = {}
+        markers = []
+        for page in index.list():
+            for vector_id in page:
+                match = CHUNK_ID_PATTERN.match(vector_id)
+                if match:
+                    chunks_by_source.setdefault(match.group("source"), []).append(
+                        (int(match.group("index")), vector_id))
+                else:
+                    markers.append(vector_id)
+
+        for marker in markers:
+            chunks_by_source.setdefault(marker, [])
+
+        with self._lock:
+            self._conn.execute("DELETE FROM sources WHERE index_name = ?", (self.index_name,))
+            self._conn.executemany(
+                "INSERT INTO sources "
+                "(index_name, source_id, content_hash, chunk_ids, embedding_model, updated_at) "
+                "VALUES (?, ?, NULL, ?, ?, ?)",
+                [
+                    (self.index_name, source_id, json.dumps([vid for _, vid in sorted(chunks)]),
+                     embedding_model, time.time())
+                    for source_id, chunks in chunks_by_source.items()
+                ],
+            )
+            self._conn.commit()
+
+        if drop_markers and markers:
+            for start in range(0, len(markers), 1000):
+                index.delete(ids=markers[start:start + 1000])
+        print(f"Reconciled {len(chunks_by_source)} sources ({len(markers)} marker vectors) "
+              f"for index '{self.index_name}'.")
+        return len(chunks_by_source)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the local ingestion ledger from an existing index.")
+    parser.add_argument("--index", required=True, help="Name of the index to reconcile.")
+    parser.add_argument("--drop-markers", action="store_true",
+                        help="Delete the old document-level dummy vectors after reconciling.")
+    args = parser.parse_args()
+
+    from data_ingestion import DocumentProcessor
+    processor = DocumentProcessor(index_name=args.index)
+    processor.ledger.reconcile_from_index(processor.index, processor.embedding_model,
+                                          drop_markers=args.drop_markers)
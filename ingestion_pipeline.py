@@ -0,0 +1,359 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import telemetry
+from document_loaders import iter_file_pages
+
+
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 2))
+EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 2))
+UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", 4))
+# OpenAI accepts up to 2048 inputs per embedding request; 512 chunks of
+# ~700 characters keeps requests well filled without hitting token limits.
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 512))
+UPSERT_BATCH_SIZE = int(os.getenv("INGEST_UPSERT_BATCH_SIZE", 100))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+# Parse workers hand chunks over in batches of this size as they split
+# pages, so no stage holds a whole document's chunks.
+PARSE_BATCH_SIZE = int(os.getenv("INGEST_PARSE_BATCH_SIZE", 256))
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 200
+
+_DONE = object()
+# Per parse worker (process or thread): the queue its chunk batches go to
+_worker = threading.local()
+
+
+def source_id_for_path(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def split_pages(pages, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Splits Documents one at a time as they are loaded, yielding the same
+    chunks, in the same order, as `split_documents` on the whole list.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    for page in pages:
+        yield from text_splitter.split_documents([page])
+
+
+def load_and_split_file(file_path):
+    """
+    Loads a PDF or DOCX file page by page and splits it into chunks.
+
+    Runs inside the parse process pool, so the chunks are yielded lazily as
+    plain (page_content, metadata) tuples rather than Document objects.
+    """
+    chunks = split_pages(iter_file_pages(file_path))
+    return source_id_for_path(file_path), ((chunk.page_content, chunk.metadata) for chunk in chunks)
+
+
+def _open_channel(channel):
+    _worker.channel = channel
+
+
+def _stream_parse(parse_fn, file_path, batch_size):
+    """
+    Runs `parse_fn` in a parse worker and sends its chunks to the pipeline
+    in batches, the last one flagged. Returns (source_id, chunks, seconds).
+    """
+    started = time.perf_counter()
+    source_id, chunks = parse_fn(file_path)
+    batch, count = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            _worker.channel.put((file_path, source_id, batch, False))
+            count += len(batch)
+            batch = []
+    _worker.channel.put((file_path, source_id, batch, True))
+    return source_id, count + len(batch), time.perf_counter() - started
+
+
+class StageStats:
+    """
+    Thread-safe item/batch/error counters and busy time for one pipeline stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.batches += 1
+            self.busy_seconds += seconds
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def as_dict(self, wall_seconds):
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+
+
+class IngestionPipeline:
+    """
+    Staged ingestion: a process pool parses and splits files, a batcher packs
+    chunks from many files into full embedding requests, and embedding and
+    upsert thread pools run concurrently. Stages are joined by bounded queues
+    so a slow stage holds back the ones before it. Parse workers stream
+    chunks in `parse_batch_size` batches while they read a file page by
+    page, so memory is bounded by the batch and queue sizes, not by the
+    largest document, and a long file's first chunks are upserted while the
+    rest is still being parsed.
+
+    `embeddings` needs `embed_documents(texts)` and `index` needs
+    `upsert(vectors=[(id, values, metadata), ...])`, so offline fakes can stand
+    in for OpenAI and Pinecone. Vectors are written the way PineconeVectorStore
+    writes them: IDs are `{source}_chunk_{i}` and the chunk text is stored
+    under `text_key` in the metadata. `parse_fn(path)` returns the source ID
+    and an iterable of (text, metadata) chunks. `chunk_filter(source_id,
+    ids, chunks, append)` may drop chunks (e.g. near-duplicates) before they
+    are embedded and returns the kept ids and chunks; it is called once per
+    streamed batch, with `append` True after a source's first batch.
+    `on_upsert(vectors)` is called with every batch of vectors once it is
+    stored (e.g. to index its text).
+    """
+
+    def __init__(self, embeddings, index,
+                 parse_workers=PARSE_WORKERS,
+                 embed_workers=EMBED_WORKERS,
+                 upsert_workers=UPSERT_WORKERS,
+                 embed_batch_size=EMBED_BATCH_SIZE,
+                 upsert_batch_size=UPSERT_BATCH_SIZE,
+                 queue_size=QUEUE_SIZE,
+                 parse_batch_size=PARSE_BATCH_SIZE,
+                 text_key="text",
+                 parse_fn=load_and_split_file,
+                 parse_executor_cls=ProcessPoolExecutor,
+                 chunk_filter=None,
+                 on_upsert=None):
+        self.embeddings = embeddings
+        self.index = index
+        self.parse_workers = parse_workers
+        self.embed_workers = embed_workers
+        self.upsert_workers = upsert_workers
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.queue_size = queue_size
+        self.parse_batch_size = parse_batch_size
+        self.text_key = text_key
+        self.parse_fn = parse_fn
+        self.parse_executor_cls = parse_executor_cls
+        self.chunk_filter = chunk_filter
+        self.on_upsert = on_upsert
+
+    def run(self, file_paths, on_source_complete=None):
+        """
+        Ingests the given files and returns a dict of per-stage stats.
+
+        on_source_complete(source_id, chunk_ids) is called once every chunk of
+        a source has been upserted. Sources that fail in any stage are listed
+        under "failed_sources" and never reported as complete.
+        """
+        self.stats = {name: StageStats(name) for name in ("parse", "embed", "upsert")}
+        self._chunk_queue = queue.Queue(maxsize=self.queue_size)
+        self._embed_queue = queue.Queue(maxsize=self.queue_size)
+        self._upsert_queue = queue.Queue(maxsize=self.queue_size * self.embed_workers)
+        self._pending = {}
+        self._chunk_ids = {}
+        self._next_chunk = {}
+        self._sealed = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._on_source_complete = on_source_complete
+
+        started = time.perf_counter()
+        batcher = threading.Thread(target=self._batch_stage, name="ingest-batcher", daemon=True)
+        batcher.start()
+        with ThreadPoolExecutor(self.embed_workers, thread_name_prefix="ingest-embed") as embed_pool, \
+                ThreadPoolExecutor(self.upsert_workers, thread_name_prefix="ingest-upsert") as upsert_pool:
+            embed_futures = [embed_pool.submit(self._embed_stage) for _ in range(self.embed_workers)]
+            upsert_futures = [upsert_pool.submit(self._upsert_stage) for _ in range(self.upsert_workers)]
+
+            try:
+                self._parse_stage(file_paths)
+            finally:
+                self._chunk_queue.put(_DONE)
+            batcher.join()
+            for future in embed_futures:
+                future.result()
+            for _ in upsert_futures:
+                self._upsert_queue.put(_DONE)
+            for future in upsert_futures:
+                future.result()
+
+        wall = time.perf_counter() - started
+        report = {name: stage.as_dict(wall) for name, stage in self.stats.items()}
+        report["wall_seconds"] = round(wall, 3)
+        report["failed_sources"] = sorted(self._failed)
+        print(f"Ingestion pipeline finished in {wall:.1f}s: "
+              + ", ".join(f"{name} {report[name]['items']} ({report[name]['items_per_second']}/s)"
+                          for name in self.stats))
+        return report
+
+    def _parse_stage(self, file_paths):
+        # Keep at most two files per worker in flight. Workers block on the
+        # bounded channel, and this thread on the chunk queue, while later
+        # stages catch up.
+        window = max(1, self.parse_workers * 2)
+        remaining = iter(file_paths)
+        exhausted = False
+        if issubclass(self.parse_executor_cls, ProcessPoolExecutor):
+            channel = multiprocessing.Queue(maxsize=self.queue_size)
+        else:
+            channel = queue.Queue(maxsize=self.queue_size)
+        with self.parse_executor_cls(max_workers=self.parse_workers, initializer=_open_channel,
+                                     initargs=(channel,)) as pool:
+            in_flight = {}
+            # Files whose last batch has not been received, by path
+            streaming = {}
+            while not exhausted or in_flight or streaming:
+                while not exhausted and len(in_flight) < window:
+                    path = next(remaining, None)
+                    if path is None:
+                        exhausted = True
+                        break
+                    in_flight[pool.submit(_stream_parse, self.parse_fn, path, self.parse_batch_size)] = path
+                    streaming[path] = True
+                try:
+                    path, source_id, chunks, last = channel.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+                else:
+                    if path in streaming:
+                        if last:
+                            del streaming[path]
+                        self._chunk_queue.put((source_id, chunks, last))
+                for future in [future for future in in_flight if future.done()]:
+                    path = in_flight.pop(future)
+                    try:
+                        source_id, count, seconds = future.result()
+                    except Exception as e:
+                        # Batches already sent are embedded, but the source never completes
+                        streaming.pop(path, None)
+                        self.stats["parse"].error()
+                        with self._lock:
+                            self._failed.add(source_id_for_path(path))
+                        telemetry.record_span("ingest.parse", 0.0, error=e, source=source_id_for_path(path))
+                        print(f"Error parsing {path}: {e}")
+                        continue
+                    self.stats["parse"].add(1, seconds)
+                    telemetry.record_span("ingest.parse", seconds, source=source_id, chunks=count)
+                    print(f"Processed {count} chunks from document {source_id}")
+
+    def _batch_stage(self):
+        batch = []
+        while True:
+            item = self._chunk_queue.get()
+            if item is _DONE:
+                break
+            source_id, chunks, last = item
+            # IDs number a source's chunks in file order, whatever the batching
+            append = source_id in self._next_chunk
+            start = self._next_chunk.get(source_id, 0)
+            self._next_chunk[source_id] = start + len(chunks)
+            ids = [f"{source_id}_chunk_{i}" for i in range(start, start + len(chunks))]
+            if self.chunk_filter and chunks:
+                try:
+                    ids, chunks = self.chunk_filter(source_id, ids, chunks, append)
+                except Exception as e:
+                    print(f"Chunk filter failed for {source_id}, keeping all chunks: {e}")
+            with self._lock:
+                self._chunk_ids.setdefault(source_id, []).extend(ids)
+                self._pending[source_id] = self._pending.get(source_id, 0) + len(chunks)
+                if last:
+                    self._sealed.add(source_id)
+                finished = last and self._pending[source_id] == 0
+            if finished:
+                self._complete(source_id)
+            for chunk_id, (text, metadata) in zip(ids, chunks):
+                batch.append((source_id, chunk_id, text, metadata))
+                if len(batch) >= self.embed_batch_size:
+                    self._embed_queue.put(batch)
+                    batch = []
+        if batch:
+            self._embed_queue.put(batch)
+        for _ in range(self.embed_workers):
+            self._embed_queue.put(_DONE)
+
+    def _embed_stage(self):
+        while True:
+            batch = self._embed_queue.get()
+            if batch is _DONE:
+                return
+            started = time.perf_counter()
+            with telemetry.span("ingest.embed", batch_size=len(batch)) as span:
+                try:
+                    vectors = self.embeddings.embed_documents([text for _, _, text, _ in batch])
+                except Exception as e:
+                    span.set(error=repr(e))
+                    self.stats["embed"].error()
+                    self._fail_batch(batch, e)
+                    continue
+            self.stats["embed"].add(len(batch), time.perf_counter() - started)
+            records = [
+                (source_id, (chunk_id, vector, {**metadata, self.text_key: text}))
+                for (source_id, chunk_id, text, metadata), vector in zip(batch, vectors)
+            ]
+            for start in range(0, len(records), self.upsert_batch_size):
+                self._upsert_queue.put(records[start:start + self.upsert_batch_size])
+
+    def _upsert_stage(self):
+        while True:
+            records = self._upsert_queue.get()
+            if records is _DONE:
+                return
+            started = time.perf_counter()
+            with telemetry.span("ingest.upsert", batch_size=len(records)) as span:
+                try:
+                    self.index.upsert(vectors=[vector for _, vector in records])
+                    if self.on_upsert:
+                        self.on_upsert([vector for _, vector in records])
+                except Exception as e:
+                    span.set(error=repr(e))
+                    self.stats["upsert"].error()
+                    self._fail_batch(records, e)
+                    continue
+            self.stats["upsert"].add(len(records), time.perf_counter() - started)
+            finished = []
+            with self._lock:
+                for source_id, _ in records:
+                    self._pending[source_id] -= 1
+                    if self._pending[source_id] == 0 and source_id in self._sealed:
+                        finished.append(source_id)
+            for source_id in finished:
+                self._complete(source_id)
+
+    def _fail_batch(self, batch, error):
+        sources = {item[0] for item in batch}
+        with self._lock:
+            self._failed.update(sources)
+        print(f"Error ingesting chunks of {sorted(sources)}: {error}")
+
+    def _complete(self, source_id):
+        with self._lock:
+            if source_id in self._failed:
+                return
+            ids = self._chunk_ids.pop(source_id)
+        if self._on_source_complete:
+            self._on_source_complete(source_id, ids)
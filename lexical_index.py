@@ -0,0 +1,223 @@
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from langchain_core.documents import Document
+
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./lexical_index")
+BM25_K1 = 1.2
+BM25_B = 0.75
+FETCH_BATCH_SIZE = 100
+# SQLite's default limit on bound parameters per statement is 999.
+LOOKUP_BATCH_SIZE = 500
+WORD_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you
+your yours tell explain describe say says said give show
+""".split())
+
+
+def tokenize(text):
+    """
+    Lower-cased word tokens without stopwords or single characters.
+    """
+    return [word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    BM25 index over chunk text, kept next to the vector index.
+
+    Postings (term, row, term frequency, document length) are stored in a
+    clustered SQLite table, so opening an index reads two numbers and a
+    query reads only the postings of its own terms. Adding a chunk ID that
+    is already indexed replaces it, and deleting removes its postings, so
+    the ingestion paths can keep it current without rebuilds. The chunk
+    count and total length are re-read whenever another connection (e.g. an
+    ingestion run in another process) has committed since.
+    """
+
+    def __init__(self, name, directory=LEXICAL_INDEX_DIR, text_key="text"):
+        self.name = name
+        self.text_key = text_key
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (term, row)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_row ON postings (row);
+            """
+        )
+        self._conn.commit()
+        self._data_version = None
+        with self._lock:
+            self._refresh_counts()
+
+    def _refresh_counts(self):
+        # data_version changes only when another connection commits
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self.doc_count, self.total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+            self._data_version = version
+
+    def __len__(self):
+        with self._lock:
+            self._refresh_counts()
+            return self.doc_count
+
+    def _delete_rows(self, ids):
+        removed = []
+        for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[start:start + LOOKUP_BATCH_SIZE]
+            removed += self._conn.execute(
+                f"SELECT row, length FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall()
+        if removed:
+            self._conn.executemany("DELETE FROM postings WHERE row = ?", [(row,) for row, _ in removed])
+            self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row, _ in removed])
+            self.doc_count -= len(removed)
+            self.total_length -= sum(length for _, length in removed)
+        return len(removed)
+
+    def add(self, ids, texts, metadatas=None):
+        """
+        Indexes chunks under their vector IDs, replacing earlier versions.
+        """
+        ids = list(ids)
+        metadatas = metadatas or [{} for _ in ids]
+        tokenized = [Counter(tokenize(text)) for text in texts]
+        with self._lock:
+            self._delete_rows(ids)
+            for chunk_id, text, metadata, counts in zip(ids, texts, metadatas, tokenized):
+                length = sum(counts.values())
+                metadata = {key: value for key, value in metadata.items() if key != self.text_key}
+                row = self._conn.execute(
+                    "INSERT INTO chunks (id, length, text, metadata) VALUES (?, ?, ?, ?)",
+                    (chunk_id, length, text, json.dumps(metadata)),
+                ).lastrowid
+                self._conn.executemany(
+                    "INSERT INTO postings (term, row, tf, length) VALUES (?, ?, ?, ?)",
+                    [(term, row, tf, length) for term, tf in counts.items()],
+                )
+                self.doc_count += 1
+                self.total_length += length
+            self._conn.commit()
+
+    def delete(self, ids):
+        with self._lock:
+            removed = self._delete_rows(list(ids))
+            self._conn.commit()
+        return removed
+
+    def _postings(self, terms):
+        import numpy as np
+
+        with self._lock:
+            return {term: np.array(self._conn.execute(
+                "SELECT row, tf, length FROM postings WHERE term = ?", (term,)).fetchall(),
+                dtype=np.int64).reshape(-1, 3) for term in terms}
+
+    def document_frequencies(self, terms):
+        with self._lock:
+            return {term: self._conn.execute(
+                "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0] for term in terms}
+
+    def search(self, query, k=20):
+        """
+        Returns up to k (Document, BM25 score) pairs, best first.
+        """
+        import numpy as np
+
+        terms = list(dict.fromkeys(tokenize(query)))
+        doc_count = len(self)
+        if not terms or not doc_count:
+            return []
+        postings = [p for p in self._postings(terms).values() if len(p)]
+        if not postings:
+            return []
+        average_length = self.total_length / doc_count
+        rows, scores = [], []
+        for p in postings:
+            idf = math.log(1 + (doc_count - len(p) + 0.5) / (len(p) + 0.5))
+            tf, length = p[:, 1].astype(np.float64), p[:, 2]
+            rows.append(p[:, 0])
+            scores.append(idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)))
+        unique_rows, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        k = min(k, len(unique_rows))
+        best = np.argpartition(-totals, k - 1)[:k]
+        best = best[np.argsort(-totals[best])]
+        return [(document, float(totals[i])) for i, document in zip(best, self._documents(unique_rows[best]))]
+
+    def _documents(self, rows):
+        rows = [int(row) for row in rows]
+        with self._lock:
+            found = {row: (chunk_id, text, metadata) for row, chunk_id, text, metadata in self._conn.execute(
+                f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(rows))})", rows)}
+        return [Document(page_content=found[row][1], metadata=json.loads(found[row][2]), id=found[row][0])
+                for row in rows]
+
+    def rebuild_from(self, index, batch_size=FETCH_BATCH_SIZE):
+        """
+        Indexes every vector's stored text from a Pinecone-like index
+        (list/fetch), e.g. to backfill an index built before this one existed.
+        """
+        indexed = 0
+        for page in index.list(limit=batch_size):
+            for start in range(0, len(page), batch_size):
+                fetched = index.fetch(ids=page[start:start + batch_size])["vectors"]
+                chunks = [(vector_id, vector.get("metadata") or {}) for vector_id, vector in fetched.items()]
+                chunks = [(vector_id, metadata) for vector_id, metadata in chunks if metadata.get(self.text_key)]
+                self.add([vector_id for vector_id, _ in chunks],
+                         [metadata[self.text_key] for _, metadata in chunks],
+                         [metadata for _, metadata in chunks])
+                indexed += len(chunks)
+            print(f"Indexed {indexed} chunks.")
+        return indexed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or query the local BM25 index of a vector index.")
+    parser.add_argument("command", choices=["rebuild", "search"])
+    parser.add_argument("--index", required=True, help="Vector index name.")
+    parser.add_argument("--query", help="Query for the search command.")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        from data_ingestion import DocumentProcessor
+        processor = DocumentProcessor(index_name=args.index)
+        processor.lexical.rebuild_from(processor.index)
+    else:
+        for document, score in LexicalIndex(args.index).search(args.query or "", args.k):
+            print(f"{score:7.3f}  {document.id}  {document.page_content[:100]!r}")
@@ -0,0 +1,456 @@
+"""
+Client-side rate limiting for every OpenAI call the app makes.
+
+Each OpenAI client (the SDK client used for Whisper, OpenAIEmbeddings and the
+ChatOpenAI models) is built with an httpx transport that passes every
+request through one shared RateLimitScheduler:
+
+- Token buckets per model hold requests per minute and tokens per minute.
+  Their capacity follows the x-ratelimit-* headers OpenAI returns, starting
+  from OPENAI_RATE_LIMITS.
+- 429 and 5xx responses pause the model for the Retry-After time (or an
+  exponential backoff) and the request is retried, instead of failing the
+  file or episode that sent it.
+- Interactive calls (chat) go first: background calls (ingestion, batches)
+  wait while interactive ones are waiting, and leave a reserve of each
+  bucket for them.
+"""
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import telemetry
+
+
+OPENAI_SCHEDULER_ENABLED = os.getenv("OPENAI_SCHEDULER_ENABLED", "true").lower() == "true"
+# Starting limits per model as [requests per minute, tokens per minute]; the
+# response headers replace them with the account's real limits.
+DEFAULT_RATE_LIMITS = {
+    "gpt-4o": [5000, 800000],
+    "gpt-4o-mini": [5000, 4000000],
+    "text-embedding-3-small": [5000, 5000000],
+    "whisper-1": [500, None],
+    "default": [500, 200000],
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("OPENAI_RATE_LIMITS", "{}"))}
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 6))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+# Share of each bucket that only interactive calls may use
+INTERACTIVE_RESERVE = float(os.getenv("OPENAI_INTERACTIVE_RESERVE", 0.1))
+# Completion tokens assumed for chat requests that set no max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+# OpenAI accepts at most 2048 inputs and 300k tokens per embedding request
+MAX_EMBEDDING_INPUTS = 2048
+MAX_EMBEDDING_REQUEST_TOKENS = 300000
+# Requests are split below this share of the token limit, leaving room for
+# counting differences between tiktoken and the API
+EMBEDDING_TOKEN_MARGIN = 0.9
+# Embedding batches are sized to use this many seconds of the token rate
+BATCH_WINDOW_SECONDS = 10
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+MULTIPART_MODEL_PATTERN = re.compile(rb'name="model"\r\n\r\n([^\r\n]+)')
+DURATION_PATTERN = re.compile(r"([\d.]+)(ms|s|m|h)")
+
+_priority = contextvars.ContextVar("openai_priority", default=None)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """
+    Runs OpenAI calls made in this block (and in tasks or LangChain steps it
+    starts) at `level`, INTERACTIVE or BACKGROUND. Without it, chat
+    completions are interactive and embeddings and transcriptions background.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def parse_duration(value):
+    """
+    Parses OpenAI reset durations such as "1s", "6m0s" or "20ms" to seconds.
+    """
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * units[unit] for amount, unit in DURATION_PATTERN.findall(value or ""))
+
+
+def retry_delay(headers, attempt):
+    """
+    Seconds to wait before retrying, from Retry-After(-ms) or the rate-limit
+    reset headers, or an exponential backoff with jitter.
+    """
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    reset = max(parse_duration(headers.get("x-ratelimit-reset-requests")),
+                parse_duration(headers.get("x-ratelimit-reset-tokens")))
+    if reset:
+        return reset
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_for(self, amount, reserve=0.0):
+        """
+        Seconds until `amount` is available above `reserve` of the capacity.
+        """
+        needed = min(amount, self.capacity) + reserve * self.capacity - self.level
+        return max(0.0, needed * 60 / self.capacity)
+
+    def resize(self, capacity):
+        if capacity and capacity != self.capacity:
+            self.level = self.level * capacity / self.capacity
+            self.capacity = float(capacity)
+
+
+class ModelLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.interactive_waiting = 0
+        self.stats = {"requests": 0, "retries": 0, "wait_seconds": 0.0}
+
+
+class Call:
+    __slots__ = ("model", "tokens", "priority")
+
+    def __init__(self, model, tokens, priority):
+        self.model = model
+        self.tokens = tokens
+        self.priority = priority
+
+
+def _estimate_tokens(payload):
+    def count(value):
+        if isinstance(value, str):
+            return len(value) // 4 + 1
+        if isinstance(value, list):
+            # Token ID arrays (OpenAIEmbeddings sends tiktoken tokens) or lists of texts
+            return len(value) if value and isinstance(value[0], int) else sum(count(item) for item in value)
+        return 0
+
+    if "messages" in payload:
+        prompt = sum(count(message.get("content")) for message in payload["messages"])
+        return prompt + (payload.get("max_completion_tokens") or payload.get("max_tokens")
+                         or DEFAULT_COMPLETION_TOKENS)
+    return count(payload.get("input"))
+
+
+class RateLimitScheduler:
+    """
+    Shared admission control for OpenAI requests; see the module docstring.
+    Thread-safe, and usable from asyncio code through `acquire_async`.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = limits or RATE_LIMITS
+        self._limiters = {}
+        self._cond = threading.Condition()
+
+    def _limiter(self, model):
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            limiter = self._limiters[model] = ModelLimiter(*self.limits.get(model, self.limits["default"]))
+        return limiter
+
+    def describe(self, request):
+        """
+        Returns the Call (model, estimated tokens, priority) for an httpx request.
+        """
+        body = request.content
+        path = request.url.path
+        if path.endswith(("/audio/transcriptions", "/audio/translations")):
+            match = MULTIPART_MODEL_PATTERN.search(body)
+            model = match.group(1).decode("utf-8") if match else "whisper-1"
+            payload = {}
+        else:
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                payload = {}
+            model = payload.get("model", "default")
+        default = INTERACTIVE if path.endswith("/chat/completions") else BACKGROUND
+        return Call(model, _estimate_tokens(payload), _priority.get() or default)
+
+    def _try_acquire(self, call, now):
+        """
+        Takes the call's request and tokens and returns 0, or returns the
+        seconds to wait before trying again.
+        """
+        limiter = self._limiter(call.model)
+        if now < limiter.paused_until:
+            return limiter.paused_until - now
+        if call.priority == BACKGROUND and limiter.interactive_waiting:
+            return 0.05
+        reserve = INTERACTIVE_RESERVE if call.priority == BACKGROUND else 0.0
+        limiter.requests.refill(now)
+        wait = limiter.requests.wait_for(1, reserve)
+        if limiter.tokens:
+            limiter.tokens.refill(now)
+            wait = max(wait, limiter.tokens.wait_for(call.tokens, reserve))
+        if wait:
+            return wait
+        limiter.requests.level -= 1
+        if limiter.tokens:
+            limiter.tokens.level -= min(call.tokens, limiter.tokens.capacity)
+        limiter.stats["requests"] += 1
+        return 0.0
+
+    def _waiting(self, call, delta):
+        if call.priority == INTERACTIVE:
+            self._limiter(call.model).interactive_waiting += delta
+
+    def _record_wait(self, call, seconds):
+        if seconds:
+            with self._cond:
+                self._limiter(call.model).stats["wait_seconds"] += seconds
+            telemetry.observe("openai_wait_seconds", seconds, model=call.model, priority=call.priority)
+
+    def acquire(self, call):
+        started = time.monotonic()
+        with self._cond:
+            wait = self._try_acquire(call, started)
+            if wait:
+                self._waiting(call, 1)
+                try:
+                    while wait:
+                        self._cond.wait(wait)
+                        wait = self._try_acquire(call, time.monotonic())
+                finally:
+                    self._waiting(call, -1)
+                    self._cond.notify_all()
+        self._record_wait(call, time.monotonic() - started)
+
+    async def acquire_async(self, call):
+        started = time.monotonic()
+        with self._cond:
+            wait = self._try_acquire(call, started)
+            if wait:
+                self._waiting(call, 1)
+        if wait:
+            try:
+                while wait:
+                    await asyncio.sleep(wait)
+                    with self._cond:
+                        wait = self._try_acquire(call, time.monotonic())
+            finally:
+                with self._cond:
+                    self._waiting(call, -1)
+                    self._cond.notify_all()
+        self._record_wait(call, time.monotonic() - started)
+
+    def observe(self, call, response, attempt):
+        """
+        Updates the model's limits from the response headers. Returns the
+        seconds to wait before retrying, or None when the response is final.
+        """
+        headers = response.headers
+        with self._cond:
+            limiter = self._limiter(call.model)
+            for bucket, kind in ((limiter.requests, "requests"), (limiter.tokens, "tokens")):
+                if bucket is None:
+                    continue
+                if headers.get(f"x-ratelimit-limit-{kind}", "").isdigit():
+                    bucket.resize(int(headers[f"x-ratelimit-limit-{kind}"]))
+                if headers.get(f"x-ratelimit-remaining-{kind}", "").isdigit():
+                    bucket.level = min(bucket.level, float(headers[f"x-ratelimit-remaining-{kind}"]))
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                return None
+            delay = retry_delay(headers, attempt)
+            limiter.paused_until = max(limiter.paused_until, time.monotonic() + delay)
+            limiter.stats["retries"] += 1
+        telemetry.count("openai_retries_total", model=call.model, status=response.status_code)
+        print(f"OpenAI {call.model} returned {response.status_code}; retrying in {delay:.1f}s "
+              f"(attempt {attempt + 1} of {MAX_RETRIES})")
+        return delay
+
+    def backoff(self, call, attempt):
+        """
+        Pauses the model after a connection error; returns False once out of retries.
+        """
+        if attempt >= MAX_RETRIES:
+            return False
+        with self._cond:
+            limiter = self._limiter(call.model)
+            limiter.paused_until = max(limiter.paused_until, time.monotonic() + retry_delay({}, attempt))
+            limiter.stats["retries"] += 1
+        return True
+
+    def embedding_batch_size(self, model, tokens_per_input, workers=1):
+        """
+        Inputs per embedding request that use BATCH_WINDOW_SECONDS of the
+        model's token rate, shared by `workers` concurrent requests. This is
+        a target for average chunks; TokenCappedEmbeddings enforces the
+        per-request limits on the real token counts.
+        """
+        with self._cond:
+            tokens = self._limiter(model).tokens
+            per_minute = tokens.capacity if tokens else MAX_EMBEDDING_REQUEST_TOKENS
+        budget = min(per_minute / 60 * BATCH_WINDOW_SECONDS / max(1, workers), MAX_EMBEDDING_REQUEST_TOKENS)
+        return int(max(1, min(MAX_EMBEDDING_INPUTS, budget // max(1, tokens_per_input))))
+
+    def stats(self):
+        with self._cond:
+            return {model: {**limiter.stats, "wait_seconds": round(limiter.stats["wait_seconds"], 3),
+                            "requests_per_minute": limiter.requests.capacity,
+                            "tokens_per_minute": limiter.tokens.capacity if limiter.tokens else None}
+                    for model, limiter in self._limiters.items()}
+
+
+scheduler = RateLimitScheduler()
+
+
+def embedding_token_counter(model):
+    """
+    Counts tokens as the embedding model does. Without a tiktoken encoding,
+    the UTF-8 byte length is used, which is never less than the token count.
+    """
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: len(text.encode("utf-8"))
+
+
+def token_capped_batches(texts, count_tokens, max_tokens, max_inputs=MAX_EMBEDDING_INPUTS):
+    """
+    Yields (start, end) ranges of `texts` holding at most `max_inputs` texts
+    and `max_tokens` tokens each; a single larger text gets a range of its own.
+    """
+    start, used = 0, 0
+    for position, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if position > start and (used + tokens > max_tokens or position - start >= max_inputs):
+            yield start, position
+            start, used = position, 0
+        used += tokens
+    if start < len(texts):
+        yield start, len(texts)
+
+
+class TokenCappedEmbeddings:
+    """
+    Wraps OpenAIEmbeddings so every embed_documents request stays within
+    OpenAI's per-request input and token limits, whatever the batch size
+    and however token-dense the texts (numbers, LaTeX, non-English text).
+    `model` and `dimensions` are passed through for cache keys.
+    """
+
+    def __init__(self, embeddings, max_tokens=int(MAX_EMBEDDING_REQUEST_TOKENS * EMBEDDING_TOKEN_MARGIN),
+                 max_inputs=MAX_EMBEDDING_INPUTS):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None)
+        self.dimensions = getattr(embeddings, "dimensions", None)
+        self.max_tokens = max_tokens
+        self.max_inputs = max_inputs
+        self.count_tokens = embedding_token_counter(self.model or "text-embedding-3-small")
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = []
+        for start, end in token_capped_batches(texts, self.count_tokens, self.max_tokens, self.max_inputs):
+            vectors += self.embeddings.embed_documents(texts[start:end])
+        return vectors
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+
+def _final_response(response):
+    # Quota errors are 429s too, but waiting does not fix them
+    if response.status_code == 429:
+        response.read()
+        return b"insufficient_quota" in response.content
+    return False
+
+
+def scheduled_transports():
+    """
+    Returns (sync, async) httpx transports that route requests through the
+    shared scheduler.
+    """
+    import httpx
+
+    class ScheduledTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            request.read()
+            call = scheduler.describe(request)
+            attempt = 0
+            while True:
+                scheduler.acquire(call)
+                try:
+                    response = super().handle_request(request)
+                except httpx.TransportError:
+                    if not scheduler.backoff(call, attempt):
+                        raise
+                    attempt += 1
+                    continue
+                if _final_response(response) or scheduler.observe(call, response, attempt) is None:
+                    return response
+                response.close()
+                attempt += 1
+
+    class AsyncScheduledTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            await request.aread()
+            call = scheduler.describe(request)
+            attempt = 0
+            while True:
+                await scheduler.acquire_async(call)
+                try:
+                    response = await super().handle_async_request(request)
+                except httpx.TransportError:
+                    if not scheduler.backoff(call, attempt):
+                        raise
+                    attempt += 1
+                    continue
+                if response.status_code == 429:
+                    await response.aread()
+                if _final_response(response) or scheduler.observe(call, response, attempt) is None:
+                    return response
+                await response.aclose()
+                attempt += 1
+
+    return ScheduledTransport(), AsyncScheduledTransport()
+
+
+def client_options(async_client=True):
+    """
+    Keyword arguments that make an OpenAI SDK or LangChain OpenAI client use
+    the scheduler, which also takes over retries. Empty when disabled.
+    """
+    if not OPENAI_SCHEDULER_ENABLED:
+        return {}
+    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+    transport, async_transport = scheduled_transports()
+    options = {"http_client": DefaultHttpxClient(transport=transport), "max_retries": 0}
+    if async_client:
+        options["http_async_client"] = DefaultAsyncHttpxClient(transport=async_transport)
+    return options
@@ -0,0 +1,100 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+
+# ffmpeg streams each episode from its URL while cutting it, so an episode
+# worker covers both the download and the segmentation of one episode.
+EPISODE_WORKERS = int(os.getenv("PODCAST_EPISODE_WORKERS", 2))
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", 4))
+UPSERT_WORKERS = int(os.getenv("PODCAST_UPSERT_WORKERS", 2))
+
+
+class PodcastScheduler:
+    """
+    Ingests several podcast episodes at once.
+
+    Episodes run through three shared, bounded pools: episode workers stream
+    and segment the audio, transcription workers send segments to Whisper and
+    upsert workers index finished transcripts. Each episode gets its own
+    scratch directory. At most two segments per transcription worker are
+    queued for transcription, and an episode worker blocks (with its ffmpeg
+    paused, see AudioSegmenter) while the queue is full, so a full feed
+    backfill uses a fixed number of threads and scratch space that grows with
+    `episode_workers`, not with episode length. Episodes start in the order
+    given.
+
+    `transcribe(podcast, output_dir=..., submit=..., progress=...)` returns
+    the transcript of one episode (see DocumentProcessor.process_podcast_audio)
+    and `add_to_index(podcast, transcript)` stores it.
+    """
+
+    def __init__(self, transcribe, add_to_index, scratch_dir, episode_workers=EPISODE_WORKERS,
+                 transcribe_workers=TRANSCRIBE_WORKERS, upsert_workers=UPSERT_WORKERS):
+        self.transcribe = transcribe
+        self.add_to_index = add_to_index
+        self.scratch_dir = scratch_dir
+        self.episode_workers = episode_workers
+        self.transcribe_workers = transcribe_workers
+        self.upsert_workers = upsert_workers
+
+    def run(self, podcasts):
+        """
+        Processes `podcasts` and yields (podcast, status, error) events on the
+        calling thread, so the caller can update the UI. Every episode ends
+        with a "done" or "failed" event.
+        """
+        podcasts = list(podcasts)
+        if not podcasts:
+            return
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        events = queue.Queue()
+        slots = threading.BoundedSemaphore(max(1, self.transcribe_workers * 2))
+
+        with ThreadPoolExecutor(self.episode_workers, thread_name_prefix="podcast-episode") as episode_pool, \
+                ThreadPoolExecutor(self.transcribe_workers, thread_name_prefix="podcast-transcribe") as transcribe_pool, \
+                ThreadPoolExecutor(self.upsert_workers, thread_name_prefix="podcast-upsert") as upsert_pool:
+
+            def submit_segment(fn, *args):
+                # Blocks the episode worker, and its paused ffmpeg, while too many segments are queued
+                slots.acquire()
+                future = transcribe_pool.submit(fn, *args)
+                future.add_done_callback(lambda _: slots.release())
+                return future
+
+            def finish(podcast, future):
+                error = CancelledError() if future.cancelled() else future.exception()
+                events.put((podcast, "failed" if error else "done", error))
+
+            def run_episode(position, podcast):
+                # Anything that goes wrong ends the episode with "failed", or run() would wait forever
+                try:
+                    scratch = tempfile.mkdtemp(prefix=f"episode_{position:03d}_", dir=self.scratch_dir)
+                    try:
+                        events.put((podcast, "transcribing", None))
+                        transcript = self.transcribe(
+                            podcast, output_dir=scratch, submit=submit_segment,
+                            progress=lambda done, cut: events.put(
+                                (podcast, f"transcribed {done} of {cut} segments", None)),
+                        )
+                    finally:
+                        shutil.rmtree(scratch, ignore_errors=True)
+                    events.put((podcast, "indexing", None))
+                    future = upsert_pool.submit(self.add_to_index, podcast, transcript)
+                except Exception as e:
+                    events.put((podcast, "failed", e))
+                    return
+                future.add_done_callback(lambda f: finish(podcast, f))
+
+            for position, podcast in enumerate(podcasts):
+                episode_pool.submit(run_episode, position, podcast)
+
+            finished = 0
+            while finished < len(podcasts):
+                event = events.get()
+                if event[1] in ("done", "failed"):
+                    finished += 1
+                yield event
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+
+CONTEXTUALIZE_MODEL = os.getenv("CONTEXTUALIZE_MODEL", "gpt-4o-mini")
+# Questions shorter than this are usually follow-ups ("why?", "give an example")
+REWRITE_MIN_WORDS = int(os.getenv("REWRITE_MIN_WORDS", 6))
+REWRITE_MEMO_SIZE = int(os.getenv("REWRITE_MEMO_SIZE", 1024))
+REFERRING_WORDS = set(os.getenv(
+    "REWRITE_REFERRING_WORDS",
+    "it its it's they them their theirs this that these those he him his she her "
+    "there above previous earlier former latter same more else also another again "
+    "further elaborate continue expand example examples",
+).split())
+REFERRING_PHRASES = ("what about", "how about", "and what", "and how", "and why", "tell me more", "go on")
+WORD_PATTERN = re.compile(r"[a-z']+")
+
+
+def _history_digest(chat_history):
+    digest = hashlib.sha256()
+    for message in chat_history:
+        digest.update(f"{message.type}\x00{message.content}\x01".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def looks_self_contained(question):
+    """
+    Cheap heuristic: a question is self-contained when it is long enough and
+    has no pronouns or phrases that point back into the conversation.
+    """
+    lowered = question.lower()
+    words = WORD_PATTERN.findall(lowered)
+    if len(words) < REWRITE_MIN_WORDS:
+        return False
+    if any(phrase in lowered for phrase in REFERRING_PHRASES):
+        return False
+    return not any(word in REFERRING_WORDS for word in words)
+
+
+class QuestionContextualizer:
+    """
+    Turns the latest question into a standalone one for retrieval, calling the
+    rewrite model only when it is needed.
+
+    The rewrite is skipped when there is no history or when `classifier`
+    (by default `looks_self_contained`) says the question stands on its own.
+    Rewrites are memoized by (history digest, question), so retries and
+    regenerated turns do not pay for them twice. `stats()` reports how often
+    each path was taken and the latency the skips saved.
+    """
+
+    def __init__(self, llm, prompt, classifier=looks_self_contained, memo_size=REWRITE_MEMO_SIZE):
+        self.rewrite_chain = prompt | llm | StrOutputParser()
+        self.classifier = classifier
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {"no_history": 0, "self_contained": 0, "memoized": 0, "rewritten": 0}
+        self.rewrite_seconds = 0.0
+        self.last_turn = {}
+
+    def _decide(self, inputs):
+        question = inputs["input"]
+        chat_history = inputs.get("chat_history") or []
+        if not chat_history:
+            return "no_history", question, None
+        if self.classifier(question):
+            return "self_contained", question, None
+        key = (_history_digest(chat_history), question)
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return "memoized", self._memo[key], None
+        return "rewritten", None, key
+
+    def _remember(self, key, rewritten, seconds):
+        with self._lock:
+            self._memo[key] = rewritten
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+            self.rewrite_seconds += seconds
+
+    def _record(self, decision, started, question):
+        with self._lock:
+            self.counts[decision] += 1
+        self.last_turn = {
+            "decision": decision,
+            "seconds": round(time.perf_counter() - started, 4),
+            "standalone_question": question,
+        }
+        print(f"Question contextualization: {decision} ({self.last_turn['seconds']}s)")
+        return question
+
+    def contextualize(self, inputs, config=None):
+        started = time.perf_counter()
+        decision, question, key = self._decide(inputs)
+        if decision == "rewritten":
+            question = self.rewrite_chain.invoke(inputs, config)
+            self._remember(key, question, time.perf_counter() - started)
+        return self._record(decision, started, question)
+
+    async def acontextualize(self, inputs, config=None):
+        started = time.perf_counter()
+        decision, question, key = self._decide(inputs)
+        if decision == "rewritten":
+            question = await self.rewrite_chain.ainvoke(inputs, config)
+            self._remember(key, question, time.perf_counter() - started)
+        return self._record(decision, started, question)
+
+    def as_runnable(self):
+        return RunnableLambda(self.contextualize, afunc=self.acontextualize).with_config(
+            run_name="contextualize_question")
+
+    def stats(self):
+        """
+        Returns per-path counts, the skip rate among turns with history and the
+        latency saved, estimated from the average measured rewrite time.
+        """
+        with self._lock:
+            counts = dict(self.counts)
+            rewrite_seconds = self.rewrite_seconds
+        with_history = counts["self_contained"] + counts["memoized"] + counts["rewritten"]
+        average_rewrite = rewrite_seconds / counts["rewritten"] if counts["rewritten"] else 0.0
+        skipped = counts["self_contained"] + counts["memoized"]
+        return {
+            **counts,
+            "skip_rate": round(skipped / with_history, 3) if with_history else 0.0,
+            "average_rewrite_seconds": round(average_rewrite, 3),
+            "estimated_seconds_saved": round(skipped * average_rewrite, 3),
+        }
@@ -0,0 +1,332 @@
+"""
+Asyncio HTTP service for the conversational RAG chain, standard library only.
+
+    python rag_server.py --port 8000 --index test
+
+    POST /chat    {"input": "...", "session_id": "...", "index": "...", "stream": true}
+                  Streams Server-Sent Events: session, sources, one token
+                  event per answer chunk, then done (timings) or error.
+                  With "stream": false the answer, sources and timings are
+                  returned as one JSON object. "index" must be the default
+                  index or one listed in SERVER_INDEXES (--indexes).
+    GET  /health  Active and queued turns and request counters.
+
+At most `max_concurrency` turns run at once. Further requests wait, at most
+`max_queue` of them and each for `queue_timeout` seconds, and are answered
+503 otherwise. Turns of one session run one at a time, so its history stays
+in order. A client that disconnects cancels its turn, queued or generating,
+and the cancelled turn is not written to the history.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import openai_scheduler
+import telemetry
+from chain_setup import astream_rag_response
+
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
+SERVER_INDEX = os.getenv("SERVER_INDEX", "test")
+# Comma-separated indexes requests may name besides the default one
+SERVER_INDEXES = [name.strip() for name in os.getenv("SERVER_INDEXES", "").split(",") if name.strip()]
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", 16))
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", 64))
+SERVER_QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", 30))
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+MAX_SESSION_ID_LENGTH = 128
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+async def read_request(reader):
+    """
+    Reads one HTTP/1.1 request and returns (method, path, headers, body).
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, "Request headers too large")
+    request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_json(writer, status, payload, headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(response_head(status, {"Content-Type": "application/json", "Content-Length": len(body),
+                                        "Connection": "close", **(headers or {})}) + body)
+    await writer.drain()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def parse_chat_request(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Body must be JSON")
+    if not isinstance(request, dict) or not isinstance(request.get("input"), str) or not request["input"].strip():
+        raise HTTPError(400, "'input' must be a non-empty string")
+    session_id = request.get("session_id") or str(uuid.uuid4())
+    if not isinstance(session_id, str) or len(session_id) > MAX_SESSION_ID_LENGTH:
+        raise HTTPError(400, f"'session_id' must be a string of at most {MAX_SESSION_ID_LENGTH} characters")
+    return request["input"], session_id, request.get("index"), request.get("stream", True)
+
+
+class RagServer:
+    """
+    Serves chat turns over HTTP on one event loop. Turns run through the
+    chain's async stream/invoke paths, so a waiting turn holds no thread.
+
+    `chain_for_index(index_name)` returns a conversational RAG chain; it
+    defaults to a ResourceRegistry, so each index is built once. Requests
+    may only name `default_index` or one of `indexes`; building a chain for
+    any other name would open local files or create a Pinecone index.
+    """
+
+    def __init__(self, chain_for_index=None, default_index=SERVER_INDEX, max_concurrency=SERVER_MAX_CONCURRENCY,
+                 max_queue=SERVER_MAX_QUEUE, queue_timeout=SERVER_QUEUE_TIMEOUT, indexes=SERVER_INDEXES):
+        if chain_for_index is None:
+            from resources import ResourceRegistry
+            chain_for_index = ResourceRegistry().chain
+        self.chain_for_index = chain_for_index
+        self.default_index = default_index
+        self.indexes = {default_index, *indexes}
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        self.counters = {"completed": 0, "failed": 0, "rejected": 0, "cancelled": 0}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._session_locks = weakref.WeakValueDictionary()
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        # Sync chain steps (retrieval, packing) run in the loop's default
+        # executor; give every admitted turn a thread for them.
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(self.max_concurrency + 4, thread_name_prefix="rag-server"))
+        self.server = await asyncio.start_server(self._handle, host, port, limit=MAX_HEADER_BYTES)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Serving the RAG chain on http://{host}:{self.port}")
+        return self.server
+
+    def health(self):
+        return {"active": self.active, "queued": self.queued, "max_concurrency": self.max_concurrency,
+                **self.counters}
+
+    def _count(self, outcome):
+        self.counters[outcome] += 1
+        telemetry.count("server_turns_total", outcome=outcome)
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, path, _, body = await read_request(reader)
+                if path == "/health":
+                    if method != "GET":
+                        raise HTTPError(405, "Use GET")
+                    await send_json(writer, 200, self.health())
+                elif path == "/chat":
+                    if method != "POST":
+                        raise HTTPError(405, "Use POST")
+                    await self._chat(*parse_chat_request(body), reader, writer)
+                else:
+                    raise HTTPError(404, f"No route for {path}")
+            except HTTPError as e:
+                if e.status == 503:
+                    self._count("rejected")
+                await send_json(writer, e.status, {"error": str(e)}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _cancel_on_disconnect(self, reader, task):
+        # The request body has been read, so EOF here means the client left
+        while await reader.read(1024):
+            pass
+        task.cancel()
+
+    async def _admit(self, session_id):
+        """
+        Waits for the session's lock and a free slot, within the queue timeout.
+        Returns the session lock, to be released with the slot.
+        """
+        session_lock = self._session_locks.get(session_id)
+        if session_lock is None:
+            session_lock = self._session_locks[session_id] = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        if not session_lock.locked() and not self._slots.locked():
+            # Both are free, so these complete without suspending
+            await session_lock.acquire()
+            await self._slots.acquire()
+        else:
+            await self._wait_for_slot(session_lock, started)
+        telemetry.observe("server_queue_seconds", loop.time() - started)
+        self.active += 1
+        return session_lock
+
+    async def _wait_for_slot(self, session_lock, started):
+        if self.queued >= self.max_queue:
+            raise HTTPError(503, "Too many queued requests", {"Retry-After": 1})
+        loop = asyncio.get_running_loop()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(session_lock.acquire(), self.queue_timeout)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), max(0.0, started + self.queue_timeout - loop.time()))
+            except BaseException:
+                session_lock.release()
+                raise
+        except asyncio.TimeoutError:
+            raise HTTPError(503, f"No free slot within {self.queue_timeout:g}s",
+                            {"Retry-After": max(1, round(self.queue_timeout / 2))})
+        finally:
+            self.queued -= 1
+
+    def _release(self, session_lock):
+        self.active -= 1
+        self._slots.release()
+        session_lock.release()
+
+    async def _chat(self, user_input, session_id, index_name, stream, reader, writer):
+        index_name = index_name or self.default_index
+        if index_name not in self.indexes:
+            raise HTTPError(400, "Unknown 'index'")
+        watcher = asyncio.create_task(self._cancel_on_disconnect(reader, asyncio.current_task()))
+        try:
+            chain = await asyncio.to_thread(self.chain_for_index, index_name)
+            session_lock = await self._admit(session_id)
+            try:
+                if stream:
+                    await self._stream_turn(chain, user_input, session_id, writer)
+                else:
+                    await self._invoke_turn(chain, user_input, session_id, writer)
+            finally:
+                self._release(session_lock)
+        except asyncio.CancelledError:
+            if not watcher.done():
+                raise
+            self._count("cancelled")
+            print(f"Client disconnected; cancelled turn of session {session_id}")
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    async def _send_events(events, writer):
+        # Drains after every write, so a slow client holds back only this task
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            writer.write(event)
+            await writer.drain()
+
+    async def _stream_turn(self, chain, user_input, session_id, writer):
+        events = asyncio.Queue()
+        sender = asyncio.create_task(self._send_events(events, writer))
+        events.put_nowait(response_head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                              "Connection": "close"}))
+        events.put_nowait(sse_event("session", {"session_id": session_id}))
+        try:
+            try:
+                response = await astream_rag_response(
+                    chain, user_input, session_id,
+                    on_sources=lambda sources: events.put_nowait(sse_event("sources", {"sources": sources})),
+                    on_token=lambda text: events.put_nowait(sse_event("token", {"text": text})),
+                )
+            except Exception as e:
+                self._count("failed")
+                print(f"Error in turn of session {session_id}: {e}")
+                events.put_nowait(sse_event("error", {"error": "Error generating response."}))
+            else:
+                self._count("completed")
+                events.put_nowait(sse_event("done", {key: response[key] for key in
+                                                     ("time_to_sources", "time_to_first_token", "total_seconds")}))
+            events.put_nowait(None)
+            await sender
+        finally:
+            sender.cancel()
+
+    async def _invoke_turn(self, chain, user_input, session_id, writer):
+        started = time.perf_counter()
+        try:
+            with openai_scheduler.priority(openai_scheduler.INTERACTIVE):
+                response = await chain.ainvoke({"input": user_input},
+                                               config={"configurable": {"session_id": session_id}})
+        except Exception as e:
+            self._count("failed")
+            print(f"Error in turn of session {session_id}: {e}")
+            raise HTTPError(500, "Error generating response.")
+        self._count("completed")
+        await send_json(writer, 200, {
+            "session_id": session_id,
+            "answer": response["answer"],
+            "sources": list(set([document.metadata['source'] for document in response["context"]])),
+            "total_seconds": time.perf_counter() - started,
+        })
+
+
+async def serve(server, host=SERVER_HOST, port=SERVER_PORT):
+    async with await server.start(host, port) as listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the conversational RAG chain over HTTP/SSE.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--index", default=SERVER_INDEX, help="Index used when a request names none.")
+    parser.add_argument("--indexes", nargs="*", default=SERVER_INDEXES, help="Other indexes requests may name.")
+    parser.add_argument("--max-concurrency", type=int, default=SERVER_MAX_CONCURRENCY)
+    parser.add_argument("--max-queue", type=int, default=SERVER_MAX_QUEUE)
+    parser.add_argument("--queue-timeout", type=float, default=SERVER_QUEUE_TIMEOUT)
+    args = parser.parse_args()
+
+    asyncio.run(serve(RagServer(default_index=args.index, max_concurrency=args.max_concurrency,
+                                max_queue=args.max_queue, queue_timeout=args.queue_timeout, indexes=args.indexes),
+                      args.host, args.port))
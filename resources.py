@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+
+RESOURCE_IDLE_TTL = float(os.getenv("RESOURCE_IDLE_TTL", 1800))
+RESOURCE_MAX_INDEXES = int(os.getenv("RESOURCE_MAX_INDEXES", 8))
+# Seconds a dropped processor stays open for turns already running on it
+RESOURCE_CLOSE_GRACE = float(os.getenv("RESOURCE_CLOSE_GRACE", 300))
+
+
+class ResourceRegistry:
+    """
+    Builds DocumentProcessors and conversational RAG chains once per index
+    name and shares them across Streamlit sessions and reruns.
+
+    Each index gets its own build lock, so concurrent sessions asking for the
+    same index wait for one build instead of racing, while other indexes stay
+    available. Indexes unused for `idle_ttl` seconds, or beyond
+    `max_indexes`, are dropped least recently used first; an index that is
+    being built is never dropped. When an index name is re-aliased to another
+    vector index (index_migration), its processor and chain are rebuilt on
+    next use. A dropped processor's stores are closed `close_grace` seconds
+    later, so turns already running on it can finish.
+    """
+
+    def __init__(self, processor_factory=None, chain_factory=None,
+                 idle_ttl=RESOURCE_IDLE_TTL, max_indexes=RESOURCE_MAX_INDEXES, close_grace=RESOURCE_CLOSE_GRACE):
+        self.processor_factory = processor_factory
+        self.chain_factory = chain_factory
+        self.idle_ttl = idle_ttl
+        self.max_indexes = max_indexes
+        self.close_grace = close_grace
+        self._entries = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, index_name):
+        now = time.time()
+        with self._lock:
+            self._evict(now, keep=index_name)
+            entry = self._entries.setdefault(index_name, {})
+            entry["last_used"] = now
+            build_lock = self._build_locks.setdefault(index_name, threading.Lock())
+        return entry, build_lock
+
+    def _evict(self, now, keep):
+        # Entries being built stay; their build lock is held by another caller
+        candidates = {name: entry for name, entry in self._entries.items()
+                      if name != keep and not self._build_locks[name].locked()}
+        idle = [name for name, entry in candidates.items() if now - entry.get("last_used", now) > self.idle_ttl]
+        others = sorted((entry.get("last_used", now), name) for name, entry in candidates.items())
+        excess = len(self._entries) - (1 if keep in self._entries else 0) - (self.max_indexes - 1)
+        overflow = [name for _, name in others[:max(0, excess)]]
+        for name in set(idle) | set(overflow):
+            print(f"Evicting idle resources for index '{name}'")
+            entry = self._entries.pop(name)
+            self._build_locks.pop(name)
+            self._close_later(entry.get("processor"))
+
+    def _close_later(self, processor):
+        close = getattr(processor, "close", None)
+        if close is None:
+            return
+        timer = threading.Timer(self.close_grace, close)
+        timer.daemon = True
+        timer.start()
+
+    def processor(self, index_name):
+        from vector_backends import resolve_index_name
+
+        entry, build_lock = self._entry(index_name)
+        with build_lock:
+            vector_index_name = getattr(entry.get("processor"), "vector_index_name", None)
+            if vector_index_name and vector_index_name != resolve_index_name(index_name):
+                print(f"Index '{index_name}' now served by '{resolve_index_name(index_name)}'; rebuilding")
+                self._close_later(entry.pop("processor"))
+                entry.pop("chain", None)
+            if "processor" not in entry:
+                if self.processor_factory is None:
+                    from data_ingestion import DocumentProcessor
+                    self.processor_factory = lambda name: DocumentProcessor(index_name=name)
+                entry["processor"] = self.processor_factory(index_name)
+                print("init processor for", index_name)
+        return entry["processor"]
+
+    def chain(self, index_name):
+        processor = self.processor(index_name)
+        entry, build_lock = self._entry(index_name)
+        with build_lock:
+            if "chain" not in entry:
+                if self.chain_factory is None:
+                    from chain_setup import build_conversational_rag_chain
+                    self.chain_factory = build_conversational_rag_chain
+                entry["chain"] = self.chain_factory(processor)
+        return entry["chain"]
+
+    def indexes(self):
+        with self._lock:
+            return list(self._entries)
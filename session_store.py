@@ -0,0 +1,200 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from context_packing import token_counter
+
+
+CHAT_HISTORY_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", "memory")
+CHAT_HISTORY_DB = os.getenv("CHAT_HISTORY_DB", "sqlite:///chat_history.db")
+SESSION_MAX = int(os.getenv("SESSION_MAX", 500))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 3600))
+# In-memory histories keep at most this many messages; older ones are only
+# reachable through the summary.
+HISTORY_MAX_STORED_MESSAGES = int(os.getenv("HISTORY_MAX_STORED_MESSAGES", 40))
+# Fits the last exchange even when the answer runs to the ~4,500 words
+# book_assistant_prompt asks for (about 6k tokens).
+HISTORY_MAX_TOKENS = max(int(os.getenv("HISTORY_MAX_TOKENS", 8000)), 256)
+TRUNCATION_MARKER = " [...]"
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "")
+SUMMARY_MEMO_SIZE = 256
+
+summarize_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system",
+         "Summarize the conversation below in at most 150 words, keeping the topics, "
+         "entities and questions the user cares about. {previous_summary}"),
+        MessagesPlaceholder("messages"),
+    ]
+)
+
+
+class BoundedChatMessageHistory(InMemoryChatMessageHistory):
+    """
+    In-memory chat history that keeps only the most recent messages.
+    """
+
+    max_messages: int = HISTORY_MAX_STORED_MESSAGES
+
+    def add_messages(self, messages):
+        super().add_messages(messages)
+        if len(self.messages) > self.max_messages:
+            self.messages = self.messages[-self.max_messages:]
+
+
+class SessionStore:
+    """
+    Per-session chat histories with LRU and idle-TTL eviction.
+
+    With the "memory" backend histories live only in this process and are
+    capped at `max_stored_messages`. With the "sqlite" backend they are
+    SQLChatMessageHistory objects sharing one engine, so evicting a session
+    only drops the in-memory handle and the conversation resumes later.
+    """
+
+    def __init__(self, backend=CHAT_HISTORY_BACKEND, max_sessions=SESSION_MAX,
+                 idle_ttl=SESSION_IDLE_TTL, max_stored_messages=HISTORY_MAX_STORED_MESSAGES,
+                 connection=CHAT_HISTORY_DB):
+        if backend not in ("memory", "sqlite"):
+            raise ValueError(f"Unknown chat history backend: {backend}")
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_stored_messages = max_stored_messages
+        self.connection = connection
+        self._engine = None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create(self, session_id):
+        if self.backend == "memory":
+            return BoundedChatMessageHistory(max_messages=self.max_stored_messages)
+        from langchain_community.chat_message_histories import SQLChatMessageHistory
+        from sqlalchemy import create_engine
+
+        if self._engine is None:
+            self._engine = create_engine(self.connection)
+        return SQLChatMessageHistory(session_id=session_id, connection=self._engine)
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (history, last_used) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - last_used < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            history = entry[0] if entry else self._create(session_id)
+            self._sessions[session_id] = (history, now)
+            self._evict(now)
+        return history
+
+    def __contains__(self, session_id):
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class HistoryWindow:
+    """
+    Caps the chat history sent to the LLM at `max_tokens`.
+
+    The last exchange (the newest human message and what follows it) is
+    always kept, with its longest messages truncated if it alone exceeds
+    the budget. Earlier messages are kept while they fit, starting on a
+    human turn.
+    When a summarizer model is given, the messages that fell out of the
+    window are replaced by a short summary. Summaries are memoized by a
+    digest of the dropped prefix and extended incrementally, so each turn
+    summarizes only the messages that newly left the window.
+    """
+
+    def __init__(self, max_tokens=HISTORY_MAX_TOKENS, summarizer=None):
+        self.max_tokens = max_tokens
+        self.count_tokens = token_counter()
+        self.summary_chain = summarize_prompt | summarizer | StrOutputParser() if summarizer else None
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _summarize(self, dropped):
+        digests = []
+        digest = hashlib.sha256()
+        for message in dropped:
+            digest.update(f"{message.type}\x00{message.content}\x01".encode("utf-8"))
+            digests.append(digest.hexdigest())
+
+        with self._lock:
+            known = next(((i, self._summaries[d]) for i, d in reversed(list(enumerate(digests)))
+                          if d in self._summaries), None)
+        if known and known[0] == len(dropped) - 1:
+            return known[1]
+        start, previous = (known[0] + 1, known[1]) if known else (0, "")
+        summary = self.summary_chain.invoke({
+            "previous_summary": f"Extend this earlier summary: {previous}" if previous else "",
+            "messages": dropped[start:],
+        })
+        with self._lock:
+            self._summaries[digests[-1]] = summary
+            if len(self._summaries) > SUMMARY_MEMO_SIZE:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _truncate(self, message, max_tokens):
+        text = str(message.content)
+        tokens = self.count_tokens(text)
+        keep = len(text) * max_tokens // max(tokens, 1)
+        while keep and self.count_tokens(text[:keep] + TRUNCATION_MARKER) > max_tokens:
+            keep = keep * 9 // 10
+        return message.model_copy(update={"content": text[:keep] + TRUNCATION_MARKER})
+
+    def _last_exchange(self, messages):
+        start = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), 0)
+        exchange = messages[start:]
+        counts = [self.count_tokens(str(message.content)) for message in exchange]
+        while sum(counts) > self.max_tokens:
+            longest = max(range(len(counts)), key=counts.__getitem__)
+            allowance = max(self.max_tokens // len(counts), self.max_tokens - (sum(counts) - counts[longest]))
+            truncated = self._truncate(exchange[longest], allowance)
+            tokens = self.count_tokens(str(truncated.content))
+            if tokens >= counts[longest]:
+                # Already cut down to the marker; the budget is below what the
+                # exchange can shrink to.
+                break
+            exchange[longest], counts[longest] = truncated, tokens
+        return start, exchange, sum(counts)
+
+    def __call__(self, messages):
+        messages = list(messages or [])
+        if not messages:
+            return []
+        start, kept, used = self._last_exchange(messages)
+        earlier = []
+        for message in reversed(messages[:start]):
+            tokens = self.count_tokens(str(message.content))
+            if used + tokens > self.max_tokens:
+                break
+            earlier.append(message)
+            used += tokens
+        earlier.reverse()
+        while earlier and not isinstance(earlier[0], HumanMessage):
+            earlier.pop(0)
+        kept = earlier + kept
+
+        dropped = messages[:start - len(earlier)]
+        if dropped and self.summary_chain:
+            summary = self._summarize(dropped)
+            kept.insert(0, SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        return kept
@@ -0,0 +1,128 @@
+"""
+Cold-start benchmark for the app's modules.
+
+Each run imports a module in a fresh interpreter with `-X importtime`, so
+nothing is shared between runs. Reports the median wall time, the module's
+cumulative import time and the heaviest imports, and can save the result as
+a baseline and compare later runs against it.
+
+    python startup_benchmark.py                      # measure
+    python startup_benchmark.py --save               # measure and save baseline
+    python startup_benchmark.py --compare            # fail if slower than baseline
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+
+MODULES = ["chain_setup", "data_ingestion", "resources"]
+BASELINE_PATH = "./startup_baseline.json"
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module, python=sys.executable):
+    """
+    Imports `module` once in a fresh interpreter and returns its wall time,
+    cumulative import time and per-package cumulative times (top level only).
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    packages = {}
+    module_cumulative = None
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if name == module:
+            module_cumulative = cumulative_us
+        # Direct children of the module are indented one level (two spaces) past it
+        if indent <= 3:
+            packages[name.split(".")[0]] = max(packages.get(name.split(".")[0], 0), cumulative_us)
+    return {
+        "wall_seconds": wall,
+        "import_seconds": (module_cumulative or 0) / 1e6,
+        "packages": {name: us / 1e6 for name, us in packages.items()},
+    }
+
+
+def benchmark(modules, runs):
+    report = {}
+    for module in modules:
+        try:
+            samples = [measure_import(module) for _ in range(runs)]
+        except RuntimeError as e:
+            print(e)
+            report[module] = {"error": str(e)}
+            continue
+        heaviest = {}
+        for sample in samples:
+            for name, seconds in sample["packages"].items():
+                heaviest.setdefault(name, []).append(seconds)
+        report[module] = {
+            "runs": runs,
+            "wall_seconds": round(statistics.median(s["wall_seconds"] for s in samples), 4),
+            "import_seconds": round(statistics.median(s["import_seconds"] for s in samples), 4),
+            "heaviest_imports": dict(sorted(
+                ((name, round(statistics.median(values), 4)) for name, values in heaviest.items() if name != module),
+                key=lambda item: -item[1],
+            )[:10]),
+        }
+        print(f"{module}: wall {report[module]['wall_seconds']:.3f}s, "
+              f"import {report[module]['import_seconds']:.3f}s")
+        for name, seconds in report[module]["heaviest_imports"].items():
+            print(f"    {name:<30} {seconds:.3f}s")
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns the modules whose median import time exceeds the baseline by
+    more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for module, result in report.items():
+        previous = baseline.get(module)
+        if not previous or "error" in result or "error" in previous:
+            continue
+        limit = previous["import_seconds"] * (1 + tolerance)
+        change = result["import_seconds"] - previous["import_seconds"]
+        print(f"{module}: {previous['import_seconds']:.3f}s -> {result['import_seconds']:.3f}s ({change:+.3f}s)")
+        if result["import_seconds"] > limit:
+            regressions.append(module)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the app's modules.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Save the results as the new baseline.")
+    parser.add_argument("--compare", action="store_true", help="Exit non-zero if slower than the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing, as a fraction.")
+    args = parser.parse_args()
+
+    report = benchmark(args.modules, args.runs)
+    if args.compare:
+        with open(args.baseline) as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+        if regressions:
+            print(f"Startup regressions: {regressions}")
+            sys.exit(1)
+    if args.save:
+        with open(args.baseline, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Baseline saved to {args.baseline}")
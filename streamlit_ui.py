@@ -1,13 +1,28 @@
+import time
+import uuid
 import streamlit as st
-from chain_setup import conversational_rag_chain
+from chain_setup import stream_rag_response
+import openai_scheduler
 from st_copy_to_clipboard import st_copy_to_clipboard
-from data_ingestion import DocumentProcessor
+from resources import ResourceRegistry
+
+
+@st.cache_resource
+def get_resource_registry():
+    # One registry per server process, shared by every session and rerun
+    return ResourceRegistry()
+
 # Title for the app
 st.title("AI Assistant")
 with st.sidebar:
     index_name = st.text_input("Enter the pincone index name:", value="test").strip()
     folder_id = st.text_input("Enter the folder id found on folder id in gdrive.").strip()
     latest_n = st.number_input("Latest number of podcasts to be ingested. -1 means all podcasts.", value=10)
+    stream_answers = st.checkbox("Stream answers as they are generated", value=True)
+# Give every browser session its own chat history in the RAG chain
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+
 # Initialize session state for storing chat history if not already initialized
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = []
@@ -24,8 +39,7 @@ if 'processor' not in st.session_state:
     st.session_state.processor = None
 
 if index_name:
-    st.session_state.processor =  DocumentProcessor(index_name=index_name)
-    print("init processor for" ,index_name)
+    st.session_state.processor = get_resource_registry().processor(index_name)
 
 with st.sidebar: ingest = st.button("Ingest/Check for new docs in your drive data folder")
 with st.sidebar: podcast = st.button("Ingest podcasts. Might take time.")
@@ -55,15 +69,38 @@ def process_message():
             "content": user_input
         })
         
-        # Call your RAG chain 
+        # Call your RAG chain over the index selected in the sidebar
         try:
-            response = conversational_rag_chain.invoke(
-                {"input": user_input},
-                config={
-                    "configurable": {"session_id": "user"}
-                }
-            )
-            st.session_state.sources = list(set([document.metadata['source'] for document in response["context"]]))
+            conversational_rag_chain = get_resource_registry().chain(index_name)
+            if stream_answers:
+                # Render sources as soon as retrieval finishes and the answer token by token
+                sources_placeholder = st.empty()
+                answer_placeholder = st.empty()
+                streamed = []
+                last_render = [0.0]
+
+                def show_sources(sources):
+                    sources_placeholder.markdown("<br><strong>AI Assistant:</strong> Sources: {}".format(" | ".join(sources)), unsafe_allow_html=True)
+
+                def show_token(token):
+                    # Re-rendering a multi-thousand-word answer per token is slow; redraw at most every 50ms
+                    streamed.append(token)
+                    if time.perf_counter() - last_render[0] > 0.05:
+                        answer_placeholder.markdown("".join(streamed) + "▌")
+                        last_render[0] = time.perf_counter()
+
+                response = stream_rag_response(conversational_rag_chain, user_input, st.session_state.session_id, on_sources=show_sources, on_token=show_token)
+                answer_placeholder.markdown(response["answer"])
+                st.session_state.sources = response["sources"]
+            else:
+                with openai_scheduler.priority(openai_scheduler.INTERACTIVE):
+                    response = conversational_rag_chain.invoke(
+                        {"input": user_input},
+                        config={
+                            "configurable": {"session_id": st.session_state.session_id}
+                        }
+                    )
+                st.session_state.sources = list(set([document.metadata['source'] for document in response["context"]]))
             
             # Convert AI's response (in markdown format) to plain markdown (with LaTeX support)
             ai_response_markdown = response.get('answer', '') 
@@ -0,0 +1,348 @@
+"""
+Spans and metrics for the RAG chain and the ingestion stages.
+
+Disabled unless TELEMETRY_EXPORTERS lists at least one exporter:
+
+    TELEMETRY_EXPORTERS=jsonl               # one JSON line per span
+    TELEMETRY_EXPORTERS=prometheus          # /metrics on TELEMETRY_PROMETHEUS_HOST:PORT
+    TELEMETRY_EXPORTERS=jsonl,prometheus
+
+When disabled, `span()` returns a shared no-op object and `count()` /
+`observe()` return immediately, so instrumented code pays one global check.
+"""
+import contextvars
+import http.server
+import json
+import os
+import threading
+import time
+import uuid
+from functools import wraps
+
+
+TELEMETRY_EXPORTERS = [name for name in os.getenv("TELEMETRY_EXPORTERS", "").replace(" ", "").split(",") if name]
+TELEMETRY_JSONL_PATH = os.getenv("TELEMETRY_JSONL_PATH", "./telemetry.jsonl")
+# Loopback only by default; set to 0.0.0.0 to let a scraper on another host in
+TELEMETRY_PROMETHEUS_HOST = os.getenv("TELEMETRY_PROMETHEUS_HOST", "127.0.0.1")
+TELEMETRY_PROMETHEUS_PORT = int(os.getenv("TELEMETRY_PROMETHEUS_PORT", 9464))
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# LangChain runs recorded as chat stages; generic Runnable* wrappers are skipped.
+CHAIN_STAGES = {"window_history", "contextualize_question", "retrieve_documents", "pack_context",
+                "stuff_documents_chain", "answer_cache_lookup", "answer_cache_store"}
+
+enabled = False
+_current_span = contextvars.ContextVar("telemetry_span", default=None)
+_exporters = []
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        return self
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    Times a block. Spans opened inside it on the same thread (or asyncio
+    task) become its children. An exception, or an `error` attribute set
+    with `set()`, marks the span as failed.
+    """
+
+    __slots__ = ("name", "attributes", "trace_id", "span_id", "parent_id", "started_at", "_start", "_token")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        error = repr(exc) if exc is not None else self.attributes.pop("error", None)
+        _export({
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "started_at": self.started_at, "seconds": seconds, "error": error, "attributes": self.attributes,
+        })
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+
+def span(name, **attributes):
+    return Span(name, attributes) if enabled else NOOP_SPAN
+
+
+def record_span(name, seconds, error=None, **attributes):
+    """
+    Records a span timed elsewhere, e.g. in a worker process.
+    """
+    if not enabled:
+        return
+    parent = _current_span.get()
+    _export({
+        "name": name, "trace_id": parent.trace_id if parent else uuid.uuid4().hex[:16],
+        "span_id": uuid.uuid4().hex[:16], "parent_id": parent.span_id if parent else None,
+        "started_at": time.time() - seconds, "seconds": seconds,
+        "error": repr(error) if isinstance(error, BaseException) else error, "attributes": attributes,
+    })
+
+
+def traced(name):
+    """
+    Decorator form of `span(name)`.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1, **labels):
+    if enabled:
+        metrics.count(name, value, labels)
+
+
+def observe(name, value, **labels):
+    if enabled:
+        metrics.observe(name, value, labels)
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms keyed by name and labels, rendered in the
+    Prometheus text format.
+    """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters), {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+
+    def render(self):
+        counters, histograms = self.snapshot()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            lines += [f"{name}{_labels(labels)} {value}" for (n, labels), value in sorted(counters.items()) if n == name]
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (n, labels), (buckets, total, value_sum) in sorted(histograms.items()):
+                if n != name:
+                    continue
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {bucket_count}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {total}")
+                lines.append(f"{name}_sum{_labels(labels)} {value_sum}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = MetricsRegistry()
+
+
+def _export(record):
+    metrics.observe("rag_span_seconds", record["seconds"], {"span": record["name"]})
+    if record["error"]:
+        metrics.count("rag_span_errors_total", 1, {"span": record["name"]})
+    for key, value in record["attributes"].items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics.count("rag_span_attribute_total", value, {"span": record["name"], "attribute": key})
+    for exporter in _exporters:
+        exporter.export(record)
+
+
+class JsonlExporter:
+    def __init__(self, path=TELEMETRY_JSONL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+class PrometheusExporter:
+    """
+    Serves the metrics registry at http://<host>:<port>/metrics.
+    """
+
+    def __init__(self, port=TELEMETRY_PROMETHEUS_PORT, registry=None, host=TELEMETRY_PROMETHEUS_HOST):
+        registry = registry or metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_port
+        threading.Thread(target=self.httpd.serve_forever, name="telemetry-prometheus", daemon=True).start()
+        print(f"Serving metrics on {host}:{self.port}/metrics")
+
+    def export(self, record):
+        pass
+
+
+def configure(exporters=None, jsonl_path=TELEMETRY_JSONL_PATH, prometheus_port=TELEMETRY_PROMETHEUS_PORT,
+              prometheus_host=TELEMETRY_PROMETHEUS_HOST):
+    """
+    Turns telemetry on with the given exporters ("jsonl", "prometheus"), or
+    off when none are given. Called at import with TELEMETRY_EXPORTERS.
+    """
+    global enabled
+    for exporter in _exporters:
+        if isinstance(exporter, PrometheusExporter):
+            exporter.httpd.shutdown()
+    _exporters.clear()
+    for name in exporters or []:
+        if name == "jsonl":
+            _exporters.append(JsonlExporter(jsonl_path))
+        elif name == "prometheus":
+            try:
+                _exporters.append(PrometheusExporter(prometheus_port, host=prometheus_host))
+            except OSError as e:
+                # Another process (e.g. a second Streamlit worker) already serves the port
+                print(f"Metrics endpoint not started on port {prometheus_port}: {e}")
+        else:
+            raise ValueError(f"Unknown telemetry exporter: {name}")
+    enabled = bool(exporters)
+
+
+def langchain_callback():
+    """
+    Returns a LangChain callback handler that records the chat stages in
+    CHAIN_STAGES, retriever calls and LLM calls (with streamed chunk and
+    token counts) as spans.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class StageCallbackHandler(BaseCallbackHandler):
+        def __init__(self):
+            self._runs = {}
+            self._lock = threading.Lock()
+
+        def _start(self, run_id, name, **attributes):
+            with self._lock:
+                self._runs[run_id] = (name, time.perf_counter(), attributes)
+
+        def _end(self, run_id, error=None, **attributes):
+            with self._lock:
+                run = self._runs.pop(run_id, None)
+            if run:
+                name, started, recorded = run
+                record_span(name, time.perf_counter() - started, error=error, **recorded, **attributes)
+
+        def on_chain_start(self, serialized, inputs, *, run_id, name=None, **kwargs):
+            name = name or (serialized or {}).get("name")
+            if name in CHAIN_STAGES:
+                self._start(run_id, f"chat.{name}")
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+        def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+            self._start(run_id, "chat.retriever")
+
+        def on_retriever_end(self, documents, *, run_id, **kwargs):
+            self._end(run_id, documents=len(documents))
+
+        def on_retriever_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            model = ((kwargs.get("invocation_params") or {}).get("model_name")
+                     or (kwargs.get("invocation_params") or {}).get("model") or "llm")
+            self._start(run_id, "chat.llm", model=model, streamed_chunks=0)
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(run_id, "chat.llm", streamed_chunks=0)
+
+        def on_llm_new_token(self, token, *, run_id, **kwargs):
+            with self._lock:
+                run = self._runs.get(run_id)
+                if run:
+                    run[2]["streamed_chunks"] += 1
+                    run[2].setdefault("first_token_seconds", round(time.perf_counter() - run[1], 4))
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            if not usage and response.generations and response.generations[0]:
+                message = getattr(response.generations[0][0], "message", None)
+                usage = getattr(message, "usage_metadata", None) or {}
+            self._end(run_id, **{key: value for key, value in usage.items()
+                                 if key in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens",
+                                            "total_tokens")})
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+    return StageCallbackHandler()
+
+
+configure(TELEMETRY_EXPORTERS)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of top-level modules; make them importable from tests/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    """
+    A DocumentProcessor on the local vector backend with the benchmark fakes
+    and no simulated latency. Its ledger, caches and index live in tmp_path.
+    """
+    from benchmark_fakes import DEFAULT_LATENCY
+    from benchmark_suite import make_processor
+
+    monkeypatch.chdir(tmp_path)
+    return make_processor({name: 0 for name in DEFAULT_LATENCY}, directory_path=str(tmp_path / "data"))
@@ -0,0 +1,81 @@
+import shutil
+import threading
+import time
+
+import pytest
+
+import audio_segmenter
+from audio_segmenter import AudioSegmenter, make_test_audio, plan_cut_points
+from benchmark_fakes import FeedServer
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which(audio_segmenter.FFMPEG_BINARY) is None, reason="ffmpeg not found")
+
+
+def test_cuts_move_back_to_silences_and_never_exceed_the_limit():
+    assert plan_cut_points(100, 40) == [40, 80]
+    assert plan_cut_points(100, 40, silences=[15, 38.5, 70, 79]) == [38.5, 70]
+    # A silence too far before the limit is ignored
+    assert plan_cut_points(100, 40, silences=[5], search_seconds=10) == [40, 80]
+
+
+@needs_ffmpeg
+def test_segments_cover_the_audio_in_order(tmp_path):
+    source = make_test_audio(str(tmp_path / "episode.mp3"), seconds=30)
+    segmenter = AudioSegmenter(max_segment_seconds=8)
+
+    segments = list(segmenter.segments(source, str(tmp_path / "chunks")))
+
+    assert [segment.index for segment in segments] == list(range(len(segments)))
+    assert len(segments) >= 4
+    assert all(segment.end - segment.start <= 8.5 for segment in segments)
+
+
+@needs_ffmpeg
+def test_silence_cuts_download_a_remote_episode_once(tmp_path):
+    source = make_test_audio(str(tmp_path / "episode.mp3"), seconds=30)
+    server = FeedServer([source])
+    try:
+        segmenter = AudioSegmenter(max_segment_seconds=8, split_on_silence=True)
+        output_dir = tmp_path / "chunks"
+        segments = list(segmenter.segments(f"{server.url}/episode.mp3", str(output_dir)))
+        # One request for the header probe, one for the silence pass and its copy
+        assert server.requests == 2
+    finally:
+        server.close()
+
+    # Tone runs 4s of every 5s, so cuts land in the silences around 4.5s, 9.5s, ...
+    assert all(abs(segment.start % 5 - 4.5) < 0.6 for segment in segments[1:])
+    assert not (output_dir / "source.mp3").exists()
+
+
+
+@needs_ffmpeg
+def test_ffmpeg_stays_paused_while_segments_wait(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_segmenter, "POLL_SECONDS", 0.01)
+    source = make_test_audio(str(tmp_path / "episode.mp3"), seconds=10)
+    # 80 KB of audio streamed over about 2s
+    server = FeedServer([source], bytes_per_second=40_000)
+    output_dir = tmp_path / "chunks"
+    released = threading.Event()
+    cut_while_waiting = []
+
+    def release():
+        before = len(list(output_dir.glob("chunk_*")))
+        time.sleep(0.5)
+        cut_while_waiting.append(len(list(output_dir.glob("chunk_*"))) - before)
+        released.set()
+
+    try:
+        segmenter = AudioSegmenter(max_segment_seconds=1, max_pending=2)
+        segments = []
+        for segment in segmenter.segments(f"{server.url}/episode.mp3", str(output_dir),
+                                          pending=lambda: 0 if released.is_set() else 2):
+            if not segments:
+                threading.Thread(target=release).start()
+            segments.append(segment)
+    finally:
+        server.close()
+
+    assert cut_while_waiting == [0]
+    assert len(segments) >= 9
+    assert sum(segment.end - segment.start for segment in segments) >= 9.5
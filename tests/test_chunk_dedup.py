@@ -0,0 +1,38 @@
+from chunk_dedup import ChunkDeduplicator
+
+TEXT = " ".join(f"word{n}" for n in range(60))
+OTHER = " ".join(f"other{n}" for n in range(60))
+
+
+def make_dedup(tmp_path):
+    return ChunkDeduplicator("test", path=str(tmp_path / "signatures.db"))
+
+
+def test_signatures_are_written_only_on_commit(tmp_path):
+    dedup = make_dedup(tmp_path)
+
+    assert dedup.filter("a", ["a_chunk_0"], [(TEXT, {})]) == ([0], {})
+    assert dedup.filter("b", ["b_chunk_0"], [(TEXT, {})]) == ([0], {})
+
+    dedup.discard("b")
+    assert dedup.commit("a") == []
+    assert dedup.filter("b", ["b_chunk_0"], [(TEXT, {})]) == ([], {"b_chunk_0": "a_chunk_0"})
+    assert dedup.commit("b") == []
+    assert dedup.stats()["duplicates_linked"] == 1
+
+
+def test_removing_the_kept_chunk_returns_its_duplicates(tmp_path):
+    dedup = make_dedup(tmp_path)
+    dedup.filter("a", ["a_chunk_0"], [(TEXT, {})])
+    dedup.commit("a")
+    dedup.filter("b", ["b_chunk_0"], [(TEXT, {"page": 3})])
+    dedup.commit("b")
+
+    # Source a's new version no longer holds the text b's chunk was dropped for
+    dedup.filter("a", ["a_chunk_0"], [(OTHER, {})])
+    orphans = dedup.commit("a")
+
+    assert orphans == [("b_chunk_0", "b", TEXT, {"page": 3})]
+    dedup.restored(orphans)
+    assert dedup.stats()["duplicates_linked"] == 0
+    assert dedup.filter("c", ["c_chunk_0"], [(TEXT, {})]) == ([], {"c_chunk_0": "b_chunk_0"})
@@ -0,0 +1,29 @@
+from langchain_core.documents import Document
+
+from context_packing import ContextPacker
+
+
+def documents(count, source):
+    return [Document(page_content=f"{source} passage {i} " + "filler words " * 20,
+                     metadata={"source": source, "page": i}) for i in range(count)]
+
+
+def test_stats_belong_to_each_call():
+    packer = ContextPacker(token_budget=10 ** 6)
+
+    _, small = packer.pack_with_stats(documents(2, "a.pdf"))
+    packed, large = packer.pack_with_stats(documents(5, "b.pdf"))
+
+    assert (small["chunks_in"], large["chunks_in"]) == (2, 5)
+    assert large["passages_out"] == len(packed) == 5
+    assert packer.total_tokens_saved == small["tokens_saved"] + large["tokens_saved"]
+
+
+def test_budget_limits_the_packed_tokens():
+    packer = ContextPacker(token_budget=60)
+
+    packed, stats = packer.pack_with_stats(documents(5, "a.pdf"))
+
+    assert packer.pack(documents(5, "a.pdf")) == packed
+    assert stats["tokens_out"] <= 60 < stats["tokens_in"]
+    assert stats["tokens_saved"] == stats["tokens_in"] - stats["tokens_out"]
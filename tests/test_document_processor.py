@@ -0,0 +1,12 @@
+import sqlite3
+
+import pytest
+
+
+def test_close_releases_the_sqlite_stores(processor):
+    processor.close()
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        processor.ledger.lookup(["doc"])
+    with pytest.raises(sqlite3.ProgrammingError):
+        processor.lexical.search("anything")
@@ -0,0 +1,37 @@
+import pytest
+
+from benchmark_fakes import FeedServer
+from feed_poller import FeedPoller
+
+
+@pytest.fixture
+def feed():
+    server = FeedServer([f"episode_{i}.mp3" for i in range(3)])
+    yield server
+    server.close()
+
+
+def test_validators_are_stored_when_some_entries_are_left(tmp_path, feed):
+    poller = FeedPoller("test", path=str(tmp_path / "feeds.db"))
+    update = poller.poll(feed.feed_url)
+    assert [entry["guid"] for entry in update.entries] == ["episode-0", "episode-1", "episode-2"]
+
+    poller.acknowledge(update, {"episode-0"})
+
+    # The feed answers 304, and the entries left over come from the backlog
+    again = poller.poll(feed.feed_url)
+    assert again.status == 304
+    assert [entry["guid"] for entry in again.entries] == ["episode-1", "episode-2"]
+
+
+def test_backlog_is_kept_in_order_and_emptied(tmp_path, feed):
+    poller = FeedPoller("test", path=str(tmp_path / "feeds.db"))
+    poller.acknowledge(poller.poll(feed.feed_url), set())
+    update = poller.poll(feed.feed_url)
+
+    poller.acknowledge(update, {"episode-1"})
+    assert [entry["guid"] for entry in poller.backlog(feed.feed_url)] == ["episode-0", "episode-2"]
+
+    poller.acknowledge(poller.poll(feed.feed_url), {"episode-0", "episode-2"})
+    assert poller.backlog(feed.feed_url) == []
+    assert poller.poll(feed.feed_url).entries == []
@@ -0,0 +1,46 @@
+from langchain_core.documents import Document
+
+from hybrid_retrieval import DENSE_ONLY_K, HybridRetriever
+from lexical_index import LexicalIndex
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.searches = []
+
+    def similarity_search(self, query, k):
+        self.searches.append(k)
+        return [Document(page_content="dense hit", id="dense")]
+
+
+class FakeIndex:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def describe_index_stats(self):
+        return {"total_vector_count": self.vectors}
+
+
+def test_doc_count_follows_other_connections(tmp_path):
+    reader = LexicalIndex("test", directory=str(tmp_path))
+    writer = LexicalIndex("test", directory=str(tmp_path))
+
+    writer.add(["a_chunk_0"], ["zebra migration patterns"])
+
+    assert len(reader) == 1
+    assert reader.search("zebra")[0][0].id == "a_chunk_0"
+
+
+def test_retrieval_stays_dense_until_lexical_index_covers_vectors(tmp_path):
+    lexical = LexicalIndex("test", directory=str(tmp_path))
+    lexical.add(["a_chunk_0"], ["zebra migration patterns"])
+    index = FakeIndex(vectors=100)
+    store = FakeVectorStore()
+    retriever = HybridRetriever(vector_store=store, lexical=lexical, index=index)
+
+    assert [document.id for document in retriever.search("zebra")] == ["dense"]
+    assert store.searches == [DENSE_ONLY_K]
+
+    # A backfill changes the lexical index's size, which triggers a re-check
+    lexical.add([f"b_chunk_{i}" for i in range(99)], ["unrelated text"] * 99)
+    assert [document.id for document in retriever.search("zebra")] == ["a_chunk_0"]
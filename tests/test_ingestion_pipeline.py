@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_fakes import FakeEmbeddings
+from ingestion_pipeline import IngestionPipeline
+
+CORPUS = {"a": 7, "empty": 0, "b": 25}
+
+
+class MemoryIndex:
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors):
+        self.vectors.update({vector_id: metadata for vector_id, _, metadata in vectors})
+
+
+class PoisonEmbeddings(FakeEmbeddings):
+    def embed_documents(self, texts):
+        if any("poison" in text for text in texts):
+            raise RuntimeError("rejected")
+        return super().embed_documents(texts)
+
+
+def parse(path):
+    if path == "broken":
+        raise ValueError("not a PDF")
+    if path == "poisoned":
+        return path, [("fine text", {}), ("poison text", {})]
+    return path, [(f"{path} chunk {i}", {"source": path}) for i in range(CORPUS[path])]
+
+
+def run(paths, embeddings=None, **options):
+    index, completed = MemoryIndex(), {}
+    embeddings = embeddings or FakeEmbeddings(dimensions=8, latency={"embed_request": 0, "embed_per_text": 0})
+    options = {"parse_batch_size": 4, "embed_batch_size": 5, "upsert_batch_size": 3, **options}
+    pipeline = IngestionPipeline(embeddings, index, parse_fn=parse, parse_executor_cls=ThreadPoolExecutor, **options)
+    report = pipeline.run(paths, on_source_complete=lambda source_id, ids: completed.setdefault(source_id, ids))
+    return report, completed, index
+
+
+def test_every_chunk_is_counted_once_and_sources_complete_in_order():
+    report, completed, index = run(list(CORPUS))
+
+    assert completed == {source: [f"{source}_chunk_{i}" for i in range(count)] for source, count in CORPUS.items()}
+    assert report["parse"]["items"] == 3
+    assert report["embed"]["items"] == report["upsert"]["items"] == len(index.vectors) == 32
+    assert index.vectors["b_chunk_24"] == {"source": "b", "text": "b chunk 24"}
+    assert report["failed_sources"] == []
+
+
+def test_failed_sources_are_reported_and_never_completed():
+    embeddings = PoisonEmbeddings(dimensions=8, latency={"embed_request": 0, "embed_per_text": 0})
+
+    # One chunk per request, so only the poisoned source's batch fails
+    report, completed, _ = run(["a", "broken", "poisoned"], embeddings, embed_batch_size=1)
+
+    assert report["failed_sources"] == ["broken", "poisoned"]
+    assert list(completed) == ["a"]
+    assert (report["parse"]["errors"], report["embed"]["errors"]) == (1, 1)
+
+
+def test_filtered_chunks_leave_gaps_in_the_completed_ids():
+    calls = []
+
+    def drop_odd(source_id, ids, chunks, append):
+        calls.append((source_id, append))
+        kept = [i for i, chunk_id in enumerate(ids) if int(chunk_id.rsplit("_", 1)[1]) % 2 == 0]
+        return [ids[i] for i in kept], [chunks[i] for i in kept]
+
+    report, completed, index = run(["a"], chunk_filter=drop_odd)
+
+    assert completed["a"] == ["a_chunk_0", "a_chunk_2", "a_chunk_4", "a_chunk_6"]
+    assert sorted(index.vectors) == completed["a"]
+    assert calls == [("a", False), ("a", True)]
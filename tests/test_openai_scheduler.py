@@ -0,0 +1,31 @@
+from benchmark_fakes import FakeEmbeddings
+from openai_scheduler import TokenCappedEmbeddings, token_capped_batches
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_batches_respect_token_and_input_caps():
+    texts = ["a b c"] * 10
+
+    assert list(token_capped_batches(texts, count_words, max_tokens=7)) == [(i, i + 2) for i in range(0, 10, 2)]
+    assert list(token_capped_batches(texts, count_words, max_tokens=100, max_inputs=4)) == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_oversized_text_gets_its_own_batch():
+    texts = ["a", "word " * 50, "b"]
+
+    assert list(token_capped_batches(texts, count_words, max_tokens=10)) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_capped_embeddings_split_requests_and_keep_order():
+    fake = FakeEmbeddings(dimensions=8, latency={"embed_request": 0, "embed_per_text": 0})
+    embeddings = TokenCappedEmbeddings(fake, max_tokens=40)
+    texts = [f"chunk {n} " * 5 for n in range(10)]
+
+    vectors = embeddings.embed_documents(texts)
+
+    assert fake.requests > 1
+    assert vectors == fake.embed_documents(texts)
+    assert (embeddings.model, embeddings.dimensions) == ("fake-embedding", 8)
@@ -0,0 +1,10 @@
+def test_indexed_episode_drops_its_cached_transcripts(processor):
+    timed_segments = [{"start": 0.0, "end": 5.0, "text": "Welcome to the show."},
+                      {"start": 5.0, "end": 9.0, "text": "Today we talk about retrieval."}]
+    processor.transcripts.put("episode-1", 0, "hash", timed_segments)
+    processor.transcripts.put("episode-2", 0, "hash", timed_segments)
+
+    processor.add_podcast_to_index("episode-1", timed_segments, title="Episode 1")
+
+    assert processor.ledger.lookup(["episode-1"])["episode-1"]["chunk_ids"] == ["episode-1_chunk_0"]
+    assert processor.transcripts.stats()["episodes"] == 1
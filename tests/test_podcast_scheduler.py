@@ -0,0 +1,30 @@
+import podcast_scheduler
+from podcast_scheduler import PodcastScheduler
+
+
+def transcribe(podcast, output_dir, submit, progress):
+    if podcast == "broken":
+        raise RuntimeError("no audio")
+    return f"transcript of {podcast}"
+
+
+def terminal_events(scheduler, podcasts):
+    return {podcast: status for podcast, status, _ in scheduler.run(podcasts) if status in ("done", "failed")}
+
+
+def test_every_episode_ends_with_done_or_failed(tmp_path):
+    indexed = []
+    scheduler = PodcastScheduler(transcribe, lambda podcast, transcript: indexed.append(transcript), str(tmp_path))
+
+    assert terminal_events(scheduler, ["one", "broken", "two"]) == {"one": "done", "broken": "failed", "two": "done"}
+    assert sorted(indexed) == ["transcript of one", "transcript of two"]
+
+
+def test_scratch_directory_failure_fails_the_episode(tmp_path, monkeypatch):
+    def no_space(**kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(podcast_scheduler.tempfile, "mkdtemp", no_space)
+    scheduler = PodcastScheduler(transcribe, lambda podcast, transcript: None, str(tmp_path))
+
+    assert terminal_events(scheduler, ["one", "two"]) == {"one": "failed", "two": "failed"}
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+from langchain_core.documents import Document
+
+from rag_server import RagServer
+
+
+class FakeChain:
+    def __init__(self, tokens=("Hello", " there"), error=None, delay=0):
+        self.tokens = tokens
+        self.error = error
+        self.delay = delay
+
+    async def astream(self, inputs, config=None):
+        await asyncio.sleep(self.delay)
+        yield {"context": [Document(page_content="text", metadata={"source": "doc.pdf"})]}
+        for token in self.tokens:
+            if self.error:
+                raise self.error
+            yield {"answer": token}
+
+    async def ainvoke(self, inputs, config=None):
+        raise self.error or NotImplementedError
+
+
+async def send(port, data):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), body.decode("utf-8")
+
+
+async def request(port, payload, method="POST", path="/chat"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    return await send(port, f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+
+
+def serve(client, chain=None, requested=None, **server_options):
+    """
+    Runs `client(port)` against a RagServer whose chains are `chain` (a
+    FakeChain by default); the index names it builds chains for are
+    appended to `requested`.
+    """
+    def chain_for_index(index_name):
+        if requested is not None:
+            requested.append(index_name)
+        return chain or FakeChain()
+
+    async def run():
+        server = RagServer(chain_for_index=chain_for_index, default_index="test", **server_options)
+        async with await server.start("127.0.0.1", 0):
+            return await client(server.port)
+
+    return asyncio.run(run())
+
+
+def serve_request(payload, chain=None, **server_options):
+    requested = []
+    status, body = serve(lambda port: request(port, payload), chain, requested, **server_options)
+    return status, body, requested
+
+
+def events(body):
+    return [block.split("\n")[0].removeprefix("event: ") for block in body.strip().split("\n\n")]
+
+
+def test_unknown_index_is_rejected_before_building_a_chain():
+    status, body, requested = serve_request({"input": "hi", "index": "../../etc"})
+
+    assert status == 400
+    assert json.loads(body) == {"error": "Unknown 'index'"}
+    assert requested == []
+
+
+def test_listed_index_streams_a_turn():
+    status, body, requested = serve_request({"input": "hi", "index": "other"}, indexes=["other"])
+
+    assert status == 200
+    assert requested == ["other"]
+    assert events(body) == ["session", "sources", "token", "token", "done"]
+
+
+def test_failed_turn_ends_the_stream_with_an_error_event():
+    status, body, _ = serve_request({"input": "hi"}, chain=FakeChain(error=RuntimeError("boom")))
+
+    assert status == 200
+    assert events(body) == ["session", "sources", "error"]
+
+
+def test_malformed_requests_get_client_errors():
+    async def client(port):
+        return [status for status, _ in [
+            await request(port, b"not json"),
+            await request(port, {"input": "  "}),
+            await request(port, {"input": "hi", "session_id": "x" * 500}),
+            await request(port, b"{}", method="GET"),
+            await request(port, b"", path="/nowhere"),
+            await request(port, b"x" * (70 * 1024)),
+        ]]
+
+    assert serve(client) == [400, 400, 400, 405, 404, 413]
+
+
+def test_invalid_content_length_is_a_400():
+    async def client(port):
+        return [await send(port, f"POST /chat HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+                for length in ("abc", "-5")]
+
+    assert serve(client) == [(400, json.dumps({"error": "Invalid Content-Length"}))] * 2
+
+
+def test_full_queue_is_answered_503():
+    async def client(port):
+        first = asyncio.create_task(request(port, {"input": "hi", "session_id": "s"}))
+        await asyncio.sleep(0.1)
+        second = await request(port, {"input": "again", "session_id": "s"})
+        return (await first)[0], second
+
+    first, (status, body) = serve(client, FakeChain(delay=0.3), max_queue=0)
+
+    assert (first, status) == (200, 503)
+    assert json.loads(body) == {"error": "Too many queued requests"}
+
+
+def test_failed_non_streaming_turn_is_a_500():
+    async def client(port):
+        return await request(port, {"input": "hi", "stream": False})
+
+    status, body = serve(client, FakeChain(error=RuntimeError("boom")))
+
+    assert status == 500
+    assert json.loads(body) == {"error": "Error generating response."}
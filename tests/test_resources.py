@@ -0,0 +1,46 @@
+import threading
+
+from resources import ResourceRegistry
+
+
+class FakeProcessor:
+    def __init__(self, name):
+        self.name = name
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def test_evicted_processor_is_closed():
+    registry = ResourceRegistry(processor_factory=FakeProcessor, max_indexes=1, close_grace=0)
+    first = registry.processor("a")
+
+    registry.processor("b")
+
+    assert registry.indexes() == ["b"]
+    assert first.closed.wait(1)
+
+
+def test_index_being_built_is_not_evicted():
+    started, release = threading.Event(), threading.Event()
+
+    def slow_factory(name):
+        if name == "a":
+            started.set()
+            release.wait(5)
+        return FakeProcessor(name)
+
+    registry = ResourceRegistry(processor_factory=slow_factory, max_indexes=1, close_grace=0)
+    builder = threading.Thread(target=registry.processor, args=("a",))
+    builder.start()
+    started.wait(5)
+
+    registry.processor("b")
+    assert sorted(registry.indexes()) == ["a", "b"]
+
+    release.set()
+    builder.join()
+    # Once built, "a" can be evicted like any other index
+    registry.processor("b")
+    assert registry.indexes() == ["b"]
@@ -0,0 +1,43 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from session_store import TRUNCATION_MARKER, HistoryWindow
+
+
+def test_long_last_answer_survives_windowing():
+    window = HistoryWindow()
+    messages = [HumanMessage("q"), AIMessage("word " * 4500)]
+
+    kept = window(messages)
+
+    assert [type(message) for message in kept] == [HumanMessage, AIMessage]
+    assert kept[1].content == messages[1].content
+
+
+def test_oversized_last_exchange_is_truncated_not_dropped():
+    window = HistoryWindow(max_tokens=500)
+    messages = [HumanMessage("earlier"), AIMessage("earlier answer"),
+                HumanMessage("follow-up"), AIMessage("word " * 4500)]
+
+    kept = window(messages)
+
+    assert kept[-2].content == "follow-up"
+    assert kept[-1].content.endswith(TRUNCATION_MARKER)
+    assert sum(window.count_tokens(str(message.content)) for message in kept) <= 500
+
+
+def test_earlier_turns_kept_while_they_fit():
+    window = HistoryWindow(max_tokens=50)
+    messages = [HumanMessage("first " * 40), AIMessage("a"), HumanMessage("second"), AIMessage("b")]
+
+    assert [message.content for message in window(messages)] == ["second", "b"]
+    assert window([]) == []
+
+
+def test_tiny_budget_terminates():
+    window = HistoryWindow(max_tokens=1)
+    messages = [HumanMessage("c " * 50), AIMessage("d " * 80)]
+
+    kept = window(messages)
+
+    assert [type(message) for message in kept] == [HumanMessage, AIMessage]
+    assert all(message.content.endswith(TRUNCATION_MARKER) for message in kept)
@@ -0,0 +1,114 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "./transcript_cache.db")
+
+
+class TranscriptStore:
+    """
+    On-disk cache of Whisper transcripts for individual audio segments.
+
+    Entries are keyed by (episode ID, segment index, sha256 of the segment
+    file). Stream-copy segmenting cuts the same bytes from the same source,
+    so after a crash the episode is segmented again and only segments
+    without a cached transcript are sent to Whisper. A segment whose audio
+    changed gets a new hash and is transcribed again.
+
+    Each entry keeps Whisper's timed segments, already offset to the
+    episode's timeline, as a list of {"start", "end", "text"} dicts.
+    """
+
+    def __init__(self, path=TRANSCRIPT_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS segments (
+                episode_id TEXT NOT NULL,
+                segment_index INTEGER NOT NULL,
+                audio_hash TEXT NOT NULL,
+                timed_text TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (episode_id, segment_index, audio_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, episode_id, segment_index, audio_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT timed_text FROM segments WHERE episode_id = ? AND segment_index = ? AND audio_hash = ?",
+                (episode_id, segment_index, audio_hash),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, episode_id, segment_index, audio_hash, timed_segments):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO segments (episode_id, segment_index, audio_hash, timed_text, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (episode_id, segment_index, audio_hash, json.dumps(timed_segments), time.time()),
+            )
+            self._conn.commit()
+
+    def discard(self, episode_id):
+        """
+        Drops every cached segment of an episode.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM segments WHERE episode_id = ?", (episode_id,))
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            episodes, segments = self._conn.execute(
+                "SELECT COUNT(DISTINCT episode_id), COUNT(*) FROM segments").fetchone()
+        return {"episodes": episodes, "segments": segments, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def join_timed_segments(timed_segments):
+    """
+    Joins timed segments into one transcript. Returns the text and the
+    character offset at which each segment starts in it.
+    """
+    parts, offsets, position = [], [], 0
+    for segment in timed_segments:
+        text = segment["text"].strip()
+        if not text:
+            continue
+        if parts:
+            position += 1
+        offsets.append(position)
+        parts.append(text)
+        position += len(text)
+    return " ".join(parts), offsets
+
+
+def time_range_for_span(timed_segments, offsets, start, length):
+    """
+    Returns the (start, end) time in seconds covered by characters
+    [start, start + length) of a transcript built by join_timed_segments.
+    """
+    kept = [segment for segment in timed_segments if segment["text"].strip()]
+    if not kept:
+        return None, None
+    first = max(bisect.bisect_right(offsets, start) - 1, 0)
+    last = max(bisect.bisect_right(offsets, start + max(length, 1) - 1) - 1, 0)
+    return kept[first]["start"], kept[last]["end"]
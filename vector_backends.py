@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "./local_index")
+# Maps index names to the vector index that serves them, e.g. after a migration
+INDEX_ALIASES_PATH = os.getenv("INDEX_ALIASES_PATH", "./index_aliases.json")
+INITIAL_CAPACITY = 1024
+FETCH_BATCH_SIZE = 100
+
+_aliases = {}  # path -> (mtime, {name: vector index name})
+_aliases_lock = threading.Lock()
+
+
+def resolve_index_name(name, path=INDEX_ALIASES_PATH):
+    """
+    Returns the vector index behind an index name: its alias if one has been
+    set, otherwise the name itself. The alias file is re-read only when it
+    changes, so this is cheap enough to call per request.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return name
+    with _aliases_lock:
+        if _aliases.get(path, (None,))[0] != mtime:
+            with open(path, encoding="utf-8") as fh:
+                _aliases[path] = (mtime, json.load(fh))
+        return _aliases[path][1].get(name, name)
+
+
+def set_index_alias(name, target, path=INDEX_ALIASES_PATH):
+    """
+    Points `name` at the vector index `target`. The alias file is replaced
+    in one rename, so readers see either the old or the new mapping.
+    """
+    with _aliases_lock:
+        aliases = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as fh:
+                aliases = json.load(fh)
+        aliases[name] = target
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as fh:
+            json.dump(aliases, fh, indent=2)
+        os.replace(temp_path, path)
+
+
+def local_index_dimension(name, directory=LOCAL_INDEX_DIR):
+    """
+    Returns the dimension a local index was created with, or None if it does not exist.
+    """
+    path = os.path.join(directory, name, "meta.sqlite")
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key = 'dimension'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return int(row[0]) if row else None
+
+
+class LocalIndex:
+    """
+    On-disk vector index with the subset of the Pinecone `Index` interface the
+    app uses: upsert, fetch, delete, list, query and describe_index_stats.
+
+    Unit-normalised vectors live in a memory-mapped float32 matrix, so opening
+    an index maps the file instead of reading it and queries are a single
+    matrix-vector product. IDs, metadata and free rows are kept in SQLite.
+    Deleted rows are reused by later upserts.
+    """
+
+    def __init__(self, name, dimension, directory=LOCAL_INDEX_DIR):
+        self.name = name
+        self.dimension = dimension
+        self.path = os.path.join(directory, name)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.path, "meta.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, row INTEGER UNIQUE NOT NULL, metadata TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        stored_dimension = self._conn.execute(
+            "SELECT value FROM settings WHERE key = 'dimension'").fetchone()
+        if stored_dimension and int(stored_dimension[0]) != dimension:
+            raise ValueError(f"Local index '{name}' has dimension {stored_dimension[0]}, not {dimension}.")
+        self._conn.execute("INSERT OR IGNORE INTO settings VALUES ('dimension', ?)", (str(dimension),))
+        self._conn.commit()
+
+        self._rows = dict(self._conn.execute("SELECT id, row FROM vectors"))
+        self._ids_by_row = {row: vector_id for vector_id, row in self._rows.items()}
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._alive_path = os.path.join(self.path, "alive.u8")
+        capacity = INITIAL_CAPACITY
+        if os.path.exists(self._vectors_path):
+            capacity = os.path.getsize(self._vectors_path) // (4 * dimension)
+        self._open(capacity)
+        self._next_row = max(self._ids_by_row, default=-1) + 1
+        self._free_rows = sorted(set(range(self._next_row)) - set(self._ids_by_row), reverse=True)
+
+    def _open(self, capacity):
+        for path, itemsize in ((self._vectors_path, 4 * self.dimension), (self._alive_path, 1)):
+            with open(path, "ab") as fh:
+                if fh.tell() < capacity * itemsize:
+                    fh.truncate(capacity * itemsize)
+        self._capacity = capacity
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                  shape=(capacity, self.dimension))
+        self._alive = np.memmap(self._alive_path, dtype=np.uint8, mode="r+", shape=(capacity,))
+
+    def _allocate_row(self):
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self._next_row >= self._capacity:
+            self._vectors.flush()
+            self._alive.flush()
+            del self._vectors, self._alive
+            self._open(self._capacity * 2)
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def upsert(self, vectors, namespace=None, **kwargs):
+        """
+        Accepts (id, values, metadata) tuples or Pinecone-style dicts.
+        """
+        records = []
+        for vector in vectors:
+            if isinstance(vector, dict):
+                records.append((vector["id"], vector["values"], vector.get("metadata") or {}))
+            else:
+                vector_id, values, *rest = vector
+                records.append((vector_id, values, rest[0] if rest else {}))
+        if not records:
+            return {"upserted_count": 0}
+
+        matrix = np.asarray([values for _, values, _ in records], dtype=np.float32)
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dimension}.")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            rows = []
+            for vector_id, _, _ in records:
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = self._allocate_row()
+                    self._rows[vector_id] = row
+                    self._ids_by_row[row] = vector_id
+                rows.append(row)
+            self._vectors[rows] = matrix
+            self._alive[rows] = 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, row, metadata) VALUES (?, ?, ?)",
+                [(vector_id, row, json.dumps(metadata)) for (vector_id, _, metadata), row in zip(records, rows)],
+            )
+            self._conn.commit()
+            self._vectors.flush()
+            self._alive.flush()
+        return {"upserted_count": len(records)}
+
+    def fetch(self, ids, namespace=None):
+        with self._lock:
+            found = {}
+            for vector_id in ids:
+                row = self._rows.get(vector_id)
+                if row is None:
+                    continue
+                metadata = self._conn.execute(
+                    "SELECT metadata FROM vectors WHERE id = ?", (vector_id,)).fetchone()[0]
+                found[vector_id] = {
+                    "id": vector_id,
+                    "values": self._vectors[row].tolist(),
+                    "metadata": json.loads(metadata),
+                }
+        return {"vectors": found, "namespace": namespace or ""}
+
+    def delete(self, ids=None, delete_all=False, namespace=None, **kwargs):
+        with self._lock:
+            if delete_all:
+                ids = list(self._rows)
+            rows = [self._rows.pop(vector_id) for vector_id in ids or [] if vector_id in self._rows]
+            for row in rows:
+                del self._ids_by_row[row]
+                self._free_rows.append(row)
+            if rows:
+                self._alive[rows] = 0
+                self._alive.flush()
+            self._conn.executemany("DELETE FROM vectors WHERE id = ?", [(vector_id,) for vector_id in ids or []])
+            self._conn.commit()
+        return {}
+
+    def list(self, prefix=None, limit=FETCH_BATCH_SIZE, namespace=None):
+        """
+        Yields pages of IDs, like the Pinecone serverless `list` generator.
+        """
+        with self._lock:
+            ids = sorted(vector_id for vector_id in self._rows if not prefix or vector_id.startswith(prefix))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def query(self, vector, top_k=4, include_metadata=True, include_values=False, filter=None, namespace=None, **kwargs):
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            used = self._next_row
+            if not used:
+                return {"matches": []}
+            scores = self._vectors[:used] @ query
+            scores[self._alive[:used] == 0] = -np.inf
+            top_k = min(top_k, used)
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            best = best[np.argsort(-scores[best])]
+            matches = []
+            for row in best:
+                if scores[row] == -np.inf:
+                    break
+                vector_id = self._ids_by_row[int(row)]
+                match = {"id": vector_id, "score": float(scores[row])}
+                if include_metadata:
+                    match["metadata"] = json.loads(self._conn.execute(
+                        "SELECT metadata FROM vectors WHERE id = ?", (vector_id,)).fetchone()[0])
+                if include_values:
+                    match["values"] = self._vectors[row].tolist()
+                matches.append(match)
+        return {"matches": matches}
+
+    def describe_index_stats(self):
+        with self._lock:
+            return {"dimension": self.dimension, "total_vector_count": len(self._rows)}
+
+
+class LocalVectorStore(VectorStore):
+    """
+    LangChain vector store over a LocalIndex, storing chunk text under
+    `text_key` in the metadata the same way PineconeVectorStore does.
+    """
+
+    def __init__(self, index, embedding, text_key="text"):
+        self._index = index
+        self._embedding = embedding
+        self._text_key = text_key
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(i) for i in range(len(texts))]
+        vectors = self._embedding.embed_documents(texts)
+        self._index.upsert(vectors=[
+            (vector_id, vector, {**metadata, self._text_key: text})
+            for vector_id, vector, metadata, text in zip(ids, vectors, metadatas, texts)
+        ])
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        self._index.delete(ids=ids)
+        return True
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        documents = []
+        for match in self._index.query(embedding, top_k=k, include_metadata=True)["matches"]:
+            metadata = dict(match["metadata"])
+            text = metadata.pop(self._text_key, "")
+            documents.append((Document(page_content=text, metadata=metadata, id=match["id"]), match["score"]))
+        return documents
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k=k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [document for document, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, index_name="local", **kwargs):
+        dimension = len(embedding.embed_query("dimension probe"))
+        store = cls(LocalIndex(index_name, dimension), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def load_local_vector_store(index_name, embeddings, dimension):
+    """
+    Returns (index, vector_store) for a local index, creating it if needed.
+    """
+    index = LocalIndex(index_name, dimension)
+    print(f"Local vector store '{index_name}' loaded with {len(index._rows)} vectors.")
+    return index, LocalVectorStore(index, embeddings)
+
+
+def copy_index(source_index, target_index, batch_size=FETCH_BATCH_SIZE):
+    """
+    Copies every vector, with its metadata, from one index to another.
+    Works between any two objects with the Pinecone list/fetch/upsert surface.
+    """
+    copied = 0
+    for page in source_index.list(limit=batch_size):
+        for start in range(0, len(page), batch_size):
+            fetched = source_index.fetch(ids=page[start:start + batch_size])["vectors"]
+            target_index.upsert(vectors=[
+                (vector_id, vector["values"], vector.get("metadata") or {})
+                for vector_id, vector in fetched.items()
+            ])
+            copied += len(fetched)
+        print(f"Copied {copied} vectors.")
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy vectors between a Pinecone index and a local index.")
+    parser.add_argument("direction", choices=["import-pinecone", "export-pinecone"],
+                        help="import-pinecone copies Pinecone -> local, export-pinecone copies local -> Pinecone.")
+    parser.add_argument("--index", required=True, help="Index name (used for both sides).")
+    args = parser.parse_args()
+
+    import streamlit as st
+    from pinecone import Pinecone
+
+    pinecone_index = Pinecone(api_key=st.secrets['PINECONE_API_KEY']).Index(args.index)
+    dimension = pinecone_index.describe_index_stats()["dimension"]
+    local_index = LocalIndex(args.index, dimension)
+    if args.direction == "import-pinecone":
+        copy_index(pinecone_index, local_index)
+    else:
+        copy_index(local_index, pinecone_index)